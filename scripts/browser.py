@@ -22,29 +22,27 @@ R = np.array([[np.cos(ANGLE), -np.sin(ANGLE)], [np.sin(ANGLE), np.cos(ANGLE)]])
 
 
 def get_stage_coords(fns, return_ims=False):
-    coords = []
-    has_crystals = []
-    t = tqdm(fns, desc='Parsing files')
-
     imgs = []
 
-    for fn in t:
-        img, h = read_image(fn)
-        try:
-            dx, dy = h['exp_hole_offset']
-            cx, cy = h['exp_hole_center']
-        except KeyError:
-            dx, dy = h['exp_scan_offset']
-            cx, cy = h['exp_scan_center']
-        coords.append((cx + dx, cy + dy))
-
-        has_crystals.append(len(h['exp_crystal_coords']) > 0)
-        if return_ims:
+    if return_ims:
+        for fn in tqdm(fns, desc='Reading images'):
+            img, h = read_image(fn)
             img = ndimage.zoom(img, 0.0969)
             imgs.append(img)
-    # convert to um
 
-    return np.array(coords) / 1000, np.array(has_crystals), imgs
+    # read the headers from the metadata table instead of opening every image
+    df = read_metadata(fns)
+
+    if 'exp_hole_offset' in df:
+        offset, center = df['exp_hole_offset'], df['exp_hole_center']
+    else:
+        offset, center = df['exp_scan_offset'], df['exp_scan_center']
+    coords = np.array(center.tolist()) + np.array(offset.tolist())
+
+    has_crystals = np.array([len(coords) > 0 for coords in df['exp_crystal_coords']])
+
+    # convert to um
+    return coords / 1000, has_crystals, imgs
 
 
 def lst2colormap(lst):
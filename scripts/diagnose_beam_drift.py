@@ -9,7 +9,7 @@ import numpy as np
 from tqdm.auto import tqdm
 
 from instamatic.formats import adscimage
-from instamatic.tools import find_beam_center, find_subranges
+from instamatic.tools import find_beam_centers, find_subranges
 
 
 def insert_nan(arr, interval=10):
@@ -103,8 +103,7 @@ if __name__ == '__main__':
         print(len(fns))
 
         imgs = (adscimage.read_adsc(fn)[0] for fn in tqdm(fns))
-        centers = (find_beam_center(img, 10, m=50, kind=3) for img in imgs)
-        xy = np.array(list(centers))
+        xy = find_beam_centers(list(imgs), sigma=10)
 
         np.savetxt(Path(fns[0]).parents[0] / 'beam_centers.txt', xy, fmt='%10.4f')
 
@@ -32,6 +32,12 @@ class AcquireAtItems:
         sequence _after_ the main acquisition function.
     backlash: bool
         Move the stage with backlash correction.
+    optimize_route: bool
+        Visit the items in the order that minimizes the stage travel, instead of the order
+        in which they are given (see `instamatic.route.optimize_route`).
+    keep_index: bool
+        When the route is optimized, keep the index of the item in `nav_items` as
+        `ctrl.current_i`, so that output files are named after the original order.
 
     Returns
     -------
@@ -48,6 +54,8 @@ class AcquireAtItems:
         post_acquire=None,
         every_n: dict = {},
         backlash: bool = True,
+        optimize_route: bool = False,
+        keep_index: bool = True,
     ):
         super().__init__()
 
@@ -74,6 +82,9 @@ class AcquireAtItems:
             print('Post-acquire:', ', '.join([func.__name__ for func in self._post_acquire]))
 
         self.backlash = backlash
+        self.optimize_route = optimize_route
+        self.keep_index = keep_index
+        self.order = np.arange(len(nav_items))
 
     # blank placeholders
     _acquire = ()
@@ -111,8 +122,10 @@ class AcquireAtItems:
                 # print(f" >> {interval}: {func.__name__}")
                 func(ctrl)
 
-    def move_to_item(self, item):
-        """Move the stage to the stage coordinates given by the NavItem."""
+    @staticmethod
+    def get_coordinates(item) -> tuple:
+        """Return the (x, y, z) stage coordinates (nm) of the NavItem or
+        coordinate tuple, z is None if not defined."""
         try:
             x = item.stage_x * 1000  # um -> nm
             y = item.stage_y * 1000  # um -> nm
@@ -128,15 +141,34 @@ class AcquireAtItems:
                     f'Coordinate must have 2 (x, y) or 3 (x, y, z) elements: {item}'
                 )
 
-        if z is not None:
-            self.ctrl.stage.set(z=z)
+        return x, y, z
+
+    def plan_route(self) -> np.ndarray:
+        """Order the items to minimize the stage travel from the current
+        stage position, and print the expected savings."""
+        from instamatic.route import optimize_route, print_route_report, route_report
+
+        # undefined z (None) becomes nan
+        coords = np.array([self.get_coordinates(item) for item in self.nav_items], dtype=float)
+        if np.isnan(coords[:, 2]).all():
+            coords = coords[:, :2]
+
+        kwargs = {'backlash_step': 10000 if self.backlash else 0.0}
+        start = self.ctrl.stage.xy
+
+        order = optimize_route(coords, start=start, **kwargs)
+        print_route_report(route_report(coords, order, start=start, **kwargs))
+        return order
 
+    def move_to_item(self, item):
+        """Move the stage to the stage coordinates given by the NavItem."""
+        x, y, z = self.get_coordinates(item)
+
+        # z is moved together with x/y
         if self.backlash:
-            set_xy = self.ctrl.stage.set_xy_with_backlash_correction
+            self.ctrl.stage.set_xy_with_backlash_correction(x=x, y=y, z=z)
         else:
-            set_xy = self.ctrl.stage.set
-
-        set_xy(x=x, y=y)
+            self.ctrl.stage.move_path([{'x': x, 'y': y, 'z': z}])
 
     def start(self, start_index: int = 0):
         """Start serial acquisition protocol.
@@ -144,13 +176,18 @@ class AcquireAtItems:
         Parameters
         ----------
         start_index : int
-            Start acquisition from this item.
+            Start acquisition from this item (position along the route if it is optimized).
         """
         import msvcrt
         import time
 
         ctrl = self.ctrl
-        nav_items = self.nav_items[start_index:]
+
+        if self.optimize_route:
+            self.order = self.plan_route()
+
+        order = self.order[start_index:]
+        nav_items = [self.nav_items[index] for index in order]
 
         ntot = len(nav_items)
 
@@ -168,7 +205,7 @@ class AcquireAtItems:
             try:
                 i += start_index
                 ctrl.current_item = item
-                ctrl.current_i = i
+                ctrl.current_i = int(order[i - start_index]) if self.keep_index else i
 
                 self.move_to_item(item)
                 self.acquire(ctrl, i=i)
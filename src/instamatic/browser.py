@@ -12,15 +12,22 @@ from instamatic.formats import read_tiff
 
 
 class Browser:
-    """Simple Navigator class."""
+    """Simple Navigator class.
 
-    def __init__(self, montage):
+    With a `TilePyramid` (see `InstamaticMontage.to_pyramid`), the global
+    map only loads the tiles in view, at the resolution needed to display
+    them, instead of the full stitched image.
+    """
+
+    def __init__(self, montage, pyramid=None):
         super().__init__()
         self.montage = montage
+        self.pyramid = pyramid
         self.mmap = None
-        self.imagecoords = montage.feature_coords_image
-        self.stagecoords = montage.feature_coords_stage
-        self.stitched = montage.stitched
+        self.imagecoords = getattr(montage, 'feature_coords_image', np.empty((0, 2)))
+        self.stagecoords = getattr(montage, 'feature_coords_stage', np.empty((0, 2)))
+        self.stitched = None if pyramid else montage.stitched
+        self._rendering = False
 
     def set_images(self, mmm: str = 'mmm.mrc'):
         """Set the path to the image data (medium mag).
@@ -89,17 +96,28 @@ class Browser:
 
     def setup_l1(self, cmap='gray', vmax=5000):
         """Setup the left global map panel."""
-        # FIXME: How to transform the coordinates instead?
-        self.stitched = np.flipud(np.rot90(self.stitched))
         self.blank = np.arange(100).reshape(10, 10)
 
         px1_x, px1_y = self.imagecoords.T
-        self.im1 = self.ax1.imshow(self.stitched, vmax=vmax, cmap=cmap)
+        if self.pyramid:
+            # the same orientation as the stitched image below
+            img, box = self.pyramid.render(shape=self._display_shape())
+            self.im1 = self.ax1.imshow(img.T, vmax=vmax, cmap=cmap, extent=self._extent(box))
+        else:
+            # FIXME: How to transform the coordinates instead?
+            self.stitched = np.flipud(np.rot90(self.stitched))
+            self.im1 = self.ax1.imshow(self.stitched, vmax=vmax, cmap=cmap)
         # FIXME: Where does the 512 come from?
         self.data1 = self.ax1.scatter(px1_x, px1_y + 512, marker='+', color='r', picker=8)
         self.ax1.set_title('Global map')
         self.ax1.axis('off')
 
+        if self.pyramid:
+            # load the tiles in view when zooming or panning
+            self.ax1.set_autoscale_on(False)
+            self.ax1.callbacks.connect('xlim_changed', self.update_ax1)
+            self.ax1.callbacks.connect('ylim_changed', self.update_ax1)
+
     def setup_l2(self, cmap='gray', vmax=5000):
         """Setup the middle medium mag panel."""
         self.im2 = self.ax2.imshow(self.mmap.data[0], vmax=vmax, cmap=cmap)
@@ -149,8 +167,35 @@ class Browser:
         coord = marker.stage_xy
         self.coord = coord
 
-    def update_ax1(self):
-        pass
+    @staticmethod
+    def _extent(box) -> tuple:
+        """Extent of a rendered (and transposed) pyramid region for
+        `imshow`."""
+        r0, c0, r1, c1 = box
+        return (r0, r1, c1, c0)
+
+    def _display_shape(self) -> tuple:
+        """Size of the global map on the screen (pixels)."""
+        bbox = self.ax1.get_window_extent()
+        return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+    def update_ax1(self, ax=None):
+        """Render the visible part of the global map from the pyramid."""
+        if not self.pyramid or self._rendering:
+            return
+
+        (x0, x1), (y0, y1) = sorted(self.ax1.get_xlim()), sorted(self.ax1.get_ylim())
+        box = (x0, y0, x1, y1)
+
+        self._rendering = True
+        try:
+            img, box = self.pyramid.render(box, shape=self._display_shape())
+            self.im1.set_data(img.T)
+            self.im1.set_extent(self._extent(box))
+        finally:
+            self._rendering = False
+
+        self.fig.canvas.draw_idle()
 
     def update_ax2(self, ind: int = 0):
         ind = self.gm_ind
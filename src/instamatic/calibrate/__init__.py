@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from .affine import AffineCalibration, AffineTransform, compose
 from .calibrate_beamshift import CalibBeamShift
 from .calibrate_brightness import CalibBrightness
 from .calibrate_directbeam import CalibDirectBeam
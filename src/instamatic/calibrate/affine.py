@@ -0,0 +1,127 @@
+"""Affine transformations between coordinate systems.
+
+The calibrations map coordinates from one setting to another (i.e. pixel
+coordinates to beam shift, or pixel shifts to diffraction shift) with an
+affine transformation of row vectors, `y = x @ r + t`. `AffineTransform`
+applies such a transformation to a single point (2,) or to many points
+(N, 2) at once, keeps the inverse matrix around, and can be composed with
+other transformations into a single one.
+
+Usage:
+    transform = calib_beamshift.affine()
+    beamshifts = transform.forward(pixel_coords)  # (N, 2)
+
+    # beam shift -> pixel shift -> diffraction shift in one step
+    beamshift_to_diffshift = calib_directbeam.conversion('BeamShift', 'DiffShift')
+    diffshifts = beamshift_to_diffshift.forward(beamshifts)
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+class AffineTransform:
+    """Affine transformation of row vectors, `y = x @ r + t`.
+
+    r: np.ndarray,
+        (2, 2) transformation matrix
+    t: np.ndarray,
+        (2,) translation
+    """
+
+    def __init__(self, r, t=(0.0, 0.0), r_inv=None):
+        self.r = np.array(r, dtype=float)
+        self.t = np.array(t, dtype=float)
+        self._r_inv = None if r_inv is None else np.array(r_inv, dtype=float)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(r={self.r.tolist()}, t={self.t.tolist()})'
+
+    @classmethod
+    def identity(cls) -> AffineTransform:
+        return cls(np.eye(2))
+
+    @property
+    def r_inv(self) -> np.ndarray:
+        """Inverse of the transformation matrix (computed once)."""
+        if self._r_inv is None:
+            self._r_inv = np.linalg.inv(self.r)
+        return self._r_inv
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(3, 3) matrix of the transformation in homogeneous coordinates,
+        for row vectors [x, y, 1]."""
+        m = np.eye(3)
+        m[:2, :2] = self.r
+        m[2, :2] = self.t
+        return m
+
+    def matches(self, r, t) -> bool:
+        """Return True if this transformation has matrix `r` and translation
+        `t`."""
+        return np.array_equal(self.r, r) and np.array_equal(self.t, t)
+
+    def forward(self, coords) -> np.ndarray:
+        """Transform a point (2,) or an array of points (N, 2)."""
+        return np.asarray(coords, dtype=float) @ self.r + self.t
+
+    def inverse(self, coords) -> np.ndarray:
+        """Apply the inverse transformation to a point (2,) or an array of
+        points (N, 2)."""
+        return (np.asarray(coords, dtype=float) - self.t) @ self.r_inv
+
+    def inverted(self) -> AffineTransform:
+        """Return the inverse transformation."""
+        return AffineTransform(self.r_inv, -self.t @ self.r_inv, r_inv=self.r)
+
+    def shifted(self, offset) -> AffineTransform:
+        """Return the transformation followed by a translation over
+        `offset`, the inverse matrix is shared."""
+        t = self.t + np.asarray(offset, dtype=float)
+        return AffineTransform(self.r, t, r_inv=self._r_inv)
+
+    def then(self, other: AffineTransform) -> AffineTransform:
+        """Return the transformation that applies `self` first, then
+        `other`."""
+        return AffineTransform(self.r @ other.r, self.t @ other.r + other.t)
+
+
+def compose(*transforms: AffineTransform) -> AffineTransform:
+    """Combine a chain of transformations (applied from left to right) into
+    a single one."""
+    result = AffineTransform.identity()
+    for transform in transforms:
+        result = result.then(transform)
+    return result
+
+
+class AffineCalibration:
+    """Base class for calibrations that are described by affine
+    transformations.
+
+    Subclasses implement `_affine_params(key)`, which returns the matrix
+    and translation of the transformation called `key`, derived from the
+    calibration data. The `AffineTransform` (and its inverse) is cached,
+    and rebuilt when the calibration data change.
+    """
+
+    def _affine_params(self, key=None) -> (np.ndarray, np.ndarray):
+        raise NotImplementedError
+
+    def affine(self, key=None) -> AffineTransform:
+        """Return the transformation called `key` (if the calibration has
+        more than one)."""
+        r, t = self._affine_params(key)
+        cache = self.__dict__.setdefault('_affine_cache', {})
+        transform = cache.get(key)
+        if transform is None or not transform.matches(r, t):
+            transform = cache[key] = AffineTransform(r, t)
+        return transform
+
+    def __getstate__(self):
+        # keep the pickled calibrations free of the cache
+        state = self.__dict__.copy()
+        state.pop('_affine_cache', None)
+        return state
@@ -7,20 +7,22 @@ import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
-from skimage.registration import phase_cross_correlation
 
 from instamatic import config
 from instamatic.image_utils import autoscale, imgscale
 from instamatic.processing.find_holes import find_holes
+from instamatic.processing.registration import Registration
 from instamatic.tools import find_beam_center, printer
 
+from .affine import AffineCalibration
 from .filenames import *
 from .fit import fit_affine_transformation
+from .incremental import TOLERANCE, IncrementalFit, grid_positions
 
 logger = logging.getLogger(__name__)
 
 
-class CalibBeamShift:
+class CalibBeamShift(AffineCalibration):
     """Simple class to hold the methods to perform transformations from one
     setting to another based on calibration results."""
 
@@ -34,16 +36,22 @@ class CalibBeamShift:
     def __repr__(self):
         return f'CalibBeamShift(transform=\n{self.transform},\n   reference_shift=\n{self.reference_shift},\n   reference_pixel=\n{self.reference_pixel})'
 
+    def _affine_params(self, key=None):
+        """Pixel coordinates to beamshift:
+        beamshift = reference_shift - (pixelcoord - reference_pixel) @ transform."""
+        r = np.asarray(self.transform, dtype=float)
+        t = self.reference_shift + np.dot(self.reference_pixel, r)
+        return -r, t
+
     def beamshift_to_pixelcoord(self, beamshift):
-        """Converts from beamshift x,y to pixel coordinates."""
-        r_i = np.linalg.inv(self.transform)
-        pixelcoord = np.dot(self.reference_shift - beamshift, r_i) + self.reference_pixel
-        return pixelcoord
+        """Converts from beamshift x,y to pixel coordinates, `beamshift` can
+        be a single (2,) or an array of (N, 2) coordinates."""
+        return self.affine().inverse(beamshift)
 
     def pixelcoord_to_beamshift(self, pixelcoord):
-        """Converts from pixel coordinates to beamshift x,y."""
-        r = self.transform
-        beamshift = self.reference_shift - np.dot(pixelcoord - self.reference_pixel, r)
+        """Converts from pixel coordinates to beamshift x,y, `pixelcoord`
+        can be a single (2,) or an array of (N, 2) coordinates."""
+        beamshift = self.affine().forward(pixelcoord)
         return beamshift.astype(int)
 
     @classmethod
@@ -132,6 +140,11 @@ def calibrate_beamshift_live(
     exposure: `float` or None
         exposure time
     binsize: `int` or None
+    stop_early: `bool`
+        Stop once the calibration fit has converged, before all grid points are
+        collected (see `instamatic.calibrate.incremental.IncrementalFit`)
+    tolerance: `float`
+        Residual of the fit (pixels) at which the calibration has converged
 
     In case paramers are not defined, camera specific default parameters are retrieved
 
@@ -158,6 +171,8 @@ def calibrate_beamshift_live(
 
     img_cent, scale = autoscale(img_cent)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     outfile = os.path.join(outdir, 'calib_beamcenter') if save_images else None
 
     pixel_cent = find_beam_center(img_cent) * binsize / scale
@@ -165,49 +180,48 @@ def calibrate_beamshift_live(
     print('Beamshift: x={} | y={}'.format(*beamshift_cent))
     print('Pixel: x={} | y={}'.format(*pixel_cent))
 
-    shifts = []
-    beampos = []
+    positions = grid_positions(gridsize, stepsize)
+    tot = len(positions)
 
-    n = int((gridsize - 1) / 2)  # number of points = n*(n+1)
-    x_grid, y_grid = np.meshgrid(
-        np.arange(-n, n + 1) * stepsize, np.arange(-n, n + 1) * stepsize
-    )
-    tot = gridsize * gridsize
+    # images are registered in the background while the beam is moved to the next position
+    fit = IncrementalFit(reg.register, tolerance=kwargs.get('tolerance', TOLERANCE))
 
-    i = 0
-    for dx, dy in np.stack([x_grid, y_grid]).reshape(2, -1).T:
+    for i, (dx, dy) in enumerate(positions):
         ctrl.beamshift.set(x=x_cent + dx, y=y_cent + dy)
 
-        printer(f'Position: {i + 1}/{tot}: {ctrl.beamshift}')
+        printer(f'Position: {i + 1}/{tot}: {ctrl.beamshift} | residual: {fit.residual:.2f} px')
 
-        outfile = os.path.join(outdir, 'calib_beamshift_{i:04d}') if save_images else None
+        outfile = os.path.join(outdir, f'calib_beamshift_{i:04d}') if save_images else None
 
         comment = f'Calib image {i}: dx={dx} - dy={dy}'
         img, h = ctrl.get_image(
             exposure=exposure,
             binsize=binsize,
             out=outfile,
+            asynchronous=True,
             comment=comment,
             header_keys='BeamShift',
         )
         img = imgscale(img, scale)
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
-
-        beamshift = np.array(h['BeamShift'])
-        beampos.append(beamshift)
-        shifts.append(shift)
+        fit.submit(np.array(h['BeamShift']) - beamshift_cent, img)
 
-        i += 1
+        if kwargs.get('stop_early', True) and fit.converged:
+            print(f'\nCalibration converged after {len(fit)}/{tot} positions')
+            break
 
     print('')
     # print "\nReset to center"
 
     ctrl.beamshift.set(*beamshift_cent)
 
+    shifts, beampos = fit.finish()
+
     # correct for binsize, store in binsize=1
-    shifts = np.array(shifts) * binsize / scale
-    beampos = np.array(beampos) - np.array(beamshift_cent)
+    shifts = shifts * binsize / scale
+
+    # wait for the images that are saved in the background
+    ctrl.flush()
 
     c = CalibBeamShift.from_data(
         shifts,
@@ -243,6 +257,8 @@ def calibrate_beamshift_from_image_fn(center_fn, other_fn):
 
     img_cent, scale = autoscale(img_cent, maxdim=512)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     binsize = h_cent['ImageBinsize']
 
     holes = find_holes(img_cent, plot=False, verbose=False, max_eccentricity=0.8)
@@ -263,7 +279,7 @@ def calibrate_beamshift_from_image_fn(center_fn, other_fn):
         print('Image:', fn)
         print('Beamshift: x={} | y={}'.format(*beamshift))
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
+        shift, confidence = reg.register(img)
 
         beampos.append(beamshift)
         shifts.append(shift)
@@ -109,7 +109,11 @@ def calibrate_brightness_live(ctrl, step=1000, save_images=False, **kwargs):
 
         comment = f'Calib image {i}: brightness={target}'
         img, h = ctrl.get_image(
-            exposure=exposure, out=outfile, comment=comment, header_keys='Brightness'
+            exposure=exposure,
+            out=outfile,
+            asynchronous=True,
+            comment=comment,
+            header_keys='Brightness',
         )
 
         img, scale = autoscale(img)
@@ -128,6 +132,9 @@ def calibrate_brightness_live(ctrl, step=1000, save_images=False, **kwargs):
         values.append((brightness, size))
 
     values = np.array(values)
+    # wait for the images that are saved in the background
+    ctrl.flush()
+
     c = CalibBrightness.from_data(*values.T)
 
     # Calling c.plot with videostream crashes program
@@ -7,14 +7,17 @@ import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
-from skimage.registration import phase_cross_correlation
 
 from instamatic import config
 from instamatic.image_utils import autoscale, imgscale
+from instamatic.processing.registration import Registration
 from instamatic.tools import printer
 
+from .affine import AffineCalibration, AffineTransform
 from .filenames import *
 from .fit import fit_affine_transformation
+from .focus import DiffFocusOptimizer
+from .incremental import TOLERANCE, IncrementalFit, grid_positions
 
 logger = logging.getLogger(__name__)
 
@@ -25,35 +28,34 @@ refine_params = {
 }
 
 
-def optimize_diffraction_focus(ctrl, steps=(50, 15, 5)):
-    """Function to optimize the diffraction focus live on the microscope It
-    does so by minimizing the halfwidth of the primary beam."""
-
-    for step in steps:
-        current = ctrl.difffocus.value
-
-        best_score = np.inf
-        best_delta = 0
-
-        for delta in np.arange(-5, 6) * step:
-            ctrl.difffocus.set(current + delta)
-
-            img, h = ctrl.get_image(header_keys=None)
-
-            score = np.sum(img > img.max() / 2) ** 2
-
-            if score < best_score:
-                best_score = score
-                best_delta = delta
-
-        newval = current + best_delta
-        ctrl.difffocus.set(newval)
-        logger.info('Best diff_focus (step=%d): %d, score: %d', step, best_score, newval)
-
-    return newval
+def optimize_diffraction_focus(
+    ctrl, steps: tuple = None, optimizer: DiffFocusOptimizer = None, **kwargs
+):
+    """Function to optimize the diffraction focus live on the microscope. It
+    does so by maximizing the sharpness of the primary beam.
+
+    steps: tuple,
+        step sizes of the former grid search, i.e. (50, 15, 5): the focus is
+        searched within 5 times the largest step, until it is known within
+        the smallest step (sets `span` and `tolerance` of the optimizer)
+    optimizer: `DiffFocusOptimizer`,
+        optimizer to use, defaults to the one kept by `ctrl` for the session
+        (`ctrl.diff_focus_optimizer`), so that the search starts from the
+        last optimum; if `steps` or `kwargs` are given, a new one is made
+        with them
+
+    Returns:
+        the optimal diffraction focus
+    """
+    if steps is not None:
+        kwargs.setdefault('span', 5 * max(steps))
+        kwargs.setdefault('tolerance', min(steps))
+    if optimizer is None:
+        optimizer = DiffFocusOptimizer(ctrl, **kwargs) if kwargs else ctrl.diff_focus_optimizer
+    return optimizer.optimize()
 
 
-class CalibDirectBeam:
+class CalibDirectBeam(AffineCalibration):
     """Calibration routine for the position of the direct beam in diffraction
     space."""
 
@@ -75,22 +77,25 @@ class CalibDirectBeam:
     def combine(cls, lst):
         return cls({k: v for c in lst for k, v in c._dct.items()})
 
-    def any2pixelshift(self, shift, key):
-        r = self._dct[key]['r']
-        t = self._dct[key]['t']
+    def _affine_params(self, key=None):
+        """Pixel shift to the setting `key`: shift = pixelshift @ r + t."""
+        return self._dct[key]['r'], self._dct[key]['t']
 
-        shift = np.array(shift)
-        r_i = np.linalg.inv(r)
-        pixelshift = np.dot(shift - t, r_i)
-        return pixelshift
+    def any2pixelshift(self, shift, key):
+        """Convert a shift (2,) or array of shifts (N, 2) of setting `key` to
+        pixel shifts."""
+        return self.affine(key).inverse(shift)
 
     def pixelshift2any(self, pixelshift, key):
-        r = self._dct[key]['r']
-        t = self._dct[key]['t']
+        """Convert a pixel shift (2,) or array of pixel shifts (N, 2) to
+        shifts of setting `key`."""
+        return self.affine(key).forward(pixelshift)
 
-        pixelshift = np.array(pixelshift)
-        shift = np.dot(pixelshift, r) + t
-        return shift
+    def conversion(self, source: str, target: str) -> AffineTransform:
+        """Return the transformation that converts shifts of setting `source`
+        directly to shifts of setting `target` (i.e. 'BeamShift' ->
+        'DiffShift'), via the pixel shift."""
+        return self.affine(source).inverted().then(self.affine(target))
 
     def beamshift2pixelshift(self, beamshift):
         return self.any2pixelshift(shift=beamshift, key='BeamShift')
@@ -195,6 +200,11 @@ def calibrate_directbeam_live(
     exposure: `float` or None
         exposure time
     binsize: `int` or None
+    stop_early: `bool`
+        Stop once the calibration fit has converged, before all grid points are
+        collected (see `instamatic.calibrate.incremental.IncrementalFit`)
+    tolerance: `float`
+        Residual of the fit (pixels) at which the calibration has converged
 
     In case paramers are not defined, camera specific default parameters are
 
@@ -221,51 +231,63 @@ def calibrate_directbeam_live(
 
     outfile = os.path.join(outdir, f'calib_db_{key}_0000') if save_images else None
     img_cent, h_cent = ctrl.get_image(
-        exposure=exposure, binsize=binsize, comment='Beam in center of image', out=outfile
+        exposure=exposure,
+        binsize=binsize,
+        comment='Beam in center of image',
+        out=outfile,
+        asynchronous=True,
     )
     x_cent, y_cent = readout_cent = np.array(h_cent[key])
 
     img_cent, scale = autoscale(img_cent)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     print('{}: x={} | y={}'.format(key, *readout_cent))
 
-    shifts = []
-    readouts = []
+    positions = grid_positions(gridsize, stepsize)
+    tot = len(positions)
 
-    n = int((gridsize - 1) / 2)  # number of points = n*(n+1)
-    x_grid, y_grid = np.meshgrid(
-        np.arange(-n, n + 1) * stepsize, np.arange(-n, n + 1) * stepsize
-    )
-    tot = gridsize * gridsize
+    # images are registered in the background while moving to the next position
+    fit = IncrementalFit(reg.register, tolerance=kwargs.get('tolerance', TOLERANCE))
 
-    for i, (dx, dy) in enumerate(np.stack([x_grid, y_grid]).reshape(2, -1).T):
+    for i, (dx, dy) in enumerate(positions):
         i += 1
 
         attr.set(x=x_cent + dx, y=y_cent + dy)
 
-        printer(f'Position: {i}/{tot}: {attr}')
+        printer(f'Position: {i}/{tot}: {attr} | residual: {fit.residual:.2f} px')
 
         outfile = os.path.join(outdir, f'calib_db_{key}_{i:04d}') if save_images else None
 
         comment = f'Calib image {i}: dx={dx} - dy={dy}'
         img, h = ctrl.get_image(
-            exposure=exposure, binsize=binsize, out=outfile, comment=comment, header_keys=key
+            exposure=exposure,
+            binsize=binsize,
+            out=outfile,
+            asynchronous=True,
+            comment=comment,
+            header_keys=key,
         )
         img = imgscale(img, scale)
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
+        fit.submit(np.array(h[key]) - readout_cent, img)
 
-        readout = np.array(h[key])
-        readouts.append(readout)
-        shifts.append(shift)
+        if kwargs.get('stop_early', True) and fit.converged:
+            print(f'\nCalibration converged after {len(fit)}/{tot} positions')
+            break
 
     print('')
     # print "\nReset to center"
     attr.set(*readout_cent)
 
+    shifts, readouts = fit.finish()
+
     # correct for binsize, store in binsize=1
-    shifts = np.array(shifts) * binsize / scale
-    readouts = np.array(readouts) - np.array(readout_cent)
+    shifts = shifts * binsize / scale
+
+    # wait for the images that are saved in the background
+    ctrl.flush()
 
     c = CalibDirectBeam.from_data(shifts, readouts, key, header=h_cent, **refine_params[key])
 
@@ -285,6 +307,8 @@ def calibrate_directbeam_from_file(center_fn, other_fn, key='DiffShift'):
 
     img_cent, scale = autoscale(img_cent, maxdim=512)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     binsize = h_cent['ImageBinsize']
 
     print('{}: x={} | y={}'.format(key, *readout_cent))
@@ -302,7 +326,7 @@ def calibrate_directbeam_from_file(center_fn, other_fn, key='DiffShift'):
         print('Image:', fn)
         print('{}: dx={} | dy={}'.format(key, *readout))
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
+        shift, confidence = reg.register(img)
 
         readouts.append(readout)
         shifts.append(shift)
@@ -336,11 +360,7 @@ Calibrate direct beam position
         else:
             if auto_diff_focus:
                 print('Optimizing diffraction focus')
-                current_difffocus = ctrl.difffocus.value
-                difffocus = optimize_diffraction_focus(ctrl)
-                logger.info(
-                    'Optimized diffraction focus from %s to %s', current_difffocus, difffocus
-                )
+                optimize_diffraction_focus(ctrl)
 
             cs = []
             for key in keys:
@@ -6,18 +6,20 @@ import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
-from skimage.registration import phase_cross_correlation
 
 from instamatic.formats import read_image
 from instamatic.image_utils import autoscale, imgscale
+from instamatic.processing.registration import Registration
 
+from .affine import AffineCalibration, AffineTransform
 from .filenames import *
 from .fit import fit_affine_transformation
+from .incremental import TOLERANCE, IncrementalFit, grid_positions
 
 logger = logging.getLogger(__name__)
 
 
-class CalibStage:
+class CalibStage(AffineCalibration):
     """Simple class to hold the methods to perform transformations from one
     setting to another based on calibration results."""
 
@@ -153,19 +155,26 @@ class CalibStage:
             px, image_pos, self.rotation, self.translation, self.reference_position
         )
 
+    def _affine_params(self, key=None):
+        """Pixel coordinates to stage position, relative to the position the
+        image was captured at: stagepos - image_pos = (px - center) @ r."""
+        r = np.asarray(self.rotation, dtype=float)
+        return r, -np.dot(self.center_pixel, r)
+
+    def pixel_to_stage(self, image_pos) -> AffineTransform:
+        """Return the transformation from pixel coordinates to stage position
+        for an image captured at stage position `image_pos`."""
+        return self.affine().shifted(image_pos)
+
     def pixelcoord_to_stagepos(self, px, image_pos):
-        """Function to transform pixel coordinates to stage position
-        coordinates."""
-        return self._pixelcoord_to_stagepos(
-            px, image_pos, self.rotation, self.translation, self.reference_position
-        )
+        """Function to transform pixel coordinates (2,) or (N, 2) to stage
+        position coordinates."""
+        return self.pixel_to_stage(image_pos).forward(px)
 
     def stagepos_to_pixelcoord(self, stagepos, image_pos):
-        """Function to stage position coordinates to pixel coordinates on
-        current frame."""
-        return self._stagepos_to_pixelcoord(
-            stagepos, image_pos, self.rotation, self.translation, self.reference_position
-        )
+        """Function to stage position coordinates (2,) or (N, 2) to pixel
+        coordinates on current frame."""
+        return self.pixel_to_stage(image_pos).inverse(stagepos)
 
     def pixelshift_to_stageshift(self, pixelshift, binsize=1):
         """Convert from a pixel distance to a stage shift."""
@@ -245,6 +254,11 @@ def calibrate_stage_lowmag_live(ctrl, gridsize=5, stepsize=50000, save_images=Fa
     exposure: `float`
         exposure time
     binsize: `int`
+    stop_early: `bool`
+        Stop once the calibration fit has converged, before all grid points are
+        collected (see `instamatic.calibrate.incremental.IncrementalFit`)
+    tolerance: `float`
+        Residual of the fit (pixels) at which the calibration has converged
 
     return:
         instance of Calibration class with conversion methods
@@ -257,7 +271,11 @@ def calibrate_stage_lowmag_live(ctrl, gridsize=5, stepsize=50000, save_images=Fa
     # Accurate reading fo the center positions is needed so that we can come back to it,
     #  because this will be our anchor point
     img_cent, h_cent = ctrl.get_image(
-        exposure=exposure, binsize=binsize, out=outfile, comment='Center image (start)'
+        exposure=exposure,
+        binsize=binsize,
+        out=outfile,
+        asynchronous=True,
+        comment='Center image (start)',
     )
 
     x_cent, y_cent, _, _, _ = h_cent['StagePosition']
@@ -265,17 +283,17 @@ def calibrate_stage_lowmag_live(ctrl, gridsize=5, stepsize=50000, save_images=Fa
 
     img_cent, scale = autoscale(img_cent)
 
-    stagepos = []
-    shifts = []
+    reg = Registration(img_cent, upsample_factor=10)
+
+    positions = grid_positions(gridsize, stepsize)
+    tot = len(positions)
 
-    n = int((gridsize - 1) / 2)  # number of points = n*(n+1)
-    x_grid, y_grid = np.meshgrid(
-        np.arange(-n, n + 1) * stepsize, np.arange(-n, n + 1) * stepsize
+    # images are registered in the background while the stage moves to the next position
+    fit = IncrementalFit(
+        reg.register, translation=True, tolerance=kwargs.get('tolerance', TOLERANCE)
     )
-    tot = gridsize * gridsize
 
-    i = 0
-    for dx, dy in np.stack([x_grid, y_grid]).reshape(2, -1).T:
+    for i, (dx, dy) in enumerate(positions):
         print()
         print(f'Position {i+1}/{tot}: x: {x_cent+dx:.0f}, y: {y_cent+dy:.0f}')
 
@@ -284,46 +302,55 @@ def calibrate_stage_lowmag_live(ctrl, gridsize=5, stepsize=50000, save_images=Fa
 
         outfile = f'calib_{i:04d}' if save_images else None
 
-        comment = comment
+        comment = f'Calib image {i}: dx={dx} - dy={dy}'
         img, h = ctrl.get_image(
             exposure=exposure,
             binsize=binsize,
             out=outfile,
+            asynchronous=True,
             comment=comment,
             header_keys='StagePosition',
         )
 
         img = imgscale(img, scale)
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
-
         xobs, yobs, _, _, _ = h['StagePosition']
-        stagepos.append((xobs, yobs))
-        shifts.append(shift)
+        fit.submit((xobs - x_cent, yobs - y_cent), img)
+        print(f'Residual: {fit.residual:.2f} px')
 
-        i += 1
+        if kwargs.get('stop_early', True) and fit.converged:
+            print(f'Calibration converged after {len(fit)}/{tot} positions')
+            break
 
     print(' >> Reset to center')
     ctrl.stage.set(x=x_cent, y=y_cent)
     ctrl.stage.reset_xy()
 
+    shifts, stagepos = fit.finish()
+
     # correct for binsize, store as binsize=1
-    shifts = np.array(shifts) * binsize / scale
-    stagepos = np.array(stagepos) - np.array((x_cent, y_cent))
+    shifts = shifts * binsize / scale
 
-    m = gridsize**2 // 2
-    if gridsize % 2 and stagepos[m].max() > 50:
+    # the grid center is measured first
+    if stagepos[0].max() > 50:
         print(
-            f' >> Warning: Large difference between image {m}, and center image. These should be close for a good calibration.'
+            ' >> Warning: Large difference between image 0, and center image. These should be close for a good calibration.'
         )
-        print('    Difference:', stagepos[m])
+        print('    Difference:', stagepos[0])
         print()
 
     if save_images:
         ctrl.get_image(
-            exposure=exposure, binsize=binsize, out='calib_end', comment='Center image (end)'
+            exposure=exposure,
+            binsize=binsize,
+            out='calib_end',
+            asynchronous=True,
+            comment='Center image (end)',
         )
 
+    # wait for the images that are saved in the background
+    ctrl.flush()
+
     c = CalibStage.from_data(shifts, stagepos, reference_position=xy_cent, header=h_cent)
 
     # Calling c.plot with videostream crashes program
@@ -348,6 +375,8 @@ def calibrate_stage_lowmag_from_image_fn(center_fn, other_fn):
 
     img_cent, scale = autoscale(img_cent, maxdim=512)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     x_cent, y_cent, _, _, _ = h_cent['StagePosition']
     xy_cent = np.array([x_cent, y_cent])
     print('Center:', center_fn)
@@ -369,7 +398,7 @@ def calibrate_stage_lowmag_from_image_fn(center_fn, other_fn):
         print(f'Stageposition: x={xobs:.0f} | y={yobs:.0f}')
         print()
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
+        shift, confidence = reg.register(img)
 
         stagepos.append((xobs, yobs))
         shifts.append(shift)
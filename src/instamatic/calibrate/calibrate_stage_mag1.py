@@ -5,12 +5,12 @@ import sys
 import time
 
 import numpy as np
-from skimage.registration import phase_cross_correlation
 
 from instamatic import config
 from instamatic.formats import read_image
 from instamatic.image_utils import autoscale, imgscale
 from instamatic.io import get_new_work_subdirectory
+from instamatic.processing.registration import Registration
 
 from .calibrate_stage_lowmag import CalibStage
 from .filenames import *
@@ -83,7 +83,11 @@ def calibrate_mag1_live(
     # Accurate reading fo the center positions is needed so that we can come back to it,
     #  because this will be our anchor point
     img_cent, h_cent = ctrl.get_image(
-        exposure=exposure, binsize=binsize, out=outfile, comment='Center image (start)'
+        exposure=exposure,
+        binsize=binsize,
+        out=outfile,
+        asynchronous=True,
+        comment='Center image (start)',
     )
     stage_cent = ctrl.stage.get()
 
@@ -99,6 +103,8 @@ def calibrate_mag1_live(
 
     img_cent, scale = autoscale(img_cent)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     stagepos = []
     shifts = []
 
@@ -135,12 +141,16 @@ def calibrate_mag1_live(
 
             comment = f'Calib image {i}: dx={dx} - dy={dy}'
             img, h = ctrl.get_image(
-                exposure=exposure, binsize=binsize, out=outfile, comment=comment
+                exposure=exposure,
+                binsize=binsize,
+                out=outfile,
+                asynchronous=True,
+                comment=comment,
             )
 
             img = imgscale(img, scale)
 
-            shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
+            shift, confidence = reg.register(img)
 
             xobs = stage.x
             yobs = stage.y
@@ -176,9 +186,16 @@ def calibrate_mag1_live(
     if save_images:
         outfile = work_drc / 'calib_end'
         ctrl.get_image(
-            exposure=exposure, binsize=binsize, out=outfile, comment='Center image (end)'
+            exposure=exposure,
+            binsize=binsize,
+            out=outfile,
+            asynchronous=True,
+            comment='Center image (end)',
         )
 
+    # wait for the images that are saved in the background
+    ctrl.flush()
+
     c = CalibStage.from_data(
         shifts, stagepos, reference_position=xy_cent, camera_dimensions=cam_dimensions
     )
@@ -209,6 +226,8 @@ def calibrate_mag1_from_image_fn(center_fn, other_fn):
 
     img_cent, scale = autoscale(img_cent, maxdim=512)
 
+    reg = Registration(img_cent, upsample_factor=10)
+
     x_cent, y_cent, _, _, _ = h_cent['StagePosition']
 
     xy_cent = np.array([x_cent, y_cent])
@@ -228,7 +247,7 @@ def calibrate_mag1_from_image_fn(center_fn, other_fn):
         print('Image:', fn)
         print(f'Stageposition: x={xobs:.0f} | y={yobs:.0f}')
 
-        shift, error, phasediff = phase_cross_correlation(img_cent, img, upsample_factor=10)
+        shift, confidence = reg.register(img)
         print('Shift:', shift)
         print()
 
@@ -1,18 +1,19 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import matplotlib.pyplot as plt
 import numpy as np
 import yaml
 from scipy import stats
-from skimage.registration import phase_cross_correlation
 
 from instamatic import config
 from instamatic.calibrate.fit import fit_affine_transformation
 from instamatic.formats import read_tiff, write_tiff
 from instamatic.image_utils import rotate_image
 from instamatic.io import get_new_work_subdirectory
+from instamatic.processing.registration import register_pairs
 
 np.set_printoptions(suppress=True)
 
@@ -41,12 +42,10 @@ def get_outlier_filter(data, threshold: float = 2.0) -> list:
 
 def cross_correlate_image_pairs(pairs: tuple) -> list:
     """Cross correlate image pairs."""
-    translations = []
-    for img0, img1 in pairs:
-        translation, error, phasediff = phase_cross_correlation(img0, img1, upsample_factor=10)
-        print(f'shift {translation} error {error:.4f} phasediff {phasediff:.4f}')
-        translations.append(translation)
-    return translations
+    translations, confidences = register_pairs(pairs, upsample_factor=10)
+    for translation, confidence in zip(translations, confidences):
+        print(f'shift {translation} confidence {confidence:.4f}')
+    return list(translations)
 
 
 def calibrate_stage_from_file(drc: str, plot: bool = False):
@@ -163,7 +162,9 @@ def calibrate_stage_from_stageshifts(
     mode = ctrl.mode.get()
     binning = ctrl.cam.get_binning()
 
-    pairs = []
+    # the image pairs are cross correlated in the background while the stage moves
+    executor = ThreadPoolExecutor(max_workers=1)
+    futures = []
 
     for i, (n_steps, step) in enumerate(args):
         j = 0
@@ -186,7 +187,8 @@ def calibrate_stage_from_stageshifts(
             if drc:
                 write_tiff(drc / f'{i}_{j}.tiff', img)
 
-            pairs.append((last_img, img))
+            future = executor.submit(register_pairs, [(last_img, img)], upsample_factor=10)
+            futures.append(future)
             stage_shifts.append((dx, dy))
 
             current_stage_pos = ctrl.stage
@@ -198,7 +200,12 @@ def calibrate_stage_from_stageshifts(
         # return to original position
         ctrl.stage.xy = (stage_x, stage_y)
 
-    translations = cross_correlate_image_pairs(pairs)
+    translations = []
+    for future in futures:
+        (translation,), (confidence,) = future.result()
+        print(f'shift {translation} confidence {confidence:.4f}')
+        translations.append(translation)
+    executor.shutdown()
 
     # Filter outliers
     sel = get_outlier_filter(translations)
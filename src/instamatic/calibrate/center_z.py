@@ -1,11 +1,23 @@
 from __future__ import annotations
 
 import time
+from collections import namedtuple
 
 import numpy as np
-from skimage.registration import phase_cross_correlation
 
 from instamatic.processing.find_crystals import find_crystals_timepix
+from instamatic.processing.registration import Registration
+
+EucentricHeight = namedtuple('EucentricHeight', ['z', 'images', 'converged', 'history'])
+
+# largest measurable parallax, as a fraction of the image size; phase correlation
+# cannot tell a shift of more than half the image from a smaller one in the opposite
+# direction
+MAX_PARALLAX = 0.4
+
+# rms deviation (pixels) of the measured shifts from a line above which the images
+# are considered misregistered
+MAX_RESIDUAL = 2.0
 
 
 def reject_outlier(data, m=2):
@@ -28,12 +40,162 @@ def eliminate_backlash_in_tiltx(ctrl):
         return 1
 
 
+def parallax_root(zs, shifts) -> (float, float):
+    """Fit the image shifts (N, 2) measured at stage heights `zs` (N,) with a
+    line, `shift = a + b * z`.
+
+    Returns:
+        the height at which the shift is smallest (zero, if the line passes
+        through the origin), and the rms residual of the fit (pixels)
+    """
+    zs = np.asarray(zs, dtype=float)
+    shifts = np.asarray(shifts, dtype=float)
+    b, a = np.polyfit(zs, shifts, 1)
+    residuals = shifts - (a + zs[:, np.newaxis] * b)
+    residual = np.sqrt(np.mean(np.sum(residuals**2, axis=1)))
+    return float(-np.dot(a, b) / np.dot(b, b)), float(residual)
+
+
+def find_eucentric_height(
+    ctrl,
+    tilt: float = 10.0,
+    angle: float = 0.0,
+    step: float = 2000,
+    precision: float = 250,
+    max_images: int = 8,
+    exposure: float = 0.01,
+    set_height: bool = True,
+    verbose: bool = False,
+) -> EucentricHeight:
+    """Find the eucentric height from the parallax between two tilts.
+
+    A reference image is taken at `angle - tilt/2`, all other images at
+    `angle + tilt/2`. At the second tilt, the image shift with respect to
+    the reference depends linearly on the stage height, and vanishes at
+    `z*`, from which the eucentric height follows. The shift is measured
+    at the starting height and `step` nm away from it, after which every
+    next height is the root of the line fitted to all measurements
+    (secant iteration). The search stops when the estimate changes less
+    than `precision` nm, typically after 4-5 images. The reference is
+    transformed only once (see `Registration`).
+
+    Like the method by Koster et al., Ultramicroscopy 46 (1992) 207-227,
+    this assumes that the image contains features close to the tilt axis,
+    and that `angle` is close to 0. The starting height must be close
+    enough to the eucentric height for the parallax between the two tilts
+    to stay below `MAX_PARALLAX` times the image size (if the second height
+    is out of range, the opposite direction is tried). The search stops
+    without converging if the parallax is too large, or if the shifts do
+    not lie on a line, which means that the registration failed.
+
+    tilt: float,
+        tilt difference between the two images (degrees)
+    angle: float,
+        stage tilt (degrees) around which the images are taken
+    step: float,
+        change in z (nm) for the second measurement
+    precision: float,
+        target precision of the eucentric height (nm)
+    max_images: int,
+        maximum number of images to acquire, including the reference
+    exposure: float,
+        exposure time of the images (s)
+    set_height: bool,
+        move the stage to the eucentric height (at `angle`) when done,
+        otherwise return to the starting position
+
+    Returns:
+        namedtuple with the eucentric height `z` (nm), the number of
+        `images` acquired, whether the search `converged`, and the
+        `history` of the estimates
+    """
+    z0 = ctrl.stage.z
+    a_ref = angle - tilt / 2
+    a_meas = angle + tilt / 2
+    sin_ref, sin_meas = np.sin(np.radians(a_ref)), np.sin(np.radians(a_meas))
+
+    def to_eucentric(z_root):
+        # (z* - z_e) * sin(a_meas) = (z0 - z_e) * sin(a_ref)
+        return (z_root * sin_meas - z0 * sin_ref) / (sin_meas - sin_ref)
+
+    def acquire():
+        img, h = ctrl.get_image(exposure=exposure, comment='z height finding')
+        return img
+
+    ctrl.stage.set(a=a_ref)
+    reference = acquire()
+    reg = Registration(reference, upsample_factor=10, window='hann')
+    max_shift = MAX_PARALLAX * min(reference.shape)
+    n_images = 1
+
+    ctrl.stage.set(a=a_meas)
+
+    zs, shifts, history = [], [], []
+    z = z0
+    converged = False
+
+    while n_images < max_images:
+        ctrl.stage.z = z
+        shift, confidence = reg.register(acquire())
+        n_images += 1
+
+        if verbose:
+            print(f'z = {z:.0f} | shift = {shift} | confidence = {confidence:.3f}')
+        if np.abs(shift).max() > max_shift:
+            if len(zs) == 1 and z > z0:
+                z = z0 - step
+                continue
+            if verbose:
+                print('Parallax too large to measure, start closer to the eucentric height.')
+            break
+
+        zs.append(z)
+        shifts.append(shift)
+
+        if len(zs) == 1:
+            z = z0 + step
+            continue
+
+        try:
+            z_root, residual = parallax_root(zs, shifts)
+        except (np.linalg.LinAlgError, ZeroDivisionError, ValueError):
+            break
+
+        if residual > MAX_RESIDUAL:
+            if verbose:
+                print(f'Inconsistent shifts (residual: {residual:.1f} px), registration failed')
+            history.clear()
+            break
+
+        z_eucentric = to_eucentric(z_root)
+        history.append(z_eucentric)
+        if verbose:
+            print(f'Estimated eucentric height: {z_eucentric:.0f}')
+
+        if len(history) > 1 and abs(history[-1] - history[-2]) < precision:
+            converged = True
+            break
+
+        z = z_root
+
+    z_eucentric = history[-1] if history else z0
+
+    if set_height and history:
+        ctrl.stage.set(a=angle, z=z_eucentric)
+    else:
+        ctrl.stage.set(a=angle, z=z0)
+
+    return EucentricHeight(z_eucentric, n_images, converged, history)
+
+
 def center_z_height(ctrl, verbose=False):
     """Automated routine to find the z-height.
 
     Koster, A. J., et al. "Automated microscopy for electron
     tomography." Ultramicroscopy 46.1-4 (1992): 207-227.
     http://www.msg.ucsf.edu/agard/Publications/52-Koster.pdf
+
+    See `find_eucentric_height`.
     """
     print('\033[k', 'Finding eucentric height...', end='\r')
     if ctrl.mode != 'mag1':
@@ -43,37 +205,13 @@ def center_z_height(ctrl, verbose=False):
     ctrl.magnification.value = 2500
 
     z0 = ctrl.stage.z
-    ctrl.stage.set(a=-5)
     a0 = ctrl.stage.a
-    z = []
-    d = []
-    ctrl.stage.z = z0 - 2000
-    ctrl.stage.z = z0 - 1000
-    ctrl.stage.z = z0
-
-    for i in range(0, 10):
-        z1 = ctrl.stage.z
-        ctrl.stage.set(a=a0)
-        img0, h = ctrl.get_image(exposure=0.01, comment='z height finding')
-        z.append(z0 + i * 1000)
-        ctrl.stage.set(a=a0 + 10)
-        img1, h = ctrl.get_image(exposure=0.01, comment='z height finding')
-        shift, error, phasediff = phase_cross_correlation(img0, img1, upsample_factor=10)
-        d1 = np.linalg.norm(shift)
-        if shift[0] < 0:
-            d1 = -d1
-        d.append(d1)
-        if verbose:
-            print(f'Step {i}: z = {z1}, d = {np.linalg.norm(shift)}')
-        ctrl.stage.set(z=z1 + 1000)
-        time.sleep(1)
-
-    d_f = reject_outlier(d)
-    z_f = []
-    for e in d_f:
-        z_f.append(z[d.index(e)])
-    p = np.polyfit(z, d, 1)
-    z_center = -p[1] / p[0]
+
+    result = find_eucentric_height(ctrl, tilt=10, angle=0, set_height=False, verbose=verbose)
+    z_center = result.z
+    if verbose:
+        print(f'{result.images} images acquired, converged: {result.converged}')
+
     satisfied = input(
         f'Found eucentric height: {z_center}. Press ENTER to set the height, x to cancel setting.'
     )
@@ -96,6 +234,36 @@ def center_z_height(ctrl, verbose=False):
         )
 
 
+def center_z_height_parallax(ctrl, verbose=False):
+    """Find and set the eucentric height with `find_eucentric_height`, with
+    the same interface as `center_z_height_HYMethod`.
+
+    Returns:
+        x, y stage position, or (999999, 999999) if the height was not found
+    """
+    print('\033[k', 'Finding eucentric height...', end='\r')
+    if ctrl.mode != 'mag1':
+        ctrl.mode.set('mag1')
+
+    ctrl.brightness.value = 65535
+    ctrl.magnification.value = 2500
+
+    a0 = ctrl.stage.a
+    result = find_eucentric_height(ctrl, tilt=10, angle=a0, verbose=verbose)
+    if not result.converged:
+        if verbose:
+            print('Eucentric height search did not converge.')
+        return 999999, 999999
+
+    print(
+        '\033[k',
+        f'Z height adjustment done and eucentric z height found at: {result.z:.0f}',
+        end='\r',
+    )
+    x, y, z, a, b = ctrl.stage.get()
+    return x, y
+
+
 def find_crystal_max(img, magnification, spread, offset):
     crystal_positions = find_crystals_timepix(img, magnification, spread=spread, offset=offset)
     crystal_area = [crystal.area_pixel for crystal in crystal_positions if crystal.isolated]
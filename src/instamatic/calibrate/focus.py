@@ -0,0 +1,191 @@
+"""Optimization of the diffraction focus on the primary beam.
+
+The diffraction focus (IL1) is optimal when the primary beam is as small
+as possible. `DiffFocusOptimizer` locates the beam once, scores only a
+small region of interest around it with `beam_sharpness`, and searches
+the focus with a bounded golden-section search with parabolic steps
+(Brent's method), which needs far fewer images than a scan over a grid
+of focus values. The last optimum is kept as the starting point for the
+next search, so that refocusing between crystals only has to search a
+small interval.
+
+Usage:
+    optimizer = DiffFocusOptimizer(ctrl)
+    for crystal in crystals:
+        ...
+        optimizer.optimize()  # starts from the previous optimum
+"""
+
+from __future__ import annotations
+
+import logging
+
+import numpy as np
+from scipy import ndimage
+from scipy.optimize import minimize_scalar
+
+logger = logging.getLogger(__name__)
+
+# size (pixels) of the region of interest around the primary beam
+ROI_SIZE = 64
+
+
+def locate_beam(img: np.ndarray, sigma: float = 2.0) -> (int, int):
+    """Return the pixel coordinates of the primary beam, the maximum of the
+    image after removing hot pixels (3x3 median filter) and smoothing."""
+    smoothed = ndimage.median_filter(np.asarray(img, dtype=float), size=3)
+    smoothed = ndimage.gaussian_filter(smoothed, sigma)
+    return np.unravel_index(smoothed.argmax(), smoothed.shape)
+
+
+def crop_roi(img: np.ndarray, center, size: int = ROI_SIZE) -> np.ndarray:
+    """Return the `size` x `size` region of `img` around `center`, clipped
+    to the image."""
+    half = size // 2
+    i0, j0 = (max(int(c) - half, 0) for c in center)
+    return img[i0 : i0 + size, j0 : j0 + size]
+
+
+def beam_sharpness(roi: np.ndarray) -> float:
+    """Sharpness of the primary beam in `roi`.
+
+    The background (median) is subtracted and hot pixels are removed with
+    a 3x3 median filter, after which the sharpness is the sum of the
+    squared intensities divided by the squared total intensity. This is
+    the inverse of the effective number of pixels the beam covers: it
+    does not depend on the exposure, and unlike the area above half the
+    maximum it changes smoothly with the focus, which the parabolic steps
+    of the search need.
+    """
+    roi = ndimage.median_filter(np.asarray(roi, dtype=float), size=3)
+    signal = np.clip(roi - np.median(roi), 0, None)
+    total = signal.sum()
+    if total == 0:
+        return 0.0
+    return float(np.sum(signal**2) / total**2)
+
+
+class DiffFocusOptimizer:
+    """Optimize the diffraction focus by maximizing the sharpness of the
+    primary beam.
+
+    ctrl: `TEMController`,
+        the microscope should be in diffraction mode, with the primary
+        beam on the camera
+    span: int,
+        the focus is searched within `span` of the starting value
+    tolerance: int,
+        the search stops when the optimum is known within `tolerance`
+    warm_span: int,
+        search interval for the next searches, which start from the last
+        optimum
+    roi_size: int,
+        size of the region around the primary beam (pixels) that is scored
+    exposure: float,
+        exposure time (s), defaults to the camera default
+    binsize: int,
+        binning of the images, defaults to the camera default
+    max_shifts: int,
+        number of times the search interval is moved if the optimum is
+        found at its edge
+    """
+
+    def __init__(
+        self,
+        ctrl,
+        span: int = 250,
+        tolerance: int = 2,
+        warm_span: int = 50,
+        roi_size: int = ROI_SIZE,
+        exposure: float = None,
+        binsize: int = None,
+        max_shifts: int = 3,
+    ):
+        self.ctrl = ctrl
+        self.span = span
+        self.tolerance = tolerance
+        self.warm_span = warm_span
+        self.roi_size = roi_size
+        self.exposure = exposure
+        self.binsize = binsize
+        self.max_shifts = max_shifts
+
+        self.last = None  # last optimum, starting point of the next search
+        self.n_images = 0  # images acquired by the last search
+        self.history = []  # (focus, sharpness) of the last search
+
+    def reset(self):
+        """Forget the last optimum, the next search covers `span`."""
+        self.last = None
+
+    def _acquire(self) -> np.ndarray:
+        img, h = self.ctrl.get_image(
+            exposure=self.exposure, binsize=self.binsize, header_keys=None
+        )
+        self.n_images += 1
+        return img
+
+    def optimize(self, start: int = None, set_focus: bool = True) -> int:
+        """Search the optimal diffraction focus.
+
+        start: int,
+            starting value, defaults to the last optimum, or the current
+            focus for the first search
+        set_focus: bool,
+            set the optimal focus when done, otherwise restore the starting
+            value
+
+        Returns:
+            the optimal diffraction focus
+        """
+        difffocus = self.ctrl.difffocus
+        if start is not None:
+            span = self.span
+        elif self.last is not None:
+            start, span = self.last, self.warm_span
+        else:
+            start, span = difffocus.get(), self.span
+
+        self.n_images = 0
+        self.history = []
+        scores = {}
+
+        # the mode is confirmed once here, which makes setting the lens faster
+        difffocus.set(start)
+        center = locate_beam(self._acquire())
+
+        def cost(value):
+            value = int(round(value))
+            if value not in scores:
+                difffocus.set(value, confirm_mode=False)
+                roi = crop_roi(self._acquire(), center, self.roi_size)
+                scores[value] = beam_sharpness(roi)
+                self.history.append((value, scores[value]))
+            return -scores[value]
+
+        lower, upper = start - span, start + span
+        for _ in range(self.max_shifts + 1):
+            result = minimize_scalar(
+                cost, bounds=(lower, upper), method='bounded', options={'xatol': self.tolerance}
+            )
+            best = int(round(result.x))
+            # the optimum may lie outside of the interval if the search ended at an edge
+            if best - lower <= 2 * self.tolerance:
+                lower, upper = lower - span, lower + span
+            elif upper - best <= 2 * self.tolerance:
+                lower, upper = upper - span, upper + span
+            else:
+                break
+
+        best = max(scores, key=scores.get)
+        logger.info(
+            'Optimized diffraction focus from %d to %d in %d images (sharpness: %.4g)',
+            start,
+            best,
+            self.n_images,
+            scores[best],
+        )
+
+        self.last = best
+        difffocus.set(best if set_focus else start)
+        return best
@@ -0,0 +1,230 @@
+"""Incremental fitting of calibrations during data collection.
+
+The calibration routines move a setting (beam shift, diffraction shift,
+stage position) over a grid, and register the image taken at every
+position against a reference to find the pixel shift. `IncrementalFit`
+registers every image in a background thread, while the next position is
+being approached, and refits the affine transformation between the pixel
+shifts and the settings after every new point. Once the fit is good (the
+residual is below the tolerance) and stable (an extra point does not
+change it), the remaining positions can be skipped.
+
+The grid positions from `grid_positions` are ordered so that every
+prefix of the list covers the grid evenly, which makes an early stop
+possible without losing the accuracy of the calibration.
+
+Usage:
+    fit = IncrementalFit(Registration(img_cent).register)
+    for offset in grid_positions(gridsize, stepsize):
+        ctrl.beamshift.set(*(center + offset))  # registration of the last image runs meanwhile
+        img, h = ctrl.get_image()
+        fit.submit(h['BeamShift'], img)
+        if fit.converged:
+            break
+    shifts, settings = fit.finish()
+"""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# residual (pixels) below which a calibration fit is considered good
+TOLERANCE = 0.5
+
+# minimum number of points before a calibration can stop early
+MIN_POINTS = 6
+
+
+def grid_positions(gridsize: int, stepsize: float, spread: bool = True) -> np.ndarray:
+    """Return the (N, 2) offsets of a `gridsize` x `gridsize` grid around 0.
+
+    spread: bool,
+        order the positions so that every prefix is spread over the grid
+        (center first, then every next point as far as possible from the
+        previous ones), otherwise return them row by row
+    """
+    n = int((gridsize - 1) / 2)
+    steps = np.arange(-n, n + 1) * stepsize
+    x_grid, y_grid = np.meshgrid(steps, steps)
+    positions = np.stack([x_grid, y_grid]).reshape(2, -1).T
+
+    if not spread or len(positions) < 3:
+        return positions
+
+    # farthest point ordering, ties are broken by the row order
+    order = [int(np.abs(positions).sum(axis=1).argmin())]
+    dist = np.linalg.norm(positions - positions[order[0]], axis=1)
+    for _ in range(len(positions) - 1):
+        i = int(dist.argmax())
+        order.append(i)
+        dist = np.minimum(dist, np.linalg.norm(positions - positions[i], axis=1))
+
+    return positions[order]
+
+
+def fit_affine_linear(a, b, translation: bool = True) -> (np.ndarray, np.ndarray):
+    """Fit `b = a @ r + t` by linear least squares.
+
+    Unlike `fit.fit_affine_transformation`, the matrix is not constrained
+    to rotation/scaling, which makes it fast enough to refit after every
+    new point.
+
+    Returns:
+        (2, 2) matrix `r` and (2,) translation `t` (zero if `translation`
+        is False)
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if translation:
+        design = np.hstack([a, np.ones((len(a), 1))])
+        coef = np.linalg.lstsq(design, b, rcond=None)[0]
+        return coef[:2], coef[2]
+    return np.linalg.lstsq(a, b, rcond=None)[0], np.zeros(2)
+
+
+class IncrementalFit:
+    """Register calibration images in the background and refit the
+    calibration after every point.
+
+    register: callable,
+        called with the arguments passed to `submit`, must return the pixel
+        shift and the confidence (i.e. `Registration.register`)
+    translation: bool,
+        fit a translation, otherwise the settings should be given relative
+        to the reference
+    tolerance: float,
+        the fit has converged when the rms residual and the change in the
+        predicted pixel shifts between the last two fits are below this
+        value (pixels)
+    min_points: int,
+        minimum number of points before the fit can converge
+
+    The shifts are fitted as `setting = shift @ r + t`, the same
+    convention as the calibrations.
+    """
+
+    def __init__(
+        self,
+        register,
+        translation: bool = False,
+        tolerance: float = TOLERANCE,
+        min_points: int = MIN_POINTS,
+    ):
+        self.register = register
+        self.translation = translation
+        self.tolerance = tolerance
+        self.min_points = max(min_points, 3)
+
+        self.shifts = []
+        self.settings = []
+        self.confidences = []
+        self.residuals = []  # rms residual (pixels) after every point
+
+        self.r = None
+        self.t = None
+        self.change = np.inf
+
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.shifts)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    @property
+    def residual(self) -> float:
+        """Rms residual of the last fit (pixels)."""
+        return self.residuals[-1] if self.residuals else np.nan
+
+    @property
+    def converged(self) -> bool:
+        """Whether the fit is good and stable (see `tolerance`)."""
+        return (
+            len(self) >= self.min_points
+            and self.residual <= self.tolerance
+            and self.change <= self.tolerance
+        )
+
+    def submit(self, setting, *args) -> None:
+        """Register an image (`register(*args)`) in the background, and add
+        the result with `setting` to the fit.
+
+        The results of the earlier images, which had the time it took to
+        acquire this one to finish, are added to the fit first. The fit
+        therefore lags one point behind the submitted images.
+        """
+        future = self._executor.submit(self.register, *args)
+        self._pending.append((future, np.array(setting, dtype=float)))
+        self.update(block=True, keep=1)
+
+    def update(self, block: bool = False, keep: int = 0) -> int:
+        """Add the registrations that have finished to the fit, in the order
+        they were submitted.
+
+        block: bool,
+            wait for the pending registrations to finish
+        keep: int,
+            number of most recent registrations to leave pending
+
+        Returns:
+            the number of points added
+        """
+        n = 0
+        while len(self._pending) > keep and (block or self._pending[0][0].done()):
+            future, setting = self._pending.pop(0)
+            shift, confidence = future.result()
+            self.shifts.append(np.asarray(shift, dtype=float))
+            self.settings.append(setting)
+            self.confidences.append(confidence)
+            self._refit()
+            n += 1
+        return n
+
+    def predict_shifts(self, settings) -> np.ndarray:
+        """Pixel shifts expected for `settings` from the current fit."""
+        return (np.asarray(settings, dtype=float) - self.t) @ np.linalg.inv(self.r)
+
+    def _refit(self):
+        if len(self) < 3:
+            self.residuals.append(np.nan)
+            return
+
+        shifts = np.array(self.shifts)
+        settings = np.array(self.settings)
+        previous = None if self.r is None else self.predict_shifts(settings)
+
+        try:
+            self.r, self.t = fit_affine_linear(shifts, settings, translation=self.translation)
+            predicted = self.predict_shifts(settings)
+        except np.linalg.LinAlgError:
+            # the points do not span both directions yet
+            self.r = self.t = None
+            self.residuals.append(np.nan)
+            return
+
+        residual = np.sqrt(np.mean(np.sum((predicted - shifts) ** 2, axis=1)))
+        self.residuals.append(residual)
+        if previous is not None:
+            self.change = np.abs(predicted - previous).max()
+
+        logger.debug('Calibration fit: %d points, residual %.3f px', len(self), residual)
+
+    def finish(self) -> (np.ndarray, np.ndarray):
+        """Wait for the remaining registrations, and return the (N, 2)
+        arrays of pixel shifts and settings."""
+        self.update(block=True)
+        self.close()
+        return np.array(self.shifts), np.array(self.settings)
@@ -36,6 +36,7 @@ class VideoStream(threading.Thread):
         self.display_dim = 512
 
         self.frame, scale = autoscale(np.ones(self.dimensions), maxdim=self.display_dim)
+        self.frame_count = 0
 
     def __getattr__(self, attrname):
         """Pass attribute lookups to self.cam to prevent AttributeError."""
@@ -52,6 +53,7 @@ class VideoStream(threading.Thread):
         frame = self.cam.get_image(exposure=exposure, binsize=binsize)
 
         self.frame, scale = autoscale(frame, maxdim=self.display_dim)
+        self.frame_count += 1
 
         return frame
 
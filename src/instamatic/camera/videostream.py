@@ -88,6 +88,7 @@ class VideoStream(threading.Thread):
 
         self.frametime = self.default_exposure
         self.frame = None
+        self.frame_count = 0  # number of frames received, to detect new frames
 
         self.grabber = self.setup_grabber()
 
@@ -113,11 +114,13 @@ class VideoStream(threading.Thread):
         if acquire:
             self.grabber.lock.acquire(True)
             self.acquired_frame = self.frame = frame
+            self.frame_count += 1
             self.grabber.lock.release()
             self.grabber.acquireCompleteEvent.set()
         else:
             self.grabber.lock.acquire(True)
             self.frame = frame
+            self.frame_count += 1
             self.grabber.lock.release()
 
     def setup_grabber(self) -> ImageGrabber:
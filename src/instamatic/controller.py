@@ -3,6 +3,7 @@ from __future__ import annotations
 import time
 from collections import namedtuple
 from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Optional, Tuple
 
 import numpy as np
@@ -11,7 +12,13 @@ from instamatic import config
 from instamatic.camera import Camera
 from instamatic.camera.camera_base import CameraBase
 from instamatic.exceptions import TEMControllerError
-from instamatic.formats import write_tiff
+from instamatic.formats import (
+    acquisition_compression,
+    append_metadata,
+    flush_write_queue,
+    get_write_queue,
+    write_tiff,
+)
 from instamatic.image_utils import rotate_image
 from instamatic.microscope import components
 from instamatic.microscope.base import MicroscopeBase
@@ -116,6 +123,8 @@ class TEMController:
         self.mode = components.Mode(tem)
 
         self.autoblank = False
+        self.telemetry = None
+        self._diff_focus_optimizer = None
         self._saved_alignments = config.get_alignments()
 
         print()
@@ -152,6 +161,16 @@ class TEMController:
         """Get current density from fluorescence screen in pA/cm2."""
         return self.tem.getCurrentDensity()
 
+    @property
+    def diff_focus_optimizer(self):
+        """`DiffFocusOptimizer` kept for the session, so that every search of
+        the diffraction focus starts from the last optimum."""
+        if self._diff_focus_optimizer is None:
+            from instamatic.calibrate.focus import DiffFocusOptimizer
+
+            self._diff_focus_optimizer = DiffFocusOptimizer(self)
+        return self._diff_focus_optimizer
+
     @property
     def spotsize(self) -> int:
         return self.tem.getSpotSize()
@@ -181,6 +200,8 @@ class TEMController:
             This function is run after the last acquisition item has run.
         backlash: bool
         Move the stage with backlash correction.
+        optimize_route: bool
+        Reorder the items to minimize the stage travel.
         """
         from instamatic.acquire_at_items import AcquireAtItems
 
@@ -311,7 +332,7 @@ class TEMController:
         stage_shift : np.array[2]
             The stage shift vector determined from cross correlation
         """
-        from skimage.registration import phase_cross_correlation
+        from instamatic.processing.registration import register_translation
 
         current_x, current_y = self.stage.xy
 
@@ -322,9 +343,7 @@ class TEMController:
 
         img = self.get_rotated_image()
 
-        pixel_shift, error, phasediff = phase_cross_correlation(
-            ref_img, img, upsample_factor=10
-        )
+        pixel_shift, confidence = register_translation(ref_img, img, upsample_factor=10)
 
         stage_shift = np.dot(pixel_shift, stagematrix)
         stage_shift[0] = -stage_shift[0]  # match TEM Coordinate system
@@ -380,7 +399,7 @@ class TEMController:
         z: float
             Optimized Z value for eucentric tilting
         """
-        from skimage.registration import phase_cross_correlation
+        from instamatic.processing.registration import register_translation
 
         def one_cycle(tilt: float = 5, sign=1) -> list:
             angle1 = -tilt * sign
@@ -394,7 +413,7 @@ class TEMController:
             if sign < 1:
                 img2, img1 = img1, img2
 
-            shift, error, phasediff = phase_cross_correlation(img1, img2, upsample_factor=10)
+            shift, confidence = register_translation(img1, img2, upsample_factor=10)
 
             return shift
 
@@ -601,6 +620,7 @@ class TEMController:
         plot: bool = False,
         verbose: bool = False,
         header_keys: Tuple[str] = 'all',
+        asynchronous: bool = None,
     ) -> Tuple[np.ndarray, dict]:
         """Retrieve image as numpy array from camera. If the exposure and
         binsize are not given, the default values are read from the config
@@ -620,6 +640,10 @@ class TEMController:
             Toggle whether to show the image using matplotlib after acquisition
         full_header: bool
             Return the full header
+        asynchronous: bool
+            Save the image in the background using the write queue, so that this function
+            returns immediately. Use `ctrl.flush()` to wait until all images have been written.
+            Defaults to `write_behind` in the settings.
 
         Returns
         -------
@@ -670,7 +694,15 @@ class TEMController:
             print(f'Image acquired - shape: {arr.shape}, size: {arr.nbytes / 1024:.0f} kB')
 
         if out:
-            write_tiff(out, arr, header=h)
+            if asynchronous is None:
+                asynchronous = config.settings.write_behind
+            compression = acquisition_compression()
+            if asynchronous:
+                get_write_queue().submit(write_tiff, out, arr, header=h, **compression)
+            else:
+                write_tiff(out, arr, header=h, **compression)
+            if config.settings.write_metadata_table:
+                append_metadata(Path(out).with_suffix('.tiff'), h)
 
         if plot:
             import matplotlib.pyplot as plt
@@ -761,7 +793,50 @@ class TEMController:
         self.from_dict(d)
         print(f"Microscope alignment restored from '{name}'")
 
+    def flush(self):
+        """Wait until all images saved in the background (see
+        `get_image(asynchronous=True)`) have been written to disk."""
+        flush_write_queue()
+
+    def start_telemetry(self, channels: list = None, interval: float = None, size: int = None):
+        """Start sampling the microscope state in the background, so that
+        experiments and the GUI can read it from `ctrl.telemetry` instead of
+        polling the microscope.
+
+        channels: list,
+            names of the channels to sample (see
+            `instamatic.microscope.telemetry.default_channels`), or a dict
+            of name: (getter, value names). If None, use all defaults.
+        interval: float,
+            time between samples (s), default: `config.settings.telemetry_interval`
+        size: int,
+            number of samples to keep for every channel
+
+        Returns:
+            the running `Telemetry` instance
+        """
+        from instamatic.microscope.telemetry import SIZE, Telemetry
+
+        if interval is None:
+            interval = config.settings.telemetry_interval
+
+        self.stop_telemetry()
+        self.telemetry = Telemetry(
+            self, channels=channels, interval=interval, size=size or SIZE
+        )
+        self.telemetry.start()
+        return self.telemetry
+
+    def stop_telemetry(self):
+        """Stop the background sampling started with `start_telemetry`."""
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+
     def close(self):
+        self.stop_telemetry()
+        self.stage.close()
+        self.flush()
         try:
             self.cam.close()
         except AttributeError:
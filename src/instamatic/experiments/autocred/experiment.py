@@ -25,7 +25,7 @@ from instamatic.calibrate.calibrate_imageshift12 import (
     Calibrate_Imageshift2,
     Calibrate_Stage,
 )
-from instamatic.calibrate.center_z import center_z_height_HYMethod
+from instamatic.calibrate.center_z import center_z_height_parallax
 from instamatic.calibrate.filenames import *
 from instamatic.experiments.experiment_base import ExperimentBase
 from instamatic.formats import write_tiff
@@ -45,14 +45,28 @@ from instamatic.tools import find_beam_center, find_defocused_image_center
 # offset = 15  # The number needs to be smaller when the contrast of the crystals is low.
 # imgvar_threshold = 600
 
-date = datetime.datetime.now().strftime('%Y-%m-%d')
-log_rotaterange = config.locations['logs'] / f'Rotrange_stagepos_{date}.log'
-log_iscalibs = config.locations['logs'] / f'ImageShift_LOGS_{date}'
-log_iscalibs.mkdir(exist_ok=True)
 
-if not os.path.isfile(log_rotaterange):
-    with open(log_rotaterange, 'a') as f:
-        f.write('x\ty\tz\trotation range\n')
+def get_log_rotaterange() -> Path:
+    """Return the log file for the rotation ranges of today, it is created
+    (with a header) on first use."""
+    date = datetime.datetime.now().strftime('%Y-%m-%d')
+    log_rotaterange = config.locations['logs'] / f'Rotrange_stagepos_{date}.log'
+
+    if not os.path.isfile(log_rotaterange):
+        with open(log_rotaterange, 'a') as f:
+            f.write('x\ty\tz\trotation range\n')
+
+    return log_rotaterange
+
+
+def get_log_iscalibs() -> Path:
+    """Return the directory for the image shift calibrations of today, it is
+    created on first use."""
+    date = datetime.datetime.now().strftime('%Y-%m-%d')
+    log_iscalibs = config.locations['logs'] / f'ImageShift_LOGS_{date}'
+    log_iscalibs.mkdir(exist_ok=True)
+    return log_iscalibs
+
 
 use_dials = config.settings.use_indexing_server_exe
 use_vm = config.settings.use_VM_server_exe
@@ -83,7 +97,7 @@ def load_IS_Calibrations(imageshift, ctrl, diff_defocus, logger, mode):
             with open(config.locations['logs'] / file, 'rb') as f:
                 transform_imgshift, c = pickle.load(f)
         else:
-            with open(log_iscalibs / file, 'rb') as f:
+            with open(get_log_iscalibs() / file, 'rb') as f:
                 transform_imgshift, c = pickle.load(f)
     except BaseException:
         print(
@@ -129,7 +143,7 @@ def load_IS_Calibrations(imageshift, ctrl, diff_defocus, logger, mode):
                 mag_calib = ctrl.magnification.value
                 s_calib = int(2500.0 / mag_calib * 1000)
                 transform_imgshift, c = Calibrate_Stage(ctrl, stepsize=s_calib, logger=logger)
-            with open(log_iscalibs / file, 'wb') as f:
+            with open(get_log_iscalibs() / file, 'wb') as f:
                 pickle.dump([transform_imgshift, c], f)
             satisfied = input(
                 f'{imageshift}, defocus = {diff_defocus} calibration done. \nPress Enter to continue. Press x to redo calibration.'
@@ -1014,7 +1028,7 @@ class Experiment(ExperimentBase):
                 file=f,
             )
 
-        with open(log_rotaterange, 'a') as f:
+        with open(get_log_rotaterange(), 'a') as f:
             f.write(f'{stageposx}\t{stageposy}\t{stageposz}\t{rotrange}\n')
 
         img_conv = ImgConversion(
@@ -1196,9 +1210,7 @@ class Experiment(ExperimentBase):
                         n_crystals = len(crystal_coords)
                         if n_crystals > 0:
                             self.print_and_del('centering z height...')
-                            x_zheight, y_zheight = center_z_height_HYMethod(
-                                self.ctrl, spread=self.spread, offset=self.offset
-                            )
+                            x_zheight, y_zheight = center_z_height_parallax(self.ctrl)
                             if x_zheight != 999999:
                                 xpoint, ypoint, zpoint, aaa, bbb = self.ctrl.stage.get()
                                 self.logger.info(
@@ -1675,9 +1687,7 @@ class Experiment(ExperimentBase):
                         self.print_and_del(
                             'Z-height needs to be updated every session. Readjusting z-height...'
                         )
-                        x_zheight, y_zheight = center_z_height_HYMethod(
-                            self.ctrl, spread=self.spread, offset=self.offset
-                        )
+                        x_zheight, y_zheight = center_z_height_parallax(self.ctrl)
                         xpoint, ypoint, zpoint, aaa, bbb = self.ctrl.stage.get()
                         self.logger.info(
                             f'Stage position: x = {xpoint}, y = {ypoint}. Z height adjusted to {zpoint}. Tilt angle x {aaa} deg, Tilt angle y {bbb} deg'
@@ -1690,9 +1700,7 @@ class Experiment(ExperimentBase):
                 input(
                     'No z-height adjustment found. Please find an area with particles! Press Enter to continue auto adjustment of z height>>>'
                 )
-                x_zheight, y_zheight = center_z_height_HYMethod(
-                    self.ctrl, spread=self.spread, offset=self.offset
-                )
+                x_zheight, y_zheight = center_z_height_parallax(self.ctrl)
                 xpoint, ypoint, zpoint, aaa, bbb = self.ctrl.stage.get()
                 self.logger.info(
                     f'Stage position: x = {xpoint}, y = {ypoint}. Z height adjusted to {zpoint}. Tilt angle x {aaa} deg, Tilt angle y {bbb} deg'
@@ -1702,9 +1710,7 @@ class Experiment(ExperimentBase):
                     pickle.dump(t, f)
         else:
             self.print_and_del('Z height adjusting...')
-            x_zheight, y_zheight = center_z_height_HYMethod(
-                self.ctrl, spread=self.spread, offset=self.offset
-            )
+            x_zheight, y_zheight = center_z_height_parallax(self.ctrl)
             xpoint, ypoint, zpoint, aaa, bbb = self.ctrl.stage.get()
             self.logger.info(
                 f'Stage position: x = {xpoint}, y = {ypoint}. Z height adjusted to {zpoint}. Tilt angle x {aaa} deg, Tilt angle y {bbb} deg'
@@ -11,7 +11,7 @@ import numpy as np
 import instamatic
 from instamatic import config
 from instamatic.experiments.experiment_base import ExperimentBase
-from instamatic.formats import write_tiff
+from instamatic.formats import acquisition_compression, write_tiff
 from instamatic.processing.ImgConversionTPX import ImgConversionTPX as ImgConversion
 
 # degrees to rotate before activating data collection procedure
@@ -463,7 +463,8 @@ class Experiment(ExperimentBase):
         if buffer:
             drc = self.path / 'tiff_image'
             drc.mkdir(exist_ok=True)
+            compression = acquisition_compression()
             while len(buffer) != 0:
                 i, img, h = buffer.pop(0)
                 fn = drc / f'{i:05d}.tiff'
-                write_tiff(fn, img, header=h)
+                write_tiff(fn, img, header=h, **compression)
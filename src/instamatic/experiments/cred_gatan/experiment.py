@@ -13,6 +13,7 @@ import instamatic
 from instamatic import config
 from instamatic.experiments.experiment_base import ExperimentBase
 from instamatic.formats import write_tiff
+from instamatic.microscope.telemetry import Telemetry
 
 
 class Experiment(ExperimentBase):
@@ -212,6 +213,11 @@ class Experiment(ExperimentBase):
 
         self.cam.start_record()  # start recording
 
+        # the stage is sampled in the background, instead of being polled in this loop
+        telemetry = Telemetry(
+            self.ctrl, channels=['stage'], interval=config.settings.telemetry_interval
+        )
+
         t0 = time.perf_counter()
         t_delta = t0
 
@@ -219,45 +225,49 @@ class Experiment(ExperimentBase):
 
         print('Acquiring data...')
 
-        while True:
-            t = time.perf_counter()
-
-            if not manual_control:
-                if abs(self.ctrl.stage.a - target_angle) < angle_tolerance:
-                    print('Target angle reached!')
-                    break
-
-            if t - t_delta > interval:
-                n += 1
-                x, y, z, a, _ = pos = self.ctrl.stage.get()
-                self.stage_positions.append((t, pos))
-                t_delta = t
-                # print(t, pos)
-
-                if manual_control:
-                    current_angle = a
-                    if last_angle == current_angle:
-                        print(
-                            f'Manual rotation was interrupted (current: {current_angle:.2f} | last {last_angle:.2f})'
-                        )
+        with telemetry:
+            while True:
+                telemetry.wait_for_sample(timeout=1.0)
+                t, pos = telemetry.latest('stage')
+
+                if pos is not None:
+                    x, y, z, a, _ = pos = tuple(pos)
+
+                    if not manual_control:
+                        if abs(a - target_angle) < angle_tolerance:
+                            print('Target angle reached!')
+                            break
+
+                    if t - t_delta > interval:
+                        n += 1
+                        self.stage_positions.append((t, pos))
+                        t_delta = t
+                        # print(t, pos)
+
+                        if manual_control:
+                            current_angle = a
+                            if last_angle == current_angle:
+                                print(
+                                    f'Manual rotation was interrupted (current: {current_angle:.2f} | last {last_angle:.2f})'
+                                )
+                                break
+                            last_angle = current_angle
+
+                            print(f' >> Current angle: {a:.2f}', end='      \r')
+
+                        if self.track:
+                            self.track_crystal(n=n, angle=a)
+
+                # Stop/interrupt and go to next crystal
+                if msvcrt.kbhit():
+                    key = msvcrt.getch().decode()
+                    if key == ' ':
+                        print('Stopping the stage!')
+                        self.ctrl.stage.stop()
                         break
-                    last_angle = current_angle
-
-                    print(f' >> Current angle: {a:.2f}', end='      \r')
-
-                if self.track:
-                    self.track_crystal(n=n, angle=a)
-
-            # Stop/interrupt and go to next crystal
-            if msvcrt.kbhit():
-                key = msvcrt.getch().decode()
-                if key == ' ':
-                    print('Stopping the stage!')
-                    self.ctrl.stage.stop()
-                    break
-                if key == 'q':
-                    self.ctrl.stage.stop()
-                    raise InterruptedError('Data collection was interrupted!')
+                    if key == 'q':
+                        self.ctrl.stage.stop()
+                        raise InterruptedError('Data collection was interrupted!')
 
         t1 = time.perf_counter()
         self.cam.stop_record()
@@ -10,7 +10,7 @@ from tqdm.auto import tqdm
 
 from instamatic import config
 from instamatic.experiments.experiment_base import ExperimentBase
-from instamatic.formats import write_tiff
+from instamatic.formats import acquisition_compression, write_tiff
 from instamatic.processing.ImgConversionTPX import ImgConversionTPX as ImgConversion
 
 
@@ -90,7 +90,7 @@ class Experiment(ExperimentBase):
         if image_mode != 'diff':
             fn = self.tiff_image_path / f'image_{self.offset}.tiff'
             img, h = self.ctrl.get_image(exposure_time / 5)
-            write_tiff(fn, img, header=h)
+            write_tiff(fn, img, header=h, **acquisition_compression())
             ctrl.mode.set('diff')
             time.sleep(1.0)  # add some delay to account for beam lag
 
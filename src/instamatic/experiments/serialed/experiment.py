@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 import logging
 import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -15,6 +16,57 @@ from instamatic.experiments.experiment_base import ExperimentBase
 from instamatic.formats import *
 from instamatic.processing.find_crystals import find_crystals, find_crystals_timepix
 from instamatic.processing.flatfield import apply_flatfield_correction, remove_deadpixels
+from instamatic.route import optimize_route, print_route_report, route_report
+
+# flatfield and dead pixels of the worker process, set once by `init_worker`
+_flatfield = None
+_deadpixels = None
+
+
+def init_worker(flatfield=None, deadpixels=None):
+    """Store the flatfield and dead pixels in the worker process, so that
+    they are not sent along with every image."""
+    global _flatfield, _deadpixels
+    _flatfield = flatfield
+    _deadpixels = deadpixels
+
+
+def process_image(
+    img,
+    magnification,
+    spread=0.6,
+    binsize=1,
+    timepix=False,
+    flatfield=None,
+    deadpixels=None,
+):
+    """Apply the flatfield correction to the image, and locate the crystals.
+
+    This can run in a worker process during data collection, so it must not
+    communicate with the microscope. If no flatfield is given, the one set
+    with `init_worker` is used.
+
+    Returns the header items describing the corrections, and the crystal
+    positions (in unbinned pixel coordinates). The corrected image itself is
+    not returned, to keep the data sent back from the worker small.
+    """
+    if flatfield is None:
+        flatfield, deadpixels = _flatfield, _deadpixels
+
+    h = {}
+    if flatfield is not None:
+        img = remove_deadpixels(img, deadpixels=deadpixels)
+        h['DeadPixelCorrection'] = True
+        img = apply_flatfield_correction(img, flatfield=flatfield)
+        h['FlatfieldCorrection'] = True
+
+    func = find_crystals_timepix if timepix else find_crystals
+    crystal_positions = [
+        crystal._replace(x=crystal.x * binsize, y=crystal.y * binsize)
+        for crystal in func(img, magnification, spread=spread)
+    ]
+
+    return h, crystal_positions
 
 
 def make_grid_on_stage(startpoint, endpoint, padding=2.0):
@@ -257,7 +309,13 @@ class Experiment(ExperimentBase):
         self.change_spotsize = self.diff_spotsize != self.image_spotsize
         self.crystal_spread = kwargs.get('crystal_spread', 0.6)
 
-        if self.ctrl.cam.name == 'timepix':
+        # locate crystals in a worker process, while the main thread changes the spot size;
+        # sending the image costs a few ms, set `pipeline: False` to run it in-process
+        self.pipeline = kwargs.get('pipeline', True)
+        self.executor = None
+
+        self.timepix = self.ctrl.cam.name == 'timepix'
+        if self.timepix:
             self.find_crystals = find_crystals_timepix
             self.flatfield = kwargs.get('flatfield', 'flatfield.tiff')
         else:
@@ -290,6 +348,14 @@ class Experiment(ExperimentBase):
         )
         self.offsets = offsets * 1000
 
+        # index of every position in the original grid, used to number the images
+        self.offset_index = np.arange(len(self.offsets))
+        if kwargs.get('optimize_route', False):
+            self.offset_index = optimize_route(self.offsets, start=(0, 0))
+            report = route_report(self.offsets, self.offset_index, start=(0, 0))
+            print_route_report(report)
+            self.offsets = self.offsets[self.offset_index]
+
         # store kwargs to experiment drc
         kwargs['diff_brightness'] = self.diff_brightness
         kwargs['diff_cameralength'] = self.diff_cameralength
@@ -401,7 +467,7 @@ class Experiment(ExperimentBase):
             center_x, center_y = scan_center
 
             t = tqdm(self.offsets, desc='                           ')
-            for j, (x_offset, y_offset) in enumerate(t):
+            for j, (x_offset, y_offset) in zip(self.offset_index, t):
                 x = center_x + x_offset
                 y = center_y + y_offset
                 try:
@@ -417,7 +483,7 @@ class Experiment(ExperimentBase):
 
                     dct = {
                         'exp_scan_number': i,
-                        'exp_image_number': j,
+                        'exp_image_number': int(j),
                         'exp_scan_offset': (x_offset, y_offset),
                         'exp_scan_center': (center_x, center_y),
                         'exp_stage_position': (x, y),
@@ -441,18 +507,21 @@ class Experiment(ExperimentBase):
         self.diffraction_mode()
         beamshift_coords = self.calib_beamshift.pixelcoord_to_beamshift(crystal_coords)
 
+        # compensate beamshift, converted for all crystals at once (beamshift -> diffshift)
+        beamshift_offsets = beamshift_coords - self.neutral_beamshift
+        beamshift_to_diffshift = self.calib_directbeam.conversion('BeamShift', 'DiffShift')
+        diffshift_offsets = beamshift_to_diffshift.forward(beamshift_offsets)
+        diffshifts = self.neutral_diffshift - diffshift_offsets
+
         t = tqdm(beamshift_coords, desc='                           ')
 
         for k, beamshift in enumerate(t):
             # self.log.debug("Diffraction: crystal %d/%d", k+1, ncrystals)
             self.ctrl.beamshift.set(*beamshift)
 
-            # compensate beamshift
-            beamshift_offset = beamshift - self.neutral_beamshift
-            pixelshift = self.calib_directbeam.beamshift2pixelshift(beamshift_offset)
-
-            diffshift_offset = self.calib_directbeam.pixelshift2diffshift(pixelshift)
-            diffshift = self.neutral_diffshift - diffshift_offset
+            beamshift_offset = beamshift_offsets[k]
+            diffshift_offset = diffshift_offsets[k]
+            diffshift = diffshifts[k]
 
             self.ctrl.diffshift.set(*diffshift.astype(int))
 
@@ -477,34 +546,54 @@ class Experiment(ExperimentBase):
             h['FlatfieldCorrection'] = True
         return img, h
 
-    def run(self, ctrl=None, **kwargs):
-        """Run serial electron diffraction experiment."""
+    def write_image(self, outfile, img, header):
+        """Apply the corrections to `img` and write it to `outfile` (hdf5).
 
-        self.initialize_microscope()
+        Called from the write queue, so that the microscope does not
+        have to wait for it.
+        """
+        img, header = self.apply_corrections(img, header)
+        write_hdf5(outfile, img, header=header, **acquisition_compression())
+        if config.settings.write_metadata_table:
+            append_metadata(outfile.with_suffix('.h5'), header)
+
+    def start_executor(self):
+        """Start the worker process for `submit_image`, the flatfield is sent
+        to it once."""
+        deadpixels = self.deadpixels if self.flatfield is not None else None
+        self.executor = ProcessPoolExecutor(
+            max_workers=1, initializer=init_worker, initargs=(self.flatfield, deadpixels)
+        )
 
-        header_keys = kwargs.get('header_keys', None)
+    def submit_image(self, img):
+        """Start locating the crystals in `img`. Runs in the worker process
+        if the pipeline is enabled.
 
-        d_image = {
-            'exp_neutral_diffshift': self.neutral_beamshift,
-            'exp_neutral_beamshift': self.neutral_diffshift,
-            'exp_image_spotsize': self.image_spotsize,
-            'exp_magnification': self.magnification,
-            'ImageDimensions': self.image_dimensions,
-        }
-        d_diff = {
-            'exp_neutral_diffshift': self.neutral_beamshift,
-            'exp_neutral_beamshift': self.neutral_diffshift,
-            'exp_diff_brightness': self.diff_brightness,
-            'exp_diff_spotsize': self.diff_spotsize,
-            'exp_diff_cameralength': self.diff_cameralength,
-            'exp_diff_difffocus': self.diff_difffocus,
-            'ImagePixelsize': self.diff_pixelsize,
+        Returns a future with the result of `process_image`.
+        """
+        args = (img, self.magnification)
+        kwargs = {
+            'spread': self.crystal_spread,
+            'binsize': self.image_binsize,
+            'timepix': self.timepix,
         }
 
-        self.log.info('d_image', d_image)
-        self.log.info('d_tiff', d_diff)
+        if self.executor is not None:
+            return self.executor.submit(process_image, *args, **kwargs)
 
-        input("\nPress <ENTER> to start experiment ('Ctrl-C' to interrupt)\n")
+        if self.flatfield is not None:
+            kwargs['flatfield'] = self.flatfield
+            kwargs['deadpixels'] = self.deadpixels
+
+        future = Future()
+        future.set_result(process_image(*args, **kwargs))
+        return future
+
+    def collect(self, header_keys=None, d_image=None, d_diff=None):
+        """Loop over all positions, find crystals, and collect a diffraction
+        pattern of each of them."""
+        d_image = d_image or {}
+        d_diff = d_diff or {}
 
         for i, d_pos in enumerate(self.loop_positions()):
             outfile = self.imagedir / f'image_{i:04d}'
@@ -518,29 +607,30 @@ class Experiment(ExperimentBase):
                 header_keys=header_keys,
             )
 
+            im_mean = img.mean()
+            is_dark = im_mean < self.image_threshold
+            if not is_dark:
+                processing = self.submit_image(img)
+
             if self.change_spotsize:
                 self.ctrl.tem.setSpotSize(self.image_spotsize)
 
             self.ctrl.tem.setSpotSize(self.diff_spotsize)
 
-            im_mean = img.mean()
-            if im_mean < self.image_threshold:
+            if is_dark:
                 # self.log.debug("Dark image detected (mean=%f)", im_mean)
                 continue
 
-            img, h = self.apply_corrections(img, h)
-
-            crystal_positions = (
-                self.find_crystals(img, self.magnification, spread=self.crystal_spread)
-                * self.image_binsize
-            )
+            _, crystal_positions = processing.result()
             crystal_coords = [(crystal.x, crystal.y) for crystal in crystal_positions]
 
             for d in (d_image, d_pos):
                 h.update(d)
             h['exp_crystal_coords'] = crystal_coords
 
-            write_hdf5(outfile, img, header=h)
+            # the corrections are applied again by the write queue, so that the
+            # corrected image does not have to be sent back from the worker
+            self.write_queue.submit(self.write_image, outfile, img, header=h)
 
             ncrystals = len(crystal_coords)
             if ncrystals == 0:
@@ -557,7 +647,6 @@ class Experiment(ExperimentBase):
                     comment=comment,
                     header_keys=header_keys,
                 )
-                img, h = self.apply_corrections(img, h)
 
                 for d in (d_diff, d_pos, d_cryst):
                     h.update(d)
@@ -571,7 +660,7 @@ class Experiment(ExperimentBase):
                 # quality = neural_network.predict(img_processed)
                 # h["crystal_quality"] = quality
 
-                write_hdf5(outfile, img, header=h)
+                self.write_queue.submit(self.write_image, outfile, img, header=h)
 
                 if self.sample_rotation_angles:
                     for rotation_angle in self.sample_rotation_angles:
@@ -585,17 +674,62 @@ class Experiment(ExperimentBase):
                             comment=comment,
                             header_keys=header_keys,
                         )
-                        img, h = self.apply_corrections(img, h)
 
                         for d in (d_diff, d_pos, d_cryst):
                             h.update(d)
 
-                        write_hdf5(outfile, img, header=h)
+                        self.write_queue.submit(self.write_image, outfile, img, header=h)
 
                     self.ctrl.stage.a = 0
 
             self.image_mode()
 
+    def run(self, ctrl=None, **kwargs):
+        """Run serial electron diffraction experiment."""
+
+        self.initialize_microscope()
+
+        header_keys = kwargs.get('header_keys', None)
+
+        d_image = {
+            'exp_neutral_diffshift': self.neutral_beamshift,
+            'exp_neutral_beamshift': self.neutral_diffshift,
+            'exp_image_spotsize': self.image_spotsize,
+            'exp_magnification': self.magnification,
+            'ImageDimensions': self.image_dimensions,
+        }
+        d_diff = {
+            'exp_neutral_diffshift': self.neutral_beamshift,
+            'exp_neutral_beamshift': self.neutral_diffshift,
+            'exp_diff_brightness': self.diff_brightness,
+            'exp_diff_spotsize': self.diff_spotsize,
+            'exp_diff_cameralength': self.diff_cameralength,
+            'exp_diff_difffocus': self.diff_difffocus,
+            'ImagePixelsize': self.diff_pixelsize,
+        }
+
+        self.log.info('d_image', d_image)
+        self.log.info('d_tiff', d_diff)
+
+        input("\nPress <ENTER> to start experiment ('Ctrl-C' to interrupt)\n")
+
+        # images are written in the background, so that the disk does not slow down the scan
+        self.write_queue = get_write_queue()
+
+        # The microscope is only ever controlled from this thread. With `pipeline`, crystal
+        # finding runs in a worker process and is started as soon as the image is
+        # available, so that it overlaps with the spot size changes for this position.
+        if self.pipeline:
+            self.start_executor()
+
+        try:
+            self.collect(header_keys=header_keys, d_image=d_image, d_diff=d_diff)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+            self.write_queue.flush()
+
         print('\n\nData collection finished.')
 
     def start_collection(self, ctrl=None, **kwargs):
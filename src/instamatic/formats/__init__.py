@@ -4,17 +4,34 @@ import os
 import warnings
 from pathlib import Path
 
-import h5py
 import numpy as np
-import tifffile
 import yaml
 
 from .adscimage import read_adsc, write_adsc
+from .collection import ImageCollection
+from .compression import (
+    acquisition_compression,
+    hdf5_compression_kwargs,
+    tiff_compression_kwargs,
+)
 from .csvIO import read_csv, read_ycsv, write_csv, write_ycsv
+from .metadata import MetadataTable, append_metadata, get_metadata_table, read_metadata
 from .mrc import read_image as read_mrc
 from .mrc import write_image as write_mrc
+from .tiffstack import (
+    TiffStackReader,
+    TiffStackWriter,
+    load_header,
+    read_tiff_stack,
+    write_tiff_stack,
+)
+from .writequeue import WriteError, WriteQueue, flush_write_queue, get_write_queue
 from .xdscbf import write as write_cbf
 
+# The C-accelerated yaml classes are drop-in replacements, use them if libyaml is available
+YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+YamlLoader = getattr(yaml, 'CLoader', yaml.Loader)
+
 
 def read_image(fname: str) -> (np.array, dict):
     """Guess filetype by extension."""
@@ -34,7 +51,9 @@ def read_image(fname: str) -> (np.array, dict):
     return img, h
 
 
-def write_tiff(fname: str, data, header: dict = None):
+def write_tiff(
+    fname: str, data, header: dict = None, compression: str = None, level: int = None
+):
     """Simple function to write a tiff file.
 
     fname: str,
@@ -44,16 +63,27 @@ def write_tiff(fname: str, data, header: dict = None):
     header: dict,
         dictionary containing the metadata that should be saved
         key/value pairs are stored as yaml in the TIFF ImageDescription tag
+    compression: str,
+        compress the image data, i.e. 'zlib' or 'zstd' (see `formats.compression`)
+    level: int,
+        compression level
     """
     if isinstance(header, dict):
-        header = yaml.dump(header)
+        header = yaml.dump(header, Dumper=YamlDumper)
     if not header:
         header = ''
 
+    import tifffile
+
     fname = Path(fname).with_suffix('.tiff')
 
     with tifffile.TiffWriter(fname) as f:
-        f.write(data=data, software='instamatic', description=header)
+        f.write(
+            data=data,
+            software='instamatic',
+            description=header,
+            **tiff_compression_kwargs(compression, level),
+        )
 
 
 def read_tiff(fname: str) -> (np.array, dict):
@@ -66,13 +96,19 @@ def read_tiff(fname: str) -> (np.array, dict):
         image: np.ndarray, header: dict
             a tuple of the image as numpy array and dictionary with all the tem parameters and image attributes
     """
+    import tifffile
+
     tiff = tifffile.TiffFile(fname)
 
     page = tiff.pages[0]
     img = page.asarray()
 
     if page.software == 'instamatic':
-        header = yaml.load(page.tags['ImageDescription'].value, Loader=yaml.Loader)
+        description = page.tags['ImageDescription'].value
+        if description.startswith('{'):
+            header = load_header(description)
+        else:
+            header = yaml.load(description, Loader=YamlLoader)
     elif tiff.is_tvips:
         header = tiff.tvips_metadata
     else:
@@ -81,7 +117,9 @@ def read_tiff(fname: str) -> (np.array, dict):
     return img, header
 
 
-def write_hdf5(fname: str, data, header: dict = None):
+def write_hdf5(
+    fname: str, data, header: dict = None, compression: str = None, level: int = None
+):
     """Simple function to write data to hdf5 format using h5py.
 
     fname: str,
@@ -91,11 +129,17 @@ def write_hdf5(fname: str, data, header: dict = None):
     header: dict,
         dictionary containing the metadata that should be saved
         key/value pairs are stored as attributes on the data
+    compression: str,
+        compress the image data, i.e. 'gzip', 'lzf' or 'bitshuffle' (see `formats.compression`)
+    level: int,
+        compression level
     """
+    import h5py
+
     fname = Path(fname).with_suffix('.h5')
 
     f = h5py.File(fname, 'w')
-    h5data = f.create_dataset('data', data=data)
+    h5data = f.create_dataset('data', data=data, **hdf5_compression_kwargs(compression, level))
     if header:
         h5data.attrs.update(header)
     f.close()
@@ -111,6 +155,8 @@ def read_hdf5(fname: str) -> (np.array, dict):
         image: np.ndarray, header: dict
             a tuple of the image as numpy array and dictionary with all the tem parameters and image attributes
     """
+    import h5py
+
     if not os.path.exists(fname):
         raise FileNotFoundError(f"No such file: '{fname}'")
 
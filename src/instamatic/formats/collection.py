@@ -0,0 +1,309 @@
+"""Lazy access to collections of images.
+
+`ImageCollection` gives a uniform, list-like view over a set of images,
+regardless of whether they are stored as individual files, a TIFF stack,
+an MRC stack or a 3D dataset in an HDF5 file. Images are only read when
+they are accessed, and kept in a bounded LRU cache. When iterating, the
+next few images are read ahead in a thread pool, so that reading overlaps
+with processing.
+
+Usage:
+    images = ImageCollection('images/*.tiff')
+    img = images[0]
+    img, h = images.get(0)
+
+    for img in images[10:20]:
+        ...
+"""
+
+from __future__ import annotations
+
+import glob
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .tiffstack import index_filename
+
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.h5', '.hdf5', '.img', '.smv', '.mrc')
+
+
+class FileListSource:
+    """Every image is stored in a separate file."""
+
+    def __init__(self, fns: list):
+        self.fns = [Path(fn) for fn in fns]
+
+    def __len__(self):
+        return len(self.fns)
+
+    def read(self, i: int) -> (np.array, dict):
+        from instamatic.formats import read_image
+
+        return read_image(self.fns[i])
+
+
+class TiffStackSource:
+    """Images stored as pages of a multi-page TIFF file."""
+
+    def __init__(self, fname: str):
+        from .tiffstack import TiffStackReader
+
+        self.reader = TiffStackReader(fname)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.reader)
+
+    def read(self, i: int) -> (np.array, dict):
+        with self._lock:
+            return self.reader.read(i)
+
+
+class MRCStackSource:
+    """Images stored as sections of an MRC stack, i.e. from SerialEM
+    (memory mapped)."""
+
+    def __init__(self, fname: str):
+        import mrcfile
+
+        self.mrc = mrcfile.mmap(fname, mode='r')
+        data = self.mrc.data
+        self.data = data if data.ndim == 3 else data[np.newaxis]
+
+    def __len__(self):
+        return len(self.data)
+
+    def read(self, i: int) -> (np.array, dict):
+        return np.array(self.data[i]), {}
+
+
+class HDF5StackSource:
+    """Images stored along the first axis of a 3D dataset in an HDF5
+    file."""
+
+    def __init__(self, fname: str, dataset: str = 'data'):
+        import h5py
+
+        self.h5 = h5py.File(fname, 'r')
+        self.data = self.h5[dataset]
+        self.header = dict(self.data.attrs)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data) if self.data.ndim == 3 else 1
+
+    def read(self, i: int) -> (np.array, dict):
+        with self._lock:
+            img = self.data[i] if self.data.ndim == 3 else self.data[()]
+        return img, self.header
+
+
+def get_source(source):
+    """Figure out how to read `source`, which can be a list of filenames, a
+    directory, a glob pattern or a stack file (.mrc, .h5, or a TIFF stack
+    with index)."""
+    if isinstance(source, (list, tuple)):
+        return FileListSource(source)
+
+    source = Path(source)
+    ext = source.suffix.lower()
+
+    if source.is_dir():
+        fns = sorted(fn for fn in source.iterdir() if fn.suffix.lower() in IMAGE_EXTENSIONS)
+        return FileListSource(fns)
+    elif source.exists() and ext == '.mrc':
+        return MRCStackSource(source)
+    elif source.exists() and ext in ('.h5', '.hdf5'):
+        return HDF5StackSource(source)
+    elif ext in ('.tif', '.tiff') and index_filename(source).exists():
+        return TiffStackSource(source)
+    else:
+        fns = sorted(glob.glob(str(source)))
+        if not fns:
+            raise OSError(f'No images found: {source}')
+        return FileListSource(fns)
+
+
+class LRUCache:
+    """Thread-safe cache for images, bounded by number of items and memory.
+
+    maxsize: int,
+        maximum number of images to keep
+    maxbytes: int,
+        maximum total size of the cached images in bytes (optional)
+    """
+
+    def __init__(self, maxsize: int = 32, maxbytes: int = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        img, _ = value
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = value
+            self.nbytes += img.nbytes
+            while self._items and (
+                len(self._items) > self.maxsize
+                or (self.maxbytes is not None and self.nbytes > self.maxbytes)
+            ):
+                _, (old, _) = self._items.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+class ImageCollection:
+    """List-like, lazily loaded collection of images.
+
+    Indexing with an integer returns the image, indexing with a slice (or a
+    list of indices) returns a new collection (view) that shares the cache
+    and the background threads with the collection it was taken from.
+
+    source: str or list,
+        list of filenames, directory, glob pattern, or stack file (.mrc/.h5/.tiff)
+    cache_size: int,
+        maximum number of images to keep in memory
+    cache_bytes: int,
+        maximum memory used by the cache in bytes (optional)
+    prefetch: int,
+        number of images to read ahead in the background when an image is accessed
+    workers: int,
+        number of threads used for reading ahead
+    """
+
+    def __init__(
+        self,
+        source,
+        cache_size: int = 32,
+        cache_bytes: int = None,
+        prefetch: int = 4,
+        workers: int = 2,
+    ):
+        self.source = get_source(source)
+        self.indices = np.arange(len(self.source))
+        self.prefetch = prefetch
+
+        self._cache = LRUCache(maxsize=cache_size, maxbytes=cache_bytes)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        # the collection that owns the threads, views only refer to it
+        self._root = self
+        self._pool = ThreadPoolExecutor(max_workers=workers) if prefetch > 0 else None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.source.__class__.__name__}, n={len(self)})'
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return self.get(i)[0]
+
+        view = object.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        del view._pool
+        view.indices = self.indices[i]
+        return view
+
+    @property
+    def _executor(self):
+        return self._root._pool
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self),) + self[0].shape
+
+    @property
+    def filenames(self) -> list:
+        """List of filenames, if the collection consists of separate
+        files."""
+        return [self.source.fns[j] for j in self.indices]
+
+    def _load(self, j: int) -> (np.array, dict):
+        try:
+            value = self.source.read(j)
+            self._cache.put(j, value)
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(j, None)
+
+    def _submit(self, j: int):
+        """Schedule reading image `j` in the background, returns the
+        future."""
+        with self._lock:
+            future = self._pending.get(j)
+            if future is None and j not in self._cache:
+                future = self._pending[j] = self._executor.submit(self._load, j)
+        return future
+
+    def get(self, i: int) -> (np.array, dict):
+        """Return image `i` and its header."""
+        if i < 0:
+            i += len(self)
+        j = int(self.indices[i])
+
+        value = self._cache.get(j)
+        if value is None:
+            future = self._submit(j) if self._executor else None
+            if future is not None:
+                value = future.result()
+            else:
+                value = self._cache.get(j) or self._load(j)
+
+        if self._executor:
+            for k in self.indices[i + 1 : i + 1 + self.prefetch]:
+                self._submit(int(k))
+
+        return value
+
+    def header(self, i: int) -> dict:
+        """Return the header of image `i`."""
+        return self.get(i)[1]
+
+    def asarray(self) -> np.array:
+        """Read all images into a single (N, H, W) array."""
+        return np.stack(list(self))
+
+    def close(self):
+        """Stop the background threads and clear the cache. Closing a view
+        does nothing, the resources belong to the collection it was taken
+        from."""
+        if self._root is not self:
+            return
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._cache.clear()
@@ -0,0 +1,126 @@
+"""Compression settings for the TIFF and HDF5 writers.
+
+Diffraction patterns, in particular from counting detectors, are sparse
+and compress very well. The writers in `instamatic.formats` accept a
+`compression` argument which is translated here to the arguments that
+tifffile and h5py expect.
+
+The `zlib`/`gzip` (TIFF/HDF5) and `lzf` (HDF5) codecs are always
+available. The fast `zstd`, `lz4`, `blosc` and `bitshuffle` codecs are
+optional: for TIFF they require `imagecodecs`, for HDF5 they require
+`hdf5plugin`.
+
+Images written during data collection are compressed according to
+`image_compression` and `compression_level` in `settings.yaml`, see
+`acquisition_compression`.
+"""
+
+from __future__ import annotations
+
+TIFF_CODECS = ('zlib', 'zstd', 'lz4', 'lzma', 'packbits')
+HDF5_CODECS = ('gzip', 'lzf', 'zstd', 'lz4', 'blosc', 'bitshuffle')
+
+# codecs that need imagecodecs to be installed to be written by tifffile
+_TIFF_IMAGECODECS = ('zstd', 'lz4')
+
+_ALIASES = {'deflate': 'zlib', 'gzip': 'zlib'}
+
+
+def _check_codec(compression: str, codecs: tuple, fmt: str) -> str:
+    compression = compression.lower()
+    if compression not in codecs:
+        raise ValueError(
+            f'Unknown compression for {fmt}: {compression!r}, choose from {", ".join(codecs)}'
+        )
+    return compression
+
+
+def acquisition_compression() -> dict:
+    """Return the `compression` and `level` arguments for the images written
+    during data collection, from `image_compression` and
+    `compression_level` in `settings.yaml`."""
+    from instamatic import config
+
+    return {
+        'compression': config.settings.image_compression or None,
+        'level': config.settings.compression_level,
+    }
+
+
+def tiff_compression_kwargs(
+    compression: str = None, level: int = None, workers: int = None
+) -> dict:
+    """Return keyword arguments for `tifffile.TiffWriter.write`.
+
+    compression: str,
+        name of the codec, one of `TIFF_CODECS` (None for no compression)
+    level: int,
+        compression level, uses the default for the codec if not given
+    workers: int,
+        number of threads used to compress the image, which is split
+        into strips/tiles for this purpose
+    """
+    if not compression:
+        return {}
+
+    compression = _ALIASES.get(compression.lower(), compression)
+    compression = _check_codec(compression, TIFF_CODECS, 'TIFF')
+
+    if compression in _TIFF_IMAGECODECS:
+        try:
+            import imagecodecs  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                f'Writing {compression!r} compressed TIFF files requires `imagecodecs`'
+            ) from None
+
+    kwargs = {'compression': compression}
+    if level is not None:
+        kwargs['compressionargs'] = {'level': level}
+    if workers:
+        kwargs['maxworkers'] = workers
+        # split the image into strips so they can be compressed in parallel
+        kwargs['rowsperstrip'] = 64
+    return kwargs
+
+
+def hdf5_compression_kwargs(compression: str = None, level: int = None) -> dict:
+    """Return keyword arguments for `h5py.Group.create_dataset`.
+
+    compression: str,
+        name of the codec, one of `HDF5_CODECS` (None for no compression)
+    level: int,
+        compression level, uses the default for the codec if not given
+    """
+    if not compression:
+        return {}
+
+    compression = compression.lower()
+    if compression == 'zlib':
+        compression = 'gzip'
+    compression = _check_codec(compression, HDF5_CODECS, 'HDF5')
+
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': level}
+    elif compression == 'lzf':
+        return {'compression': 'lzf'}
+
+    try:
+        import hdf5plugin
+    except ImportError:
+        raise ImportError(
+            f'Writing {compression!r} compressed HDF5 files requires `hdf5plugin`'
+        ) from None
+
+    if compression == 'zstd':
+        filt = hdf5plugin.Zstd(clevel=level or 3)
+    elif compression == 'lz4':
+        filt = hdf5plugin.LZ4()
+    elif compression == 'blosc':
+        filt = hdf5plugin.Blosc(
+            cname='lz4', clevel=level or 5, shuffle=hdf5plugin.Blosc.BITSHUFFLE
+        )
+    elif compression == 'bitshuffle':
+        filt = hdf5plugin.Bitshuffle(cname='lz4')
+
+    return dict(filt)
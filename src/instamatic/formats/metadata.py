@@ -0,0 +1,164 @@
+"""Per-directory metadata table for image headers.
+
+Every image written by Instamatic embeds its header, but reading back the
+stage positions or comments of a large data set then means opening every
+single file. Instead, the headers are also appended as a row to a table
+(`metadata.jsonl`, one JSON record per line) in the directory of the image,
+which can be loaded as a pandas DataFrame without touching the images.
+
+Nested dictionaries in the headers are flattened to columns with a `.`
+separator (e.g. `StagePosition.x`).
+
+Usage:
+    append_metadata('images/image_0001.tiff', h)
+
+    df = read_metadata('images')
+    df['StagePosition.x']
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+
+from .tiffstack import _json_default
+
+METADATA_FILENAME = 'metadata.jsonl'
+
+
+class MetadataTable:
+    """Append-only table of image headers stored in directory `drc`.
+
+    drc: str,
+        directory containing the images, the table is stored as `drc/metadata.jsonl`
+    """
+
+    def __init__(self, drc: str):
+        self.drc = Path(drc)
+        self.path = self.drc / METADATA_FILENAME
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({str(self.drc)!r})'
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def append(self, fname: str, header: dict) -> None:
+        """Append the header belonging to image `fname` to the table."""
+        record = {'filename': Path(fname).name}
+        record.update(header)
+        line = json.dumps(record, separators=(',', ':'), default=_json_default)
+
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+    def records(self) -> list:
+        """Return the raw list of header records.
+
+        If an image occurs more than once, the last record is kept.
+        """
+        if not self.exists():
+            return []
+
+        with self._lock:
+            with open(self.path) as f:
+                lines = f.readlines()
+
+        records = {}
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # incomplete line, i.e. from an interrupted write
+                continue
+            records[record['filename']] = record
+
+        return list(records.values())
+
+    def read(self) -> 'pd.DataFrame':
+        """Return the table as a DataFrame indexed by the absolute filename."""
+        import pandas as pd
+
+        records = self.records()
+        df = pd.json_normalize(records)
+        if df.empty:
+            return pd.DataFrame(index=pd.Index([], name='filename'))
+
+        df['filename'] = [str((self.drc / fn).absolute()) for fn in df['filename']]
+        return df.set_index('filename')
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_metadata_table(drc: str) -> MetadataTable:
+    """Return the (shared) metadata table for directory `drc`."""
+    key = Path(drc).absolute()
+    with _tables_lock:
+        try:
+            table = _tables[key]
+        except KeyError:
+            table = _tables[key] = MetadataTable(key)
+    return table
+
+
+def append_metadata(fname: str, header: dict) -> None:
+    """Add the header of image `fname` to the metadata table in its
+    directory."""
+    fname = Path(fname)
+    get_metadata_table(fname.parent).append(fname, header)
+
+
+def read_metadata(source, update: bool = True) -> 'pd.DataFrame':
+    """Read image headers as a DataFrame indexed by the absolute filename.
+
+    source: str or list,
+        directory containing a metadata table, or a list of image filenames.
+        For a list of filenames, the headers of images missing from the table
+        are read from the image files instead.
+    update: bool,
+        add headers that had to be read from the image files to the metadata
+        table, so that they are available next time
+    """
+    import pandas as pd
+
+    from instamatic.formats import read_image
+
+    if isinstance(source, (str, Path)):
+        return get_metadata_table(source).read()
+
+    fns = [Path(fn).absolute() for fn in source]
+
+    frames = []
+    for drc in sorted({fn.parent for fn in fns}):
+        table = get_metadata_table(drc)
+        df = table.read()
+
+        missing = [fn for fn in fns if fn.parent == drc and str(fn) not in df.index]
+        if missing:
+            records = []
+            for fn in missing:
+                _, h = read_image(fn)
+                if update:
+                    table.append(fn, h)
+                record = json.loads(json.dumps(h, default=_json_default))
+                record['filename'] = str(fn)
+                records.append(record)
+            frames.append(pd.json_normalize(records).set_index('filename'))
+
+        frames.append(df)
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(index=pd.Index([str(fn) for fn in fns], name='filename'))
+
+    df = pd.concat(frames)
+    df = df[~df.index.duplicated(keep='last')]
+    return df.reindex([str(fn) for fn in fns])
@@ -0,0 +1,263 @@
+"""Multi-page (BigTIFF) image stacks with JSON headers and a sidecar index.
+
+A stack is a single BigTIFF file where every page holds one frame, and the
+header of each frame is stored as compact JSON in the ImageDescription tag.
+Next to the stack, an index file (`<name>.tiff.idx`) records the data
+offset, shape and dtype of every page along with the headers, so that
+frames can be read back with a memory map without walking the TIFF
+structure or parsing any of the descriptions.
+
+Usage:
+    with TiffStackWriter('data.tiff') as stack:
+        for img, h in frames:
+            stack.write(img, header=h)
+
+    with TiffStackReader('data.tiff') as stack:
+        img, h = stack[10]
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .compression import tiff_compression_kwargs
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+
+
+def _json_default(obj):
+    """Convert numpy types which the json module does not understand."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+def dump_header(header: dict) -> str:
+    """Encode header as compact JSON string."""
+    if not header:
+        return ''
+    return json.dumps(header, separators=(',', ':'), default=_json_default)
+
+
+def load_header(description: str) -> dict:
+    """Decode header from the JSON string written by `dump_header`."""
+    if not description:
+        return {}
+    return json.loads(description)
+
+
+def index_filename(fname: str) -> Path:
+    """Return the path of the sidecar index belonging to stack `fname`."""
+    fname = Path(fname)
+    return fname.with_name(fname.name + INDEX_SUFFIX)
+
+
+class TiffStackWriter:
+    """Append frames to a multi-page BigTIFF file.
+
+    fname: str,
+        path or filename to which the stack should be saved (the extension is set to .tiff)
+    index: bool,
+        write a sidecar index with page offsets and headers when the stack is closed
+    compression: str,
+        compress the frames, i.e. 'zlib' or 'zstd' (see `formats.compression`).
+        Compressed frames are decoded with tifffile instead of memory mapped.
+    level: int,
+        compression level
+    workers: int,
+        number of threads used to compress each frame
+    """
+
+    def __init__(
+        self,
+        fname: str,
+        index: bool = True,
+        compression: str = None,
+        level: int = None,
+        workers: int = None,
+    ):
+        import tifffile
+
+        self.fname = Path(fname).with_suffix('.tiff')
+        self.write_index = index
+        self._compression = tiff_compression_kwargs(compression, level, workers)
+        self._tiff = tifffile.TiffWriter(self.fname, bigtiff=True, byteorder='<')
+        self._frames = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def write(self, data: np.ndarray, header: dict = None) -> int:
+        """Write a single frame to the stack and return its index.
+
+        data: np.ndarray,
+            numpy array containing image data
+        header: dict,
+            dictionary containing the metadata that should be saved
+        """
+        data = np.asarray(data)
+        ret = self._tiff.write(
+            data=data,
+            software='instamatic',
+            description=dump_header(header),
+            metadata=None,
+            contiguous=False,
+            returnoffset=not self._compression,
+            **self._compression,
+        )
+        offset = ret[0] if ret else None
+        self._frames.append(
+            {
+                'offset': offset,
+                'shape': data.shape,
+                'dtype': data.dtype.newbyteorder('<').str,
+                'header': header or {},
+            }
+        )
+        return len(self._frames) - 1
+
+    def close(self):
+        """Close the stack and write the index."""
+        if self._tiff is None:
+            return
+        self._tiff.close()
+        self._tiff = None
+
+        if self.write_index:
+            index = {'version': INDEX_VERSION, 'frames': self._frames}
+            with open(index_filename(self.fname), 'w') as f:
+                json.dump(index, f, separators=(',', ':'), default=_json_default)
+
+
+class TiffStackReader:
+    """Random access reader for stacks written by `TiffStackWriter`.
+
+    If the sidecar index is available, frames are read through a memory
+    map of the file, otherwise the TIFF pages are parsed with tifffile.
+
+    fname: str,
+        path or filename to the stack
+    """
+
+    def __init__(self, fname: str):
+        self.fname = Path(fname)
+        self._tiff = None
+        self._mmap = None
+
+        index = index_filename(self.fname)
+        if index.exists():
+            with open(index) as f:
+                self._frames = json.load(f)['frames']
+        else:
+            self._frames = None
+
+        if not self._frames or any(frame['offset'] is None for frame in self._frames):
+            import tifffile
+
+            self._tiff = tifffile.TiffFile(self.fname)
+            if self._frames is None:
+                self._frames = [
+                    {'header': load_header(page.description)} for page in self._tiff.pages
+                ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, i: int) -> (np.array, dict):
+        return self.read(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.read(i)
+
+    @property
+    def headers(self) -> list:
+        """List of headers for all frames, without touching the image
+        data."""
+        return [frame['header'] for frame in self._frames]
+
+    def read(self, i: int) -> (np.array, dict):
+        """Return frame `i` and its header."""
+        frame = self._frames[i]
+
+        if self._tiff is not None:
+            img = self._tiff.pages[i].asarray()
+        else:
+            if self._mmap is None:
+                self._mmap = np.memmap(self.fname, dtype=np.uint8, mode='r')
+            dtype = np.dtype(frame['dtype'])
+            shape = tuple(frame['shape'])
+            count = int(np.prod(shape)) * dtype.itemsize
+            offset = frame['offset']
+            img = self._mmap[offset : offset + count].view(dtype).reshape(shape)
+            img = np.array(img)
+
+        return img, frame['header']
+
+    def asarray(self) -> np.array:
+        """Read all frames into a single (N, H, W) array."""
+        return np.stack([self.read(i)[0] for i in range(len(self))])
+
+    def close(self):
+        if self._tiff is not None:
+            self._tiff.close()
+            self._tiff = None
+        self._mmap = None
+
+
+def write_tiff_stack(
+    fname: str, data, headers: list = None, compression: str = None, level: int = None
+) -> None:
+    """Write a series of images to a single multi-page BigTIFF file.
+
+    fname: str,
+        path or filename to which the stack should be saved
+    data: np.ndarray or list,
+        numpy array of shape (N, H, W) or a sequence of 2D images
+    headers: list,
+        list of dictionaries containing the metadata for each frame
+    compression: str,
+        compress the frames, i.e. 'zlib' or 'zstd' (see `formats.compression`)
+    level: int,
+        compression level
+    """
+    if headers is None:
+        headers = [None] * len(data)
+
+    with TiffStackWriter(fname, compression=compression, level=level) as stack:
+        for img, header in zip(data, headers):
+            stack.write(img, header=header)
+
+
+def read_tiff_stack(fname: str) -> (np.array, list):
+    """Read a multi-page TIFF stack written by Instamatic.
+
+    fname: str,
+        path or filename to the stack
+
+    Returns:
+        images: np.ndarray, headers: list
+            a tuple of the images as (N, H, W) numpy array and a list of header dictionaries
+    """
+    with TiffStackReader(fname) as stack:
+        return stack.asarray(), stack.headers
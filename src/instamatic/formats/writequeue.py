@@ -0,0 +1,210 @@
+"""Write-behind queue for saving images in the background.
+
+Saving an image to disk (in particular to a network share) can take a
+significant amount of time, which otherwise adds directly to the
+acquisition time. Writes submitted to the `WriteQueue` return immediately
+and are carried out by a pool of worker threads. The queue is bounded, so
+that acquisition is throttled if the disk cannot keep up, rather than
+filling up the memory.
+
+Errors raised in the workers are collected and re-raised (as `WriteError`)
+on the next call to `submit` or `flush`.
+
+Usage:
+    queue = get_write_queue()
+    queue.submit(write_tiff, 'image.tiff', img, header=h)
+    ...
+    queue.flush()  # wait until everything is on disk
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class WriteError(OSError):
+    """Raised when one or more writes in the background have failed."""
+
+    def __init__(self, errors: list):
+        self.errors = errors
+        fname, exc = errors[0]
+        msg = f'Failed to write {fname}: {exc!r}'
+        if len(errors) > 1:
+            msg += f' (and {len(errors) - 1} more)'
+        super().__init__(msg)
+
+
+class WriteQueue:
+    """Bounded queue with worker threads that write data to disk.
+
+    maxsize: int,
+        maximum number of pending writes, `submit` blocks when the queue is full
+    workers: int,
+        number of worker threads
+    """
+
+    def __init__(self, maxsize: int = 64, workers: int = 2):
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._errors = []
+        self._lock = threading.Lock()
+
+        self.n_written = 0
+        self.n_failed = 0
+        self.bytes_written = 0
+        self.max_depth = 0
+        self.write_time = 0.0
+
+        self._workers = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'WriteQueue-{i}', daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(depth={self.depth}, workers={len(self._workers)})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+    @property
+    def depth(self) -> int:
+        """Number of writes waiting in the queue."""
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                self._queue.task_done()
+                break
+
+            func, fname, data, args, kwargs = task
+            t0 = time.perf_counter()
+            try:
+                func(fname, data, *args, **kwargs)
+            except Exception as e:
+                logger.exception('Failed to write %s', fname)
+                with self._lock:
+                    self._errors.append((fname, e))
+                    self.n_failed += 1
+            else:
+                dt = time.perf_counter() - t0
+                with self._lock:
+                    self.n_written += 1
+                    self.bytes_written += getattr(data, 'nbytes', 0)
+                    self.write_time += dt
+            finally:
+                self._queue.task_done()
+
+    def _raise_errors(self):
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise WriteError(errors)
+
+    def submit(self, func, fname: str, data, *args, copy: bool = True, **kwargs) -> None:
+        """Schedule `func(fname, data, *args, **kwargs)` to be run in the
+        background. Blocks if the queue is full.
+
+        func: callable,
+            write function, i.e. `write_tiff` or `write_hdf5`
+        copy: bool,
+            copy `data` (and a header dict passed as `header`), so that the
+            caller can safely modify it after submitting
+        """
+        if not self._workers:
+            raise RuntimeError('Cannot submit to a closed write queue.')
+
+        self._raise_errors()
+
+        if copy:
+            data = np.array(data, copy=True)
+            if isinstance(kwargs.get('header'), dict):
+                kwargs['header'] = dict(kwargs['header'])
+
+        self._queue.put((func, fname, data, args, kwargs))
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def flush(self) -> None:
+        """Block until all pending writes have finished.
+
+        Raises `WriteError` if any of the writes failed.
+        """
+        self._queue.join()
+        self._raise_errors()
+
+    def join(self) -> None:
+        """Alias for `flush`."""
+        self.flush()
+
+    def close(self) -> None:
+        """Finish all pending writes and stop the worker threads."""
+        if not self._workers:
+            return
+        self._queue.join()
+        for _ in self._workers:
+            self._queue.put(None)
+        for thread in self._workers:
+            thread.join()
+        self._workers = []
+        self._raise_errors()
+
+    def stats(self) -> dict:
+        """Return queue metrics: current/maximum depth, number of writes,
+        bytes written and the write throughput of the workers (bytes/s)."""
+        with self._lock:
+            return {
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'written': self.n_written,
+                'failed': self.n_failed,
+                'bytes_written': self.bytes_written,
+                'write_time': self.write_time,
+                'bytes_per_second': self.bytes_written / self.write_time
+                if self.write_time
+                else 0.0,
+            }
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue() -> WriteQueue:
+    """Return the process-wide write queue, which is created on first use
+    and flushed when the program exits."""
+    global _write_queue
+
+    with _write_queue_lock:
+        if _write_queue is None:
+            from instamatic import config
+
+            _write_queue = WriteQueue(
+                maxsize=config.settings.write_queue_size,
+                workers=config.settings.write_queue_workers,
+            )
+            atexit.register(_write_queue.close)
+
+    return _write_queue
+
+
+def flush_write_queue() -> None:
+    """Wait until all images submitted to the process-wide write queue have
+    been written.
+
+    Does nothing if the queue is not in use.
+    """
+    if _write_queue is not None:
+        _write_queue.flush()
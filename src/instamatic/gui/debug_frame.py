@@ -9,6 +9,7 @@ from tkinter.ttk import *
 from instamatic import config
 
 from .base_module import BaseModule
+from .scheduler import requires
 
 scripts_drc = config.locations['scripts']
 
@@ -325,6 +326,7 @@ def debug(controller, **kwargs):
         ctrl.run_script(script)
 
 
+@requires('indexing')
 def autoindex(controller, **kwargs):
     task = kwargs.get('task')
     if task == 'start_server':
@@ -362,6 +364,7 @@ def autoindex(controller, **kwargs):
         del controller.indexing_server_process
 
 
+@requires('indexing')
 def autoindex_xdsVM(controller, **kwargs):
     task = kwargs.get('task')
     if task == 'start_server_xdsVM':
@@ -419,6 +422,7 @@ def autoindex_xdsVM(controller, **kwargs):
         del controller.indexing_server_process
 
 
+@requires('indexing')
 def autosolution_path(controller, **kwargs):
     import json
 
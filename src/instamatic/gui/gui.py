@@ -4,7 +4,6 @@ import atexit
 import queue
 import sys
 import threading
-import traceback
 from tkinter import *
 from tkinter.ttk import *
 
@@ -12,6 +11,7 @@ import instamatic
 from instamatic.formats import *
 
 from .modules import JOBS, MODULES
+from .scheduler import JobScheduler
 
 
 class DataCollectionController(threading.Thread):
@@ -21,6 +21,8 @@ class DataCollectionController(threading.Thread):
     experiments. It runs in a separate thread and uses a queue to
     communicate tasks from the GUI to the instrument interface. This is
     important to keep the GUI responsive for long-running experiments.
+    The tasks are passed on to the `JobScheduler`, which runs jobs that
+    do not need the same resources at the same time.
     """
 
     def __init__(self, ctrl=None, stream=None, beam_ctrl=None, app=None, log=None):
@@ -35,8 +37,9 @@ class DataCollectionController(threading.Thread):
 
         self.log = log
 
-        self.q = queue.LifoQueue(maxsize=1)
+        self.q = queue.Queue()
         self.triggerEvent = threading.Event()
+        self.scheduler = JobScheduler(self, JOBS, log=self.log)
 
         self.module_io = self.app.get_module('io')
 
@@ -60,23 +63,16 @@ class DataCollectionController(threading.Thread):
                 self.close()
                 sys.exit()
 
-            job, kwargs = self.q.get()
-
-            try:
-                func = JOBS[job]
-            except KeyError:
-                print(f'Unknown job: {job}')
-                print(f'Kwargs:\n{kwargs}')
-                continue
-
-            try:
-                func(self, **kwargs)
-            except Exception as e:
-                traceback.print_exc()
-                self.log.debug(f"Error caught -> {repr(e)} while running '{job}' with {kwargs}")
-                self.log.exception(e)
+            # several jobs may have been queued before the trigger was seen
+            while True:
+                try:
+                    job, kwargs = self.q.get_nowait()
+                except queue.Empty:
+                    break
+                self.scheduler.submit(job, kwargs)
 
     def close(self):
+        self.scheduler.shutdown()
         for item in (self.ctrl, self.stream, self.beam_ctrl, self.app):
             try:
                 item.close()
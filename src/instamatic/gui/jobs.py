@@ -1,7 +1,9 @@
 """This JOBS repository holds a list of jobs that are useful outside the
 function they were originally written for.
 
-Should be generally applicable.
+Should be generally applicable. Jobs declare the resources they need
+with `requires`, so that the `JobScheduler` can run jobs that do not
+need the same resources at the same time.
 """
 
 from __future__ import annotations
@@ -9,9 +11,13 @@ from __future__ import annotations
 import time
 from datetime import datetime
 
-from instamatic.formats import read_tiff, write_tiff
+from instamatic.formats import acquisition_compression, read_tiff, write_tiff
+from instamatic.processing.flatfield import apply_flatfield_correction
 
+from .scheduler import is_cancelled, report_progress, requires
 
+
+@requires('microscope')
 def microscope_control(controller, **kwargs):
     from operator import attrgetter
 
@@ -21,6 +27,7 @@ def microscope_control(controller, **kwargs):
     f(**kwargs)
 
 
+@requires('microscope', 'camera', 'disk')
 def collect_flatfield(controller, **kwargs):
     from instamatic.processing import flatfield
 
@@ -31,6 +38,7 @@ def collect_flatfield(controller, **kwargs):
     flatfield.collect_flatfield(controller.ctrl, confirm=False, drc=drc, **kwargs)
 
 
+@requires('disk')
 def save_image(controller, **kwargs):
     frame = kwargs.get('frame')
 
@@ -51,10 +59,11 @@ def save_image(controller, **kwargs):
         frame = frame
         h = {}
 
-    write_tiff(outfile, frame, header=h)
+    write_tiff(outfile, frame, header=h, **acquisition_compression())
     print('Wrote file:', outfile)
 
 
+@requires('microscope')
 def toggle_difffocus(controller, **kwargs):
     toggle = kwargs['toggle']
 
@@ -65,6 +74,7 @@ def toggle_difffocus(controller, **kwargs):
         controller.ctrl.difffocus.refocus()
 
 
+@requires('microscope')
 def relax_beam(controller, **kwargs):
     n_cycles = 4
     print(f'Relaxing beam ({n_cycles} cycles)')
@@ -74,10 +84,14 @@ def relax_beam(controller, **kwargs):
     offset = kwargs['value']
 
     for i in range(n_cycles):
+        if is_cancelled():
+            print('Cancelled.')
+            return
         controller.ctrl.difffocus.defocus(offset=offset)
         time.sleep(0.25)
         controller.ctrl.difffocus.refocus()
         time.sleep(0.25)
+        report_progress((i + 1) / n_cycles, f'cycle {i + 1}/{n_cycles}')
 
     print('Done.')
 
@@ -0,0 +1,207 @@
+"""Rendering of the stream frames for display, off the UI thread.
+
+`FrameRenderer` runs a worker thread that picks up the latest frame from
+a `VideoStream`, maps it to 8 bits with a cached lookup table, scales it
+to the display size, and leaves the ready `PIL.Image` for the UI thread
+to collect with `FrameRenderer.get`. Frames that arrive while the worker
+or the display is busy are skipped, so the display never lags behind the
+camera, and never slows down the stream. The acquisition, render and
+display rates are measured separately.
+
+Usage:
+    renderer = FrameRenderer(stream)
+    renderer.start()
+
+    # on the UI thread
+    rendered = renderer.get()
+    if rendered is not None:
+        photo.paste(rendered.image)
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+# percentile of the intensities that is mapped to white by the auto contrast
+CONTRAST_PERCENTILE = 99.5
+
+# relative change of the contrast limit below which the lookup table is reused
+LUT_TOLERANCE = 0.02
+
+Rendered = namedtuple('Rendered', ['image', 'frame', 'number', 'time'])
+
+
+class RateMeter:
+    """Measure the rate (per second) of recurring events, averaged over
+    `interval` seconds and smoothed with the previous value."""
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.rate = 0.0
+        self._count = 0
+        self._last = time.perf_counter()
+
+    def tick(self, n: int = 1) -> None:
+        self._count += n
+        now = time.perf_counter()
+        delta = now - self._last
+        if delta > self.interval:
+            rate = self._count / delta
+            self.rate = rate if self.rate == 0 else 0.5 * (rate + self.rate)
+            self._count = 0
+            self._last = now
+
+
+def histogram_percentile(values: np.ndarray, q: float, maxval: int) -> int:
+    """Percentile `q` of the integer `values` (0 to `maxval`) from their
+    histogram, which is much faster than sorting them."""
+    counts = np.bincount(np.clip(values, 0, maxval).ravel(), minlength=maxval + 1)
+    cumulative = np.cumsum(counts)
+    return int(np.searchsorted(cumulative, cumulative[-1] * q / 100))
+
+
+class FrameRenderer:
+    """Render the frames of `stream` for display in a background thread.
+
+    stream: `VideoStream`,
+        stream to render, the frames are read from `stream.frame`, and new
+        frames are detected by `stream.frame_count`
+    interval: float,
+        time (s) the worker waits between checks for a new frame
+
+    The display settings (`auto_contrast`, `display_range`, `brightness`,
+    `display_size`) can be changed at any time from the UI thread.
+    """
+
+    def __init__(self, stream, interval: float = 0.005):
+        self.stream = stream
+        self.interval = interval
+
+        self.auto_contrast = True
+        self.dynamic_range = self.display_range = int(stream.cam.dynamic_range)
+        self.brightness = 1.0
+        self.display_size = None  # (width, height), None for the frame size
+
+        self.acquisition_rate = RateMeter()
+        self.render_rate = RateMeter()
+        self.display_rate = RateMeter()
+        self.skipped = 0
+
+        self._lut = None
+        self._lut_key = None
+        self._rendered = None
+        self._collected = True
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='FrameRenderer', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self) -> Rendered:
+        """Return the last rendered frame, or None if it has already been
+        collected. Call this from the UI thread."""
+        with self._lock:
+            if self._collected:
+                return None
+            self._collected = True
+            rendered = self._rendered
+        self.display_rate.tick()
+        return rendered
+
+    def _run(self):
+        last_count = getattr(self.stream, 'frame_count', 0)
+        while not self._stop_event.is_set():
+            count = getattr(self.stream, 'frame_count', None)
+            if count is not None:
+                if count == last_count:
+                    self._stop_event.wait(self.interval)
+                    continue
+                self.acquisition_rate.tick(count - last_count)
+                last_count = count
+
+            with self.stream.lock:
+                frame = self.stream.frame
+
+            if frame is None:
+                self._stop_event.wait(self.interval)
+                continue
+
+            image = self.render(frame)
+            self.render_rate.tick()
+
+            with self._lock:
+                if not self._collected:
+                    self.skipped += 1
+                self._rendered = Rendered(image, frame, last_count, time.perf_counter())
+                self._collected = False
+
+            if count is None:
+                # streams without a frame counter are re-rendered at a fixed rate
+                self._stop_event.wait(self.interval)
+
+    def lookup_table(self, limit: float) -> np.ndarray:
+        """Return the (cached) table that maps the intensities 0 to
+        `dynamic_range` to 8 bits, with `limit` mapped to white."""
+        key = (limit, self.brightness, self.dynamic_range)
+        if self._lut_key is not None:
+            old_limit, brightness, dynamic_range = self._lut_key
+            if (
+                brightness == self.brightness
+                and dynamic_range == self.dynamic_range
+                and abs(limit - old_limit) <= LUT_TOLERANCE * old_limit
+            ):
+                return self._lut
+
+        scale = 256.0 * self.brightness / max(limit, 1)
+        values = np.arange(self.dynamic_range + 1) * scale
+        self._lut = np.clip(values, 0, 255).astype(np.uint8)
+        self._lut_key = key
+        return self._lut
+
+    def contrast_limit(self, frame: np.ndarray) -> float:
+        """Intensity that is displayed as white."""
+        if not self.auto_contrast:
+            return self.display_range
+        sample = frame[::4, ::4]
+        if np.issubdtype(frame.dtype, np.integer):
+            return 1 + histogram_percentile(sample, CONTRAST_PERCENTILE, self.dynamic_range)
+        return 1 + float(np.percentile(sample, CONTRAST_PERCENTILE))
+
+    def to_uint8(self, frame: np.ndarray) -> np.ndarray:
+        """Map `frame` to 8 bits with the current contrast settings."""
+        limit = self.contrast_limit(frame)
+        if frame.dtype.kind == 'u' or (frame.dtype.kind == 'i' and frame.min() >= 0):
+            lut = self.lookup_table(limit)
+            return lut[np.minimum(frame, self.dynamic_range)]
+        scale = 256.0 * self.brightness / max(limit, 1)
+        return np.clip(frame * scale, 0, 255).astype(np.uint8)
+
+    def render(self, frame: np.ndarray) -> Image.Image:
+        """Return `frame` as an 8-bit `PIL.Image` of the display size."""
+        frame = np.asarray(frame)
+        if self.display_size is None:
+            return Image.fromarray(self.to_uint8(frame))
+
+        # decimate large frames before the mapping, the rest is done by resizing
+        width, height = self.display_size
+        step = max(1, min(frame.shape[0] // height, frame.shape[1] // width))
+        image = Image.fromarray(self.to_uint8(frame[::step, ::step]))
+        if image.size != (width, height):
+            image = image.resize((width, height))
+        return image
@@ -0,0 +1,318 @@
+"""Scheduler for the jobs submitted by the GUI modules.
+
+Every job (see `gui.jobs.JOBS`) declares the resources it needs with the
+`requires` decorator, i.e. the microscope, the camera, or the disk. The
+`JobScheduler` runs jobs in a pool of threads, and starts a job as soon
+as none of its resources is used by a running job or by a job that was
+submitted before it, so that jobs on the same resource run in the order
+they were submitted, and jobs on different resources (saving an image
+while an indexing job is sent to the server) run at the same time. Jobs
+that do not declare their resources claim all of them, and run alone.
+
+While running, a job can report its progress and check whether it has
+been cancelled with `report_progress` and `is_cancelled`. Finished jobs
+are kept in the history with their timings.
+
+Usage:
+    @requires('microscope')
+    def relax_beam(controller, **kwargs):
+        for i in range(n_cycles):
+            if is_cancelled():
+                return
+            ...
+            report_progress((i + 1) / n_cycles)
+
+    scheduler = JobScheduler(controller, JOBS)
+    record = scheduler.submit('relax_beam', {'value': 100})
+    record.wait()
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# resources a job can claim
+RESOURCES = frozenset(('microscope', 'camera', 'disk', 'indexing'))
+
+# number of finished jobs kept in the history
+HISTORY_SIZE = 100
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+_local = threading.local()
+
+
+def requires(*resources):
+    """Decorator to declare the resources a job function needs."""
+    unknown = set(resources) - RESOURCES
+    if unknown:
+        raise ValueError(f'Unknown resources: {unknown}, must be in {set(RESOURCES)}')
+
+    def decorator(func):
+        func.resources = frozenset(resources)
+        return func
+
+    return decorator
+
+
+def current_job() -> JobRecord:
+    """Return the job running in this thread (None outside of a job)."""
+    return getattr(_local, 'job', None)
+
+
+def report_progress(progress: float, message: str = '') -> None:
+    """Report the progress (0 to 1) of the job running in this thread."""
+    job = current_job()
+    if job is not None:
+        job.report(progress, message)
+
+
+def is_cancelled() -> bool:
+    """Return True if the job running in this thread has been cancelled."""
+    job = current_job()
+    return job is not None and job.cancelled
+
+
+class JobRecord:
+    """State, progress and timings of a submitted job."""
+
+    def __init__(self, number: int, name: str, kwargs: dict, resources: frozenset, notify):
+        self.number = number
+        self.name = name
+        self.kwargs = kwargs
+        self.resources = resources
+
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = ''
+        self.error = None
+
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+
+        self._notify = notify
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    def __repr__(self):
+        return f'JobRecord({self.number}, {self.name!r}, status={self.status!r})'
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done_event.is_set()
+
+    @property
+    def wait_time(self) -> float:
+        """Time (s) between submitting and starting the job."""
+        end = self.started if self.started is not None else time.perf_counter()
+        return end - self.submitted
+
+    @property
+    def run_time(self) -> float:
+        """Time (s) the job has been running."""
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def cancel(self) -> None:
+        """Ask the job to stop, running jobs stop at their next check of
+        `is_cancelled`."""
+        self._cancel_event.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until the job has finished, returns False on timeout."""
+        return self._done_event.wait(timeout)
+
+    def report(self, progress: float, message: str = '') -> None:
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        self.message = message
+        self._notify(self, 'progress')
+
+    def _finish(self, status: str, error: Exception = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished = time.perf_counter()
+        if status == DONE:
+            self.progress = 1.0
+        self._done_event.set()
+
+
+class JobScheduler:
+    """Run the jobs from `jobs` concurrently, unless they need the same
+    resources.
+
+    controller: `DataCollectionController`,
+        passed as the first argument to every job
+    jobs: dict,
+        maps the job names to the job functions
+    max_workers: int,
+        maximum number of jobs that run at the same time
+    history_size: int,
+        number of finished jobs to keep
+    log: `logging.Logger`,
+        logger for the errors raised by the jobs
+    """
+
+    def __init__(
+        self,
+        controller,
+        jobs: dict,
+        max_workers: int = 4,
+        history_size: int = HISTORY_SIZE,
+        log=None,
+    ):
+        self.controller = controller
+        self.jobs = jobs
+        self.log = log or logger
+
+        self.pending = []
+        self.running = []
+        self.history = deque(maxlen=history_size)
+
+        self._counter = itertools.count(1)
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def subscribe(self, callback) -> None:
+        """Call `callback(record, event)` when a job is 'submitted', has
+        'started', reports 'progress', or has 'finished'. The callback is
+        called from the thread of the job, GUI updates must be passed on to
+        the UI thread."""
+        self._subscribers.append(callback)
+
+    def _notify(self, record: JobRecord, event: str) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(record, event)
+            except Exception:
+                self.log.exception('Error in job subscriber for %s', record)
+
+    def submit(self, name: str, kwargs: dict = None) -> JobRecord:
+        """Queue the job `name`, to be called with `kwargs`.
+
+        Returns:
+            the `JobRecord` of the job, or None if there is no such job
+        """
+        try:
+            func = self.jobs[name]
+        except KeyError:
+            print(f'Unknown job: {name}')
+            print(f'Kwargs:\n{kwargs}')
+            return None
+
+        resources = getattr(func, 'resources', RESOURCES)
+        record = JobRecord(next(self._counter), name, kwargs or {}, resources, self._notify)
+
+        with self._lock:
+            self.pending.append(record)
+        self._notify(record, 'submitted')
+        self._dispatch()
+        return record
+
+    def cancel(self, record: JobRecord) -> None:
+        """Cancel a job, pending jobs are removed from the queue."""
+        record.cancel()
+        with self._lock:
+            if record not in self.pending:
+                return
+            self.pending.remove(record)
+            record._finish(CANCELLED)
+            self.history.append(record)
+        self._notify(record, 'finished')
+        self._dispatch()
+
+    def cancel_all(self) -> None:
+        """Cancel all pending and running jobs."""
+        with self._lock:
+            records = self.pending + self.running
+        for record in records:
+            self.cancel(record)
+
+    def _dispatch(self) -> None:
+        """Start the pending jobs whose resources are free."""
+        with self._lock:
+            claimed = set()
+            for record in self.running:
+                claimed |= record.resources
+
+            for record in list(self.pending):
+                # jobs wait for earlier jobs on the same resources
+                if not claimed & record.resources:
+                    self.pending.remove(record)
+                    self.running.append(record)
+                    record.status = RUNNING
+                    record.started = time.perf_counter()
+                    self._executor.submit(self._run, record)
+                claimed |= record.resources
+
+    def _run(self, record: JobRecord) -> None:
+        func = self.jobs[record.name]
+        _local.job = record
+        self._notify(record, 'started')
+
+        try:
+            func(self.controller, **record.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self.log.debug(
+                f"Error caught -> {repr(e)} while running '{record.name}' with {record.kwargs}"
+            )
+            self.log.exception(e)
+            record._finish(FAILED, error=e)
+        else:
+            record._finish(CANCELLED if record.cancelled else DONE)
+        finally:
+            _local.job = None
+
+        logger.info(
+            '%s %s in %.2f s (waited %.2f s)',
+            record.name,
+            record.status,
+            record.run_time,
+            record.wait_time,
+        )
+
+        with self._lock:
+            self.running.remove(record)
+            self.history.append(record)
+        self._notify(record, 'finished')
+        self._dispatch()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until all submitted jobs have finished, returns False on
+        timeout."""
+        end = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            with self._lock:
+                records = self.pending + self.running
+            if not records:
+                return True
+            remaining = None if end is None else end - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return False
+            records[0].wait(remaining)
+
+    def shutdown(self, cancel: bool = True) -> None:
+        """Stop the scheduler, and cancel the jobs if `cancel`."""
+        if cancel:
+            self.cancel_all()
+        self._executor.shutdown(wait=False)
@@ -7,13 +7,14 @@ from tkinter import *
 from tkinter.ttk import *
 
 import numpy as np
-from PIL import Image, ImageEnhance, ImageTk
+from PIL import Image, ImageTk
 
 from instamatic.formats import read_tiff, write_tiff
 from instamatic.processing.flatfield import apply_flatfield_correction
 from instamatic.utils.spinbox import Spinbox
 
 from .base_module import BaseModule
+from .render import FrameRenderer
 
 
 class VideoStreamFrame(LabelFrame):
@@ -29,8 +30,10 @@ class VideoStreamFrame(LabelFrame):
         self.app = app
 
         self.panel = None
+        self.frame = None
 
-        self.frame_delay = 50
+        # interval (ms) at which the display checks for a rendered frame
+        self.frame_delay = 10
 
         self.frametime = 0.05
         self.brightness = 1.0
@@ -40,11 +43,12 @@ class VideoStreamFrame(LabelFrame):
         self.auto_contrast = True
 
         self.resize_image = False
+        self.display_size = (950, 950)
 
-        self.last = time.perf_counter()
-        self.nframes = 1
         self.update_frequency = 0.25
-        self.last_interval = self.frametime
+        self.last = time.perf_counter()
+
+        self.renderer = FrameRenderer(self.stream)
 
         self._atexit_funcs = []
 
@@ -69,6 +73,7 @@ class VideoStreamFrame(LabelFrame):
 
     def init_vars(self):
         self.var_fps = DoubleVar()
+        self.var_acquisition_fps = DoubleVar()
         self.var_interval = DoubleVar()
         # self.var_overhead = DoubleVar()
 
@@ -109,15 +114,20 @@ class VideoStreamFrame(LabelFrame):
         self.cb_contrast.grid(row=1, column=5)
 
         self.e_fps = Entry(frame, width=lwidth, textvariable=self.var_fps, state=DISABLED)
+        self.e_acquisition_fps = Entry(
+            frame, width=lwidth, textvariable=self.var_acquisition_fps, state=DISABLED
+        )
         self.e_interval = Entry(
             frame, width=lwidth, textvariable=self.var_interval, state=DISABLED
         )
         # self.e_overhead    = Entry(frame, bd=0, width=ewidth, textvariable=self.var_overhead, state=DISABLED)
 
-        Label(frame, width=lwidth, text='fps:').grid(row=1, column=0)
+        Label(frame, width=lwidth, text='display fps:').grid(row=1, column=0)
         self.e_fps.grid(row=1, column=1, sticky='we')
         Label(frame, width=lwidth, text='interval (ms):').grid(row=1, column=2)
         self.e_interval.grid(row=1, column=3, sticky='we')
+        Label(frame, width=lwidth, text='camera fps:').grid(row=2, column=0)
+        self.e_acquisition_fps.grid(row=2, column=1, sticky='we')
         # Label(frame, width=lwidth, text="overhead (ms):").grid(row=1, column=4)
         # self.e_overhead.grid(row=1, column=5)
 
@@ -164,7 +174,7 @@ class VideoStreamFrame(LabelFrame):
 
     def makepanel(self, master, resolution=(512, 512)):
         if self.panel is None:
-            image = Image.fromarray(np.zeros(resolution))
+            image = Image.fromarray(np.zeros(resolution, dtype=np.uint8))
             image = ImageTk.PhotoImage(image)
 
             self.panel = Label(master, image=image)
@@ -180,6 +190,8 @@ class VideoStreamFrame(LabelFrame):
             self.resize_image = self.var_resize_image.get()
         except BaseException:
             pass
+        else:
+            self.renderer.display_size = self.display_size if self.resize_image else None
 
     def update_auto_contrast(self, name, index, mode):
         # print name, index, mode
@@ -187,6 +199,8 @@ class VideoStreamFrame(LabelFrame):
             self.auto_contrast = self.var_auto_contrast.get()
         except BaseException:
             pass
+        else:
+            self.renderer.auto_contrast = self.auto_contrast
 
     def update_frametime(self, name, index, mode):
         # print name, index, mode
@@ -203,6 +217,8 @@ class VideoStreamFrame(LabelFrame):
             self.brightness = self.var_brightness.get()
         except BaseException:
             pass
+        else:
+            self.renderer.brightness = self.brightness
 
     def update_display_range(self, name, index, mode):
         try:
@@ -210,6 +226,8 @@ class VideoStreamFrame(LabelFrame):
             self.display_range = max(1, val)
         except BaseException:
             pass
+        else:
+            self.renderer.display_range = self.display_range
 
     def saveImage(self):
         """Dump the current frame to a file."""
@@ -221,6 +239,7 @@ class VideoStreamFrame(LabelFrame):
         self.q = q
 
     def close(self):
+        self.renderer.stop()
         self.stream.close()
         self.parent.quit()
         # for func in self._atexit_funcs:
@@ -228,67 +247,38 @@ class VideoStreamFrame(LabelFrame):
 
     def start_stream(self):
         self.stream.update_frametime(self.frametime)
+        self.renderer.start()
         self.after(500, self.on_frame)
 
     def on_frame(self, event=None):
-        self.stream.lock.acquire(True)
-        self.frame = frame = self.stream.frame
-        self.stream.lock.release()
-
-        if frame is not None:
-            # the display range in ImageTk is from 0 to 256
-            if self.auto_contrast:
-                frame = frame * (
-                    256.0 / (1 + np.percentile(frame[::4, ::4], 99.5))
-                )  # use 128x128 array for faster calculation
-
-                image = Image.fromarray(frame)
-            elif self.display_range != self.display_range_default:
-                image = np.clip(frame, 0, self.display_range)
-                image = (256.0 / self.display_range) * image
-                image = Image.fromarray(image)
+        # the frame is mapped and scaled by the renderer, only the display is updated here
+        rendered = self.renderer.get()
+
+        if rendered is not None:
+            self.frame = rendered.frame
+            image = self.panel.image
+            if (image.width(), image.height()) == rendered.image.size:
+                image.paste(rendered.image)
             else:
-                image = Image.fromarray(frame)
-
-            if self.brightness != 1:
-                image = ImageEnhance.Brightness(image.convert('L')).enhance(self.brightness)
-                # Can also use ImageEnhance.Sharpness or ImageEnhance.Contrast if needed
-
-            if self.resize_image:
-                image = image.resize((950, 950))
-
-            image = ImageTk.PhotoImage(image=image)
-
-            self.panel.configure(image=image)
-            # keep a reference to avoid premature garbage collection
-            self.panel.image = image
+                image = ImageTk.PhotoImage(image=rendered.image)
+                self.panel.configure(image=image)
+                # keep a reference to avoid premature garbage collection
+                self.panel.image = image
 
         self.update_frametimes()
-        # self.parent.update_idletasks()
 
         self.after(self.frame_delay, self.on_frame)
 
     def update_frametimes(self):
-        self.current = time.perf_counter()
-        delta = self.current - self.last
-
-        if delta > self.update_frequency:
-            interval = delta / self.nframes
-
-            interval = (interval * 0.5) + (self.last_interval * 0.5)
-
-            fps = 1.0 / interval
-            # overhead = interval - self.stream.frametime
-
-            self.var_fps.set(round(fps, 2))
-            self.var_interval.set(round(interval * 1000, 2))
-            # self.var_overhead.set(round(overhead*1000, 2))
-            self.last = self.current
-            self.nframes = 1
-
-            self.last_interval = interval
-        else:
-            self.nframes += 1
+        current = time.perf_counter()
+        if current - self.last < self.update_frequency:
+            return
+
+        fps = self.renderer.display_rate.rate
+        self.var_fps.set(round(fps, 2))
+        self.var_interval.set(round(1000 / fps, 2) if fps else 0.0)
+        self.var_acquisition_fps.set(round(self.renderer.acquisition_rate.rate, 2))
+        self.last = current
 
 
 module = BaseModule(
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import numpy as np
-from numpy.fft import fft2, ifft2
+from scipy import fft
+
+from instamatic.processing.registration import Registration, refine_peaks
 
 
 def translation(
@@ -9,44 +11,70 @@ def translation(
     im1,
     limit_shift: bool = False,
     return_fft: bool = False,
+    upsample_factor: int = 1,
+    window: str = None,
 ):
     """Return translation vector to register images.
 
     Parameters
     ----------
     im0, im1 : np.array
-        The two images to compare
+        The two images to compare. `im0` can also be a `Registration` with
+        the reference image, so that its FFT is reused between calls
     limit_shift : bool
         Limit the maximum shift to the minimum array length or width.
     return_fft : bool
         Whether to additionally return the cross correlation array between the 2 images
+    upsample_factor : int
+        Determine the shift to within 1/`upsample_factor` of a pixel
+        (ignored if `im0` is a `Registration`)
+    window : str
+        Apodization window (`hann`) to suppress edge effects, None to disable
+        (ignored if `im0` is a `Registration`)
 
     Returns
     -------
     shift: list
         Return the 2 coordinates defining the determined image shift
     """
-    f0 = fft2(im0)
-    f1 = fft2(im1)
-    ir = abs(ifft2((f0 * f1.conjugate()) / (abs(f0) * abs(f1))))
-    shape = ir.shape
-
-    if limit_shift:
-        min_shape = min(shape)
-        shift = int(min_shape / 2)
-        ir2 = np.roll(ir, (shift, shift), (0, 1))
-        ir2 = ir2[:min_shape, :min_shape]
-        t0, t1 = np.unravel_index(np.argmax(ir2), ir2.shape)
-        t0 -= shift
-        t1 -= shift
+    if isinstance(im0, Registration):
+        reg = im0
+    else:
+        reg = Registration(im0, upsample_factor=upsample_factor, window=window)
+
+    if not (limit_shift or return_fft):
+        shift, _ = reg.register(im1)
+    else:
+        product = reg.cross_power(im1)
+        ir = fft.irfft2(product, s=reg.shape, workers=reg.workers)
+        shape = ir.shape
+
+        if limit_shift:
+            min_shape = min(shape)
+            shift = int(min_shape / 2)
+            ir2 = np.roll(ir, (shift, shift), (0, 1))
+            ir2 = ir2[:min_shape, :min_shape]
+            t0, t1 = np.unravel_index(np.argmax(ir2), ir2.shape)
+            t0 -= shift
+            t1 -= shift
+        else:
+            t0, t1 = np.unravel_index(np.argmax(ir), shape)
+            if t0 > shape[0] // 2:
+                t0 -= shape[0]
+            if t1 > shape[1] // 2:
+                t1 -= shape[1]
+
+        shift = np.array([[t0, t1]], dtype=float)
+        if reg.upsample_factor > 1:
+            shift, _ = refine_peaks(product[np.newaxis], shape, shift, reg.upsample_factor)
+        shift = shift[0]
+
+    if reg.upsample_factor > 1:
+        t0, t1 = (float(t) for t in shift)
     else:
-        t0, t1 = np.unravel_index(np.argmax(ir), shape)
-        if t0 > shape[0] // 2:
-            t0 -= shape[0]
-        if t1 > shape[1] // 2:
-            t1 -= shape[1]
+        t0, t1 = (int(round(t)) for t in shift)
 
     if return_fft:
-        return [t0, t1], ir
+        return [t0, t1], np.abs(ir)
     else:
         return [t0, t1]
@@ -49,6 +49,8 @@ class MicroscopeClient:
         self.interface = interface
         self.name = interface
         self._bufsize = BUFSIZE
+        # calls can come from several threads (i.e. telemetry)
+        self._lock = threading.Lock()
 
         try:
             self.connect()
@@ -96,9 +98,9 @@ class MicroscopeClient:
 
     def _eval_dct(self, dct):
         """Takes approximately 0.2-0.3 ms per call if HOST=='localhost'."""
-        self.s.send(dumper(dct))
-
-        response = self.s.recv(self._bufsize)
+        with self._lock:
+            self.s.send(dumper(dct))
+            response = self.s.recv(self._bufsize)
 
         if response:
             status, data = loader(response)
@@ -133,7 +135,9 @@ class MicroscopeClient:
 
 
 class TraceVariable:
-    """Simple class to trace a variable over time.
+    """Simple class to trace a variable over time, see
+    `instamatic.microscope.telemetry.Telemetry` to sample several
+    variables at once.
 
     Usage:
         t = TraceVariable(ctrl.stage.get, verbose=True)
@@ -151,33 +155,32 @@ class TraceVariable:
         verbose: bool = False,
     ):
         super().__init__()
+        from instamatic.microscope.telemetry import Telemetry
+
         self.name = name
         self.func = func
         self.interval = interval
         self.verbose = verbose
 
-        self._traced = []
+        self._telemetry = Telemetry(channels={name: (func, None)}, interval=interval)
+        if verbose:
+            self._telemetry.subscribe(self._print)
+
+    def _timestamp(self, t: float) -> str:
+        dt = datetime.datetime.fromtimestamp(t + self._telemetry.epoch)
+        return dt.strftime('%H:%M:%S.%f')
+
+    def _print(self, name, t, value):
+        print(f'{self._timestamp(t)} | Trace {name}: {value}')
 
     def start(self):
         print(f'Trace started: {self.name}')
-        self.update()
+        self._telemetry.start()
 
     def stop(self):
-        self._timer.cancel()
+        self._telemetry.stop()
 
         print(f'Trace canceled: {self.name}')
 
-        return self._traced
-
-    def update(self):
-        ret = self.func()
-
-        now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-
-        if self.verbose:
-            print(f'{now} | Trace {self.name}: {ret}')
-
-        self._traced.append((now, ret))
-
-        self._timer = threading.Timer(self.interval, self.update)
-        self._timer.start()
+        times, values = self._telemetry.get(self.name)
+        return [(self._timestamp(t), value) for t, value in zip(times, values)]
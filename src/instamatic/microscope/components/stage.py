@@ -1,17 +1,49 @@
 from __future__ import annotations
 
+import threading
 import time
-from collections import namedtuple
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
 from typing import Tuple
 
 import numpy as np
 
+from instamatic import config
 from instamatic.microscope.base import MicroscopeBase
 
 # namedtuples to store results from .get()
 StagePositionTuple = namedtuple('StagePositionTuple', ['x', 'y', 'z', 'a', 'b'])
 
+# initial guess of the stage speeds (nm/s, degrees/s), refined from the observed moves
+STAGE_SPEEDS = {'x': 10_000.0, 'y': 10_000.0, 'z': 10_000.0, 'a': 10.0, 'b': 10.0}
+
+# number of recent moves per axis used to fit the overhead and speed of the stage
+MOVE_FIT_SIZE = 20
+
+# minimum/maximum interval (s) between stage status readouts
+POLL_MIN = 0.01
+POLL_MAX = 0.1
+
+# status updates from a background poller older than this (s) are not trusted
+POLLER_TIMEOUT = 1.0
+
+# time (s) the stage status may lag behind a move command, can be overridden with
+# `stage_status_delay` in the microscope config
+STATUS_DELAY = {'jeol': 0.5}
+
+# combinations of axes that the microscope interfaces move in a single step
+SINGLE_MOVES = ({'x'}, {'y'}, {'x', 'y'}, {'z'}, {'a'}, {'b'})
+
+# the stage has settled when it drifts slower than this (nm/s, degrees/s) over
+# `SETTLE_READOUTS` consecutive intervals of `SETTLE_INTERVAL` s
+SETTLE_TOLERANCE = {'x': 50.0, 'y': 50.0, 'z': 50.0, 'a': 0.05, 'b': 0.05}
+SETTLE_INTERVAL = 0.05
+SETTLE_READOUTS = 4
+
+# number of moves kept in `Stage.move_log`
+MOVE_LOG_SIZE = 1000
+
 
 class Stage:
     """Stage control."""
@@ -23,6 +55,30 @@ class Stage:
         self._getter = self._tem.getStagePosition
         self._wait = True  # properties only
 
+        self.adaptive_wait = config.settings.stage_adaptive_wait
+        self.status_delay = getattr(
+            config.microscope,
+            'stage_status_delay',
+            STATUS_DELAY.get(config.microscope.interface, 0.0),
+        )
+        self.speeds = dict(STAGE_SPEEDS)
+        self.overheads = {axis: 0.0 for axis in STAGE_SPEEDS}  # fixed time per move (s)
+        self._measured = set()  # axes for which the speed has been measured
+        self._moves = defaultdict(lambda: deque(maxlen=MOVE_FIT_SIZE))  # (distance, time)
+        self._timings = defaultdict(lambda: {'moves': 0, 'time': 0.0, 'max': 0.0, 'polls': 0})
+
+        # status notifications from a background poller (see `notify_moving`)
+        self._status = threading.Condition()
+        self._status_moving = False
+        self._status_time = -np.inf
+
+        self.move_log = deque(maxlen=MOVE_LOG_SIZE)
+        self._move_queue = None
+        self._queued = set()
+
+        # serializes the moves of the main thread and the paths queued in the background
+        self._lock = threading.RLock()
+
     def __repr__(self):
         x, y, z, a, b = self.get()
         return f'{self.name}(x={x:.1f}, y={y:.1f}, z={z:.1f}, a={a:.1f}, b={b:.1f})'
@@ -42,7 +98,24 @@ class Stage:
         wait: bool = True,
     ) -> None:
         """Wait: bool, block until stage movement is complete (JEOL only)"""
-        self._setter(x, y, z, a, b, wait=wait)
+        targets = {axis: val for axis, val in zip('xyzab', (x, y, z, a, b)) if val is not None}
+
+        with self._lock:
+            # moves of several axes are carried out step by step by the interface
+            if not (wait and self.adaptive_wait and set(targets) in SINGLE_MOVES):
+                self._setter(x, y, z, a, b, wait=wait)
+                return
+
+            distances = self._distances(targets)
+
+            t0 = time.perf_counter()
+            self._setter(x, y, z, a, b, wait=False)
+            self._wait_adaptive(distances, t0=t0)
+
+    def _distances(self, targets: dict) -> dict:
+        """Distance from the current position to the targets of every axis."""
+        current = self.get()
+        return {axis: abs(val - getattr(current, axis)) for axis, val in targets.items()}
 
     def set_with_speed(
         self,
@@ -59,11 +132,15 @@ class Stage:
         wait: ignored, but necessary for compatibility with JEOL API
         speed: float, set stage rotation with specified speed (FEI only)
         """
-        self._setter(x, y, z, a, b, wait=wait, speed=speed)
+        with self._lock:
+            self._setter(x, y, z, a, b, wait=wait, speed=speed)
 
     def set_rotation_speed(self, speed=1) -> None:
         """Sets the stage (rotation) movement speed on the TEM."""
         self._tem.setRotationSpeed(value=speed)
+        # the rotation speed has to be measured again
+        self._measured.discard('a')
+        self._moves.pop('a', None)
 
     def set_a_with_speed(self, a: float, speed: int, wait: bool = False):
         """Rotate to angle `a` with speed (JEOL only).
@@ -203,7 +280,359 @@ class Stage:
 
     def wait(self) -> None:
         """Blocking call that waits for stage movement to finish."""
-        self._tem.waitForStage()
+        if self.adaptive_wait:
+            self._wait_adaptive()
+        else:
+            self._tem.waitForStage()
+
+    def predict_move_time(self, distances: dict) -> float:
+        """Predict how long (s) it takes to move the given distance along
+        every axis (i.e. {'x': 10000, 'y': 5000}), using the overheads and
+        speeds learned from previous moves."""
+        times = (
+            self.overheads[axis] + dist / self.speeds[axis] for axis, dist in distances.items()
+        )
+        return max(times, default=0.0)
+
+    def notify_moving(self, moving: bool, t: float = None) -> None:
+        """Report the stage status from a background poller.
+
+        As long as the reports keep coming in, waiting for the stage
+        blocks on these notifications, instead of querying the
+        microscope itself.
+
+        moving: bool,
+            whether the stage is moving
+        t: float,
+            time (`time.perf_counter`) the status was read, reports that
+            were read before a move command are ignored while waiting for
+            that move. Defaults to the current time.
+        """
+        if t is None:
+            t = time.perf_counter()
+        with self._status:
+            if t <= self._status_time:
+                return  # out of order
+            self._status_moving = bool(moving)
+            self._status_time = t
+            self._status.notify_all()
+
+    def _next_status(self, timeout: float, since: float) -> (bool, bool):
+        """Return the stage status and whether it came from the poller.
+
+        If a background poller is active, wait up to `timeout` s for its
+        next report read after `since`, otherwise query the microscope.
+        """
+        with self._status:
+            last = self._status_time
+            if time.perf_counter() - last < POLLER_TIMEOUT:
+                since = max(last, since)
+                if self._status.wait_for(lambda: self._status_time > since, timeout=timeout):
+                    return self._status_moving, True
+        return self.is_moving(), False
+
+    def _wait_adaptive(self, distances: dict = None, t0: float = None) -> None:
+        """Wait for the stage to stop moving.
+
+        Once the speeds of the axes have been measured, the first readout
+        is delayed until 80% of the predicted move time (at most `POLL_MAX`),
+        after which the status is polled at increasing intervals, or more
+        often as the predicted end of the move approaches. The
+        status may lag behind the move command (`status_delay`), so the
+        stage is only considered stopped if it was seen moving, or once this
+        delay has passed, however short the move.
+
+        distances: dict,
+            distance to move along every axis, used to predict the duration
+        t0: float,
+            time (`time.perf_counter`) the move was started
+        """
+        # the move command has been sent, earlier readouts are outdated
+        issued = time.perf_counter()
+        if t0 is None:
+            t0 = issued
+
+        grace = self.status_delay
+        end = None  # predicted end of the move
+        if distances:
+            predicted = self.predict_move_time(distances)
+            # only rely on the prediction once the speeds have been measured
+            if self._measured.issuperset(distances):
+                end = t0 + predicted
+                first = t0 + min(0.8 * predicted, POLL_MAX)
+                time.sleep(max(0.0, first - time.perf_counter()))
+
+        interval = POLL_MIN
+        last_moving = None
+        polls = 0
+
+        while True:
+            moving, notified = self._next_status(timeout=interval, since=issued)
+            polls += 1
+            now = time.perf_counter()
+
+            if moving:
+                last_moving = now
+            elif last_moving is not None or now - t0 >= grace:
+                break
+
+            if end is not None and end - now > POLL_MIN:
+                # poll more often as the predicted end of the move approaches
+                delay = min((end - now) / 2, POLL_MAX)
+            else:
+                delay = interval
+                interval = min(2 * interval, POLL_MAX)
+
+            if not notified:
+                time.sleep(delay)
+
+        # the move finished between the last two readouts
+        elapsed = now - t0
+        duration = elapsed if last_moving is None else (last_moving + now) / 2 - t0
+        self._record_timing(distances, elapsed, duration, polls, moved=last_moving is not None)
+
+    def _record_timing(
+        self, distances: dict, elapsed: float, duration: float, polls: int, moved: bool
+    ):
+        """Update the timing statistics, and the overhead and speed of the
+        axis that took the longest to move from the estimated `duration` of
+        the move."""
+        for axis in distances or ('wait',):
+            stats = self._timings[axis]
+            stats['moves'] += 1
+            stats['time'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['polls'] += polls
+
+        if not distances:
+            return
+
+        axis = max(distances, key=lambda key: self.predict_move_time({key: distances[key]}))
+        distance = distances[axis]
+        if distance <= 0:
+            return
+
+        if not moved:
+            # the move was over before the first readout, so it took at most `duration`,
+            # which only tells something if the move was predicted to take longer
+            if axis not in self._measured:
+                return
+            if duration >= self.predict_move_time({axis: distance}):
+                return
+
+        self._moves[axis].append((distance, duration))
+        self._measured.add(axis)
+        self._fit_move_time(axis)
+
+    def _fit_move_time(self, axis: str) -> None:
+        """Fit the recent moves of `axis`, so that moving a distance `d`
+        takes `overhead + d / speed` (s)."""
+        distance, duration = np.array(self._moves[axis]).T
+
+        overhead = self.overheads[axis]
+        if distance.max() > 2 * distance.min():
+            slope, intercept = np.polyfit(distance, duration, 1)
+            if slope > 0 and intercept >= 0:
+                self.speeds[axis] = 1 / slope
+                self.overheads[axis] = intercept
+                return
+            overhead = 0.0
+
+        # the distances are too similar to tell the overhead from the travel time
+        travel = np.sum(duration - overhead)
+        if travel <= 0:
+            overhead = 0.0
+            travel = np.sum(duration)
+        self.speeds[axis] = np.sum(distance) / travel
+        self.overheads[axis] = overhead
+
+    def timing_stats(self) -> dict:
+        """Return the statistics of the stage waits per axis: the number of
+        moves, total/mean/maximum time spent waiting (s), the mean number of
+        status readouts, and the current speed and overhead (s) estimates."""
+        stats = {}
+        for axis, d in self._timings.items():
+            n = d['moves']
+            stats[axis] = {
+                'moves': n,
+                'time': d['time'],
+                'mean': d['time'] / n,
+                'max': d['max'],
+                'polls': d['polls'] / n,
+                'speed': self.speeds.get(axis),
+                'overhead': self.overheads.get(axis),
+            }
+        return stats
+
+    def wait_until_settled(
+        self,
+        axes: str = 'xyzab',
+        timeout: float = 1.0,
+        tolerance: dict = None,
+        min_time: float = 0.0,
+    ) -> bool:
+        """Wait until the stage position is stable, i.e. the readouts over
+        the last `SETTLE_READOUTS` * `SETTLE_INTERVAL` s (0.2 s) spread less
+        than the drift tolerance allows on all given axes. This also catches
+        the slow creep of the stage after a move.
+
+        axes: str,
+            axes to check
+        timeout: float,
+            maximum time to wait (s)
+        tolerance: dict,
+            maximum drift rate for every axis (nm/s, degrees/s), updates the
+            defaults in `SETTLE_TOLERANCE`
+        min_time: float,
+            minimum time to wait (s), even if the stage is stable
+
+        Returns:
+            True if the stage settled within `timeout`
+        """
+        tolerance = {**SETTLE_TOLERANCE, **(tolerance or {})}
+        t_start = time.perf_counter()
+        t_end = t_start + max(timeout, min_time)
+
+        readouts = deque(maxlen=SETTLE_READOUTS + 1)
+        while True:
+            now = time.perf_counter()
+            readouts.append((now, self.get()))
+
+            if len(readouts) == readouts.maxlen and now - t_start >= min_time:
+                span = now - readouts[0][0]
+                if all(
+                    np.ptp([getattr(pos, axis) for _, pos in readouts])
+                    <= tolerance[axis] * span
+                    for axis in axes
+                ):
+                    return True
+            if now >= t_end:
+                return False
+
+            time.sleep(SETTLE_INTERVAL)
+
+    def _move(self, targets: dict, wait: bool, settle_time: float, settle_delay: float) -> dict:
+        """Send all axes in `targets` to the microscope at once, and wait
+        for the move to finish. Returns the entry for the move log."""
+        entry = {'target': targets, 'move': 0.0, 'settle': 0.0, 'settled': None}
+
+        with self._lock:
+            t0 = time.perf_counter()
+            if not wait:
+                self._setter(**targets, wait=False)
+            elif self.adaptive_wait:
+                distances = self._distances(targets)
+                t0 = time.perf_counter()
+                self._setter(**targets, wait=False)
+                self._wait_adaptive(distances, t0=t0)
+            else:
+                self._setter(**targets, wait=True)
+            t1 = time.perf_counter()
+            entry['move'] = t1 - t0
+
+            if wait and settle_time:
+                entry['settled'] = self.wait_until_settled(
+                    axes=targets, timeout=settle_time, min_time=settle_delay
+                )
+            elif wait and settle_delay:
+                time.sleep(settle_delay)
+            entry['settle'] = time.perf_counter() - t1
+
+        self.move_log.append(entry)
+        return entry
+
+    def move_path(
+        self,
+        waypoints: list,
+        settle_time: float = 1.0,
+        wait: bool = True,
+        settle_delay: float = 0.0,
+    ) -> list:
+        """Move the stage through a sequence of waypoints.
+
+        All axes of a waypoint are sent to the microscope as non-blocking
+        moves at once, so that the hardware can move them at the same time
+        (the interfaces otherwise move the axes one after the other). After
+        every move, the stage is checked to have come to rest (see
+        `wait_until_settled`) before moving on to the next waypoint.
+
+        waypoints: list,
+            dicts with the targets for one or more axes, i.e.
+            [{'x': 0, 'y': 0, 'z': 100}, {'a': 20}], None values are skipped
+        settle_time: float,
+            maximum time (s) to wait for the stage to settle after every
+            move, 0 to skip the stability check
+        wait: bool,
+            block until the last move is complete, and has settled
+        settle_delay: float,
+            minimum time (s) to wait after every move
+
+        Returns:
+            list with the timing of every move (s), as stored in `move_log`
+        """
+        waypoints = [
+            {axis: val for axis, val in dict(waypoint).items() if val is not None}
+            for waypoint in waypoints
+        ]
+        waypoints = [waypoint for waypoint in waypoints if waypoint]
+
+        log = []
+        for i, targets in enumerate(waypoints):
+            block = wait or i < len(waypoints) - 1
+            log.append(
+                self._move(
+                    targets, wait=block, settle_time=settle_time, settle_delay=settle_delay
+                )
+            )
+        return log
+
+    def queue_path(
+        self, waypoints: list, settle_time: float = 1.0, settle_delay: float = 0.0
+    ) -> Future:
+        """Like `move_path`, but carry out the moves in the background.
+
+        Queued paths are executed one after the other, in the order they
+        were queued. Every move holds the stage lock, so that moves from
+        other threads (`set`, `move_path`) wait for the current waypoint to
+        be reached, but they may be carried out between two waypoints of a
+        queued path. Returns a `concurrent.futures.Future` that resolves to
+        the timing log of the path.
+        """
+        if self._move_queue is None:
+            self._move_queue = ThreadPoolExecutor(max_workers=1)
+        future = self._move_queue.submit(
+            self.move_path, waypoints, settle_time=settle_time, settle_delay=settle_delay
+        )
+        self._queued.add(future)
+        future.add_done_callback(self._queued.discard)
+        return future
+
+    def close(self) -> None:
+        """Cancel the paths that are queued, wait for the current path to
+        finish, and stop the background thread of `queue_path`."""
+        if self._move_queue is None:
+            return
+        for future in list(self._queued):
+            future.cancel()
+        self._move_queue.shutdown(wait=True)
+        self._move_queue = None
+
+    def move_stats(self) -> dict:
+        """Return the number of logged moves, and the mean/maximum time (s)
+        spent moving and settling per move."""
+        if not self.move_log:
+            return {'moves': 0}
+        move = np.array([entry['move'] for entry in self.move_log])
+        settle = np.array([entry['settle'] for entry in self.move_log])
+        unsettled = sum(entry['settled'] is False for entry in self.move_log)
+        return {
+            'moves': len(move),
+            'move_mean': move.mean(),
+            'move_max': move.max(),
+            'settle_mean': settle.mean(),
+            'settle_max': settle.max(),
+            'unsettled': unsettled,
+        }
 
     @contextmanager
     def no_wait(self):
@@ -254,7 +683,12 @@ class Stage:
         pass
 
     def set_xy_with_backlash_correction(
-        self, x: int = None, y: int = None, step: float = 10000, settle_delay: float = 0.200
+        self,
+        x: int = None,
+        y: int = None,
+        step: float = 10000,
+        settle_delay: float = 0.200,
+        z: int = None,
     ) -> None:
         """Move to new x/y position with backlash correction. This is done by
         approaching the target x/y position always from the same direction.
@@ -264,16 +698,16 @@ class Stage:
         step: float,
             stepsize in nm
         settle_delay: float,
-            delay between movements in seconds to allow the stage to settle
+            minimum time in seconds to let the stage settle after every
+            move, the stage is also checked to have come to rest (see
+            `wait_until_settled`)
+        z: int,
+            if given, the stage height is changed together with the first move
         """
-        wait = True
-        self.set(x=x - step, y=y - step)
-        if settle_delay:
-            time.sleep(settle_delay)
-
-        self.set(x=x, y=y, wait=wait)
-        if settle_delay:
-            time.sleep(settle_delay)
+        self.move_path(
+            [{'x': x - step, 'y': y - step, 'z': z}, {'x': x, 'y': y}],
+            settle_delay=settle_delay,
+        )
 
     def move_xy_with_backlash_correction(
         self,
@@ -295,7 +729,9 @@ class Stage:
         step: float,
             stepsize in nm
         settle_delay: float,
-            delay between movements in seconds to allow the stage to settle
+            minimum time in seconds to let the stage settle after every
+            move, the stage is also checked to have come to rest (see
+            `wait_until_settled`)
         wait: bool,
             block until stage movement is complete (JEOL only)
         """
@@ -321,13 +757,11 @@ class Stage:
             pre_y = None
             target_y = None
 
-        self.set(x=pre_x, y=pre_y)
-        if settle_delay:
-            time.sleep(settle_delay)
-
-        self.set(x=target_x, y=target_y, wait=wait)
-        if settle_delay:
-            time.sleep(settle_delay)
+        self.move_path(
+            [{'x': pre_x, 'y': pre_y}, {'x': target_x, 'y': target_y}],
+            wait=wait,
+            settle_delay=settle_delay,
+        )
 
     def eliminate_backlash_xy(self, step: float = 10000, settle_delay: float = 0.200) -> None:
         """Eliminate backlash by in XY by moving the stage away from the
@@ -337,7 +771,9 @@ class Stage:
         step: float,
             stepsize in nm
         settle_delay: float,
-            delay between movements in seconds to allow the stage to settle
+            minimum time in seconds to let the stage settle after every
+            move, the stage is also checked to have come to rest (see
+            `wait_until_settled`)
         """
         stage = self.get()
         self.set_xy_with_backlash_correction(
@@ -363,7 +799,9 @@ class Stage:
         n_steps: int > 0,
             number of steps to walk up to current angle
         settle_delay: float,
-            delay between movements in seconds to allow the stage to settle
+            minimum time in seconds to let the stage settle after every
+            step, the stage is also checked to have come to rest (see
+            `wait_until_settled`)
         """
         current = self.a
 
@@ -376,6 +814,5 @@ class Stage:
 
         n_steps += 1
 
-        for i in reversed(range(n_steps)):
-            self.a = current - s * i * step
-            time.sleep(settle_delay)
+        waypoints = [{'a': current - s * i * step} for i in reversed(range(n_steps))]
+        self.move_path(waypoints, settle_delay=settle_delay)
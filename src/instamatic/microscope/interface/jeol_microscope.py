@@ -288,7 +288,7 @@ class JeolMicroscope(MicroscopeBase):
         x, y, z, a, b, result = self.stage3.GetStatus()
         return x or y or z or a or b
 
-    def waitForStage(self, delay: float = 0.0, skip_delay: float = 0.5):
+    def waitForStage(self, delay: float = 0.01, skip_delay: float = 0.5):
         time.sleep(skip_delay)  # skip the first readout delay, necessary on NeoARM200
         while self.isStageMoving():
             if delay > 0:
@@ -134,6 +134,7 @@ class SimuMicroscope(MicroscopeBase):
                 'current': current,
                 'is_moving': False,
                 'speed': speed,
+                'overhead': 0.0,  # sec before the stage starts moving
                 'speed_setting': 12,
                 'direction': +1,
                 'start': 0.0,
@@ -171,7 +172,7 @@ class SimuMicroscope(MicroscopeBase):
         d['is_moving'] = True
         d['start'] = current
         d['end'] = val
-        d['t0'] = time.perf_counter()
+        d['t0'] = time.perf_counter() + d['overhead']
         d['direction'] = direction
 
     def _StagePositionGetter(self, var: str) -> float:
@@ -179,7 +180,7 @@ class SimuMicroscope(MicroscopeBase):
         d = self._stage_dict[var]
         is_moving = d['is_moving']
         if is_moving:
-            dt = time.perf_counter() - d['t0']
+            dt = max(time.perf_counter() - d['t0'], 0.0)
             direction = d['direction']
             speed = d['speed']
             start = d['start']
@@ -0,0 +1,272 @@
+"""Background sampling of the microscope state.
+
+`Telemetry` reads a set of getters (i.e. the stage position, beam shift,
+diffraction focus, function mode) from a single background thread at a
+fixed rate, and stores the samples in preallocated ring buffers. Other
+parts of the program (experiments, the GUI) can read the latest value or
+the recent history from the buffers, or subscribe to new samples, instead
+of each polling the microscope themselves.
+
+Usage:
+    telemetry = ctrl.start_telemetry(interval=0.1)
+    t, pos = telemetry.latest('stage')
+    times, values = telemetry.get('stage', since=t0)
+    df = telemetry.to_dataframe('stage')
+    ctrl.stop_telemetry()
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# default sampling interval (s) and number of samples kept per channel
+INTERVAL = 0.1
+SIZE = 10_000
+
+
+class RingBuffer:
+    """Fixed-size buffer of timestamped samples. The oldest samples are
+    overwritten when the buffer is full.
+
+    size: int,
+        maximum number of samples
+    width: int,
+        number of values per sample, None for samples that are stored as
+        python objects (i.e. strings)
+    """
+
+    def __init__(self, size: int, width: int = None):
+        self.size = size
+        self.width = width
+        self.times = np.full(size, np.nan)
+        if width is None:
+            self.values = np.empty(size, dtype=object)
+        else:
+            self.values = np.full((size, width), np.nan)
+        self.count = 0  # total number of samples appended
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, t: float, value) -> None:
+        i = self.count % self.size
+        self.times[i] = t
+        self.values[i] = value
+        self.count += 1
+
+    def latest(self) -> tuple:
+        """Return the last (time, value), or (nan, None) if empty."""
+        if self.count == 0:
+            return np.nan, None
+        i = (self.count - 1) % self.size
+        return self.times[i], self.values[i]
+
+    def get(self, since: float = None) -> (np.ndarray, np.ndarray):
+        """Return copies of the times and values in chronological order,
+        optionally only those recorded after `since`."""
+        n = len(self)
+        start = self.count - n
+        order = (np.arange(n) + start) % self.size
+        times = self.times[order]
+        values = self.values[order]
+        if since is not None:
+            sel = times > since
+            times, values = times[sel], values[sel]
+        return times, values
+
+
+def default_channels(ctrl) -> dict:
+    """Getters for the parts of the microscope state that are sampled by
+    default.
+
+    Every channel is a tuple of the getter and the names of the values it
+    returns (None for a single value that is not a number).
+    """
+    return {
+        'stage': (ctrl.stage.get, ('x', 'y', 'z', 'a', 'b')),
+        'stage_moving': (ctrl.stage.is_moving, ('moving',)),
+        'beamshift': (ctrl.beamshift.get, ('x', 'y')),
+        'difffocus': (ctrl.difffocus.get, ('value',)),
+        'mode': (ctrl.mode.get, None),
+    }
+
+
+class Telemetry:
+    """Sample microscope getters at a fixed rate in a background thread.
+
+    ctrl: TEMController,
+        used to set up the default channels (see `default_channels`), the
+        stage status is also passed on to `ctrl.stage.notify_moving`
+    channels: dict or list,
+        mapping of channel name to (getter, value names), or a list of
+        names of default channels. The getter is called without arguments
+        and must return a number, a tuple of numbers or (if the value
+        names are None) any other object.
+    interval: float,
+        time between samples (s)
+    size: int,
+        number of samples kept for every channel
+
+    Timestamps are given by `time.perf_counter`. Errors raised by a getter
+    are logged once and the sample is skipped.
+    """
+
+    def __init__(self, ctrl=None, channels=None, interval: float = INTERVAL, size: int = SIZE):
+        available = default_channels(ctrl) if ctrl is not None else {}
+        if channels is None:
+            channels = available
+        elif not isinstance(channels, dict):
+            channels = {name: available[name] for name in channels}
+
+        self.ctrl = ctrl
+        self.interval = interval
+        self.size = size
+        self.channels = {}
+        self.buffers = {}
+        for name, (getter, fields) in channels.items():
+            self.channels[name] = (getter, None if fields is None else tuple(fields))
+            self.buffers[name] = RingBuffer(size, None if fields is None else len(fields))
+
+        # offset to convert the timestamps to wall-clock time (`time.time`)
+        self.epoch = time.time() - time.perf_counter()
+
+        self._subscribers = []
+        self._new_sample = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failing = set()
+
+        self.n_samples = 0
+        self.n_late = 0  # sampling rounds that took longer than `interval`
+
+    def __repr__(self):
+        names = ', '.join(self.channels)
+        return f'{self.__class__.__name__}({names}; interval={self.interval})'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.stop()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling in the background."""
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='Telemetry', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling, the recorded data remain available."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while not self._stop.is_set():
+            self.sample()
+
+            next_time += self.interval
+            delay = next_time - time.perf_counter()
+            if delay < 0:
+                # fell behind, do not try to catch up
+                self.n_late += 1
+                next_time = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+
+    def sample(self) -> None:
+        """Read all channels once, store the values and notify the
+        subscribers."""
+        samples = []
+        for name, (getter, fields) in self.channels.items():
+            t_read = time.perf_counter()
+            try:
+                value = getter()
+            except Exception as e:
+                if name not in self._failing:
+                    logger.warning('Telemetry: cannot read `%s`: %r', name, e)
+                    self._failing.add(name)
+                continue
+            self._failing.discard(name)
+
+            t = time.perf_counter()
+            self.buffers[name].append(t, value)
+            samples.append((name, t, value))
+
+            if name == 'stage_moving' and self.ctrl is not None:
+                # lets `Stage.wait` block on the samples instead of polling itself
+                self.ctrl.stage.notify_moving(value, t=t_read)
+
+        with self._new_sample:
+            self.n_samples += 1
+            self._new_sample.notify_all()
+
+        for callback, channels in list(self._subscribers):
+            for name, t, value in samples:
+                if channels is None or name in channels:
+                    try:
+                        callback(name, t, value)
+                    except Exception:
+                        logger.exception('Telemetry: subscriber %r failed', callback)
+
+    def subscribe(self, callback, channels: list = None) -> None:
+        """Call `callback(name, time, value)` from the sampling thread for
+        every new sample of the given channels (all if None). Callbacks
+        should return quickly, as they delay the next sample."""
+        self._subscribers.append((callback, None if channels is None else set(channels)))
+
+    def unsubscribe(self, callback) -> None:
+        self._subscribers = [sub for sub in self._subscribers if sub[0] is not callback]
+
+    def wait_for_sample(self, timeout: float = None) -> bool:
+        """Block until the next round of samples has been recorded.
+
+        Returns False on timeout.
+        """
+        with self._new_sample:
+            n = self.n_samples
+            return self._new_sample.wait_for(lambda: self.n_samples > n, timeout=timeout)
+
+    def latest(self, name: str) -> tuple:
+        """Return the (time, value) of the last sample of channel `name`."""
+        t, value = self.buffers[name].latest()
+        fields = self.channels[name][1]
+        if value is not None and fields is not None and len(fields) == 1:
+            value = value[0]
+        return t, value
+
+    def get(self, name: str, since: float = None) -> (np.ndarray, np.ndarray):
+        """Return the times (N,) and values (N, n_values) of channel `name`,
+        optionally only those recorded after `since` (`time.perf_counter`)."""
+        return self.buffers[name].get(since=since)
+
+    def to_numpy(self, since: float = None) -> dict:
+        """Return a dict with the (times, values) of every channel."""
+        return {name: self.get(name, since=since) for name in self.channels}
+
+    def to_dataframe(self, name: str, since: float = None):
+        """Return the samples of channel `name` as a `pandas.DataFrame`,
+        indexed by the (wall-clock) time of the samples."""
+        import pandas as pd
+
+        times, values = self.get(name, since=since)
+        index = pd.to_datetime(times + self.epoch, unit='s')
+        fields = self.channels[name][1] or (name,)
+        if values.ndim == 1:
+            values = list(values)
+        return pd.DataFrame(values, index=index, columns=fields)
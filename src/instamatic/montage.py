@@ -31,28 +31,33 @@ class InstamaticMontage(Montage):
         self.magnification = magnification
 
     @classmethod
-    def from_montage_yaml(cls, filename: str = 'montage.yaml'):
-        """Load montage from a series of tiff files + `montage.yaml`"""
+    def from_montage_yaml(cls, filename: str = 'montage.yaml', cache_size: int = 64):
+        """Load montage from a series of tiff files + `montage.yaml`
+
+        The images are loaded lazily when they are needed, and at most
+        `cache_size` images are kept in memory at the same time.
+        """
         import yaml
 
-        from instamatic.formats import read_tiff
+        from instamatic.formats import ImageCollection
 
         p = Path(filename)
         drc = p.parent
 
         d = yaml.safe_load(open(p))
-        fns = (drc / fn for fn in d['filenames'])
+        fns = [drc / fn for fn in d['filenames']]
 
         d['stagecoords'] = np.array(d['stagecoords'])
         d['stagematrix'] = np.array(d['stagematrix'])
 
-        images = [read_tiff(fn)[0] for fn in fns]
+        images = ImageCollection(fns, cache_size=cache_size)
 
         gridspec = {
             k: v for k, v in d.items() if k in ('gridshape', 'direction', 'zigzag', 'flip')
         }
 
         m = cls(images=images, gridspec=gridspec, **d)
+        m.directory = drc
         m.update_gridspec(flip=not d['flip'])  # BUG: Work-around for gridspec madness
         # Possibly related is that images are rotated 90 deg. in SerialEM mrc files
 
@@ -70,8 +75,78 @@ class InstamaticMontage(Montage):
 
         write_tiff(outfile, self.stitched)
 
-    def to_browser(self):
+    def to_browser(self, pyramid=None):
+        """Return a `Browser` for this montage, which shows the `TilePyramid`
+        if given, otherwise the stitched image."""
         from instamatic.browser import Browser
 
-        browser = Browser(self)
+        browser = Browser(self, pyramid=pyramid)
         return browser
+
+    def _tile_coords(self) -> np.ndarray:
+        """Pixel coordinates of the images, as used by `stitch`."""
+        coords = getattr(self, 'optimized_coords', None)
+        if coords is None:
+            coords = getattr(self, 'coords', None)
+        if coords is None:
+            coords = self.calculate_montage_coords()
+        return coords
+
+    def to_pyramid(self, drc: str = None, **kwargs):
+        """Return a `TilePyramid` of the images, to browse the montage
+        without stitching it in memory.
+
+        Parameters
+        ----------
+        drc : str
+            Directory to store the downsampled tiles, defaults to `pyramid`
+            next to the `montage.yaml` file, or in the working directory
+        """
+        from instamatic.tiles import TilePyramid
+
+        if drc is None:
+            drc = Path(getattr(self, 'directory', '.')) / 'pyramid'
+
+        return TilePyramid(self.images, self._tile_coords(), drc=drc, **kwargs)
+
+    def coordinate_index(self, stagematrix=None):
+        """Return a `CoordinateIndex` to convert between pixel and stage
+        coordinates with KD-tree lookups, with the same result as
+        `pixel_to_stagecoord` and `stage_to_pixelcoord`."""
+        from instamatic.tiles import CoordinateIndex
+
+        if stagematrix is None:
+            stagematrix = self.stagematrix
+
+        index = getattr(self, '_coordinate_index', None)
+        key = (id(self.coords), id(self.stagecoords), id(getattr(self, 'centers', None)))
+        if (
+            index is None
+            or index.key != key
+            or not np.array_equal(index.stagematrix, stagematrix)
+        ):
+            index = CoordinateIndex(
+                self.coords,
+                self.stagecoords,
+                stagematrix,
+                self.image_shape,
+                binning=getattr(self, 'stitched_binning', 1),
+                centers=getattr(self, 'centers', None),
+            )
+            index.key = key
+            self._coordinate_index = index
+        return index
+
+    def pixel_to_stagecoords(self, pixelcoords, stagematrix=None, plot: bool = False):
+        """Convert a list of pixel coordinates into stage coordinates, see
+        `coordinate_index`."""
+        if plot:
+            return super().pixel_to_stagecoords(pixelcoords, stagematrix, plot=plot)
+        return self.coordinate_index(stagematrix).pixel_to_stage(np.atleast_2d(pixelcoords))
+
+    def stage_to_pixelcoords(self, stage_coords, stagematrix=None, plot: bool = False):
+        """Convert a list of stage coordinates into pixel coordinates, see
+        `coordinate_index`."""
+        if plot:
+            return super().stage_to_pixelcoords(stage_coords, stagematrix, plot=plot)
+        return self.coordinate_index(stagematrix).stage_to_pixel(np.atleast_2d(stage_coords))
@@ -1,61 +1,146 @@
 from __future__ import annotations
 
 import pickle
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
-with open(Path(__file__).parent / 'weights-py3.p', 'rb') as p_file:
-    weights = pickle.load(p_file)
+WEIGHTS_FILE = Path(__file__).parent / 'weights-py3.p'
 
+# number of images evaluated at the same time, limits memory use of the first layer
+BATCH_SIZE = 16
 
-def conv_layer(in_layer, weight, offset):
-    first_layer = np.ones(
-        [(in_layer.shape[0] - 2) * (in_layer.shape[1] - 2), in_layer.shape[2], 3, 3]
+
+@lru_cache(maxsize=None)
+def get_weights() -> tuple:
+    """Load the network weights on first use.
+
+    The weights are converted to float32 and the convolution kernels are
+    kept in the (3, 3, n_in, n_out) layout used by `conv_layer`.
+    """
+    with open(WEIGHTS_FILE, 'rb') as p_file:
+        weights = pickle.load(p_file)
+    return tuple(np.ascontiguousarray(w, dtype=np.float32) for w in weights)
+
+
+def __getattr__(name):
+    # keep `neural_network.weights` available without loading it at import
+    if name == 'weights':
+        return list(get_weights())
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def _windows(in_layer):
+    """Return a (N, H-2, W-2, 3, 3, C) view of all 3x3 windows of a (N, H,
+    W, C) array without copying."""
+    n, h, w, c = in_layer.shape
+    sn, sh, sw, sc = in_layer.strides
+    return as_strided(
+        in_layer,
+        shape=(n, h - 2, w - 2, 3, 3, c),
+        strides=(sn, sh, sw, sh, sw, sc),
+        writeable=False,
     )
-    q = 0
-    for n in range(in_layer.shape[0] - 2):
-        for p in range(in_layer.shape[1] - 2):
-            first_layer[q] = np.transpose(in_layer[n : n + 3, p : p + 3], [2, 0, 1])
-            q += 1
-    convoluted = np.tensordot(first_layer, weight, axes=(((2, 3, 1), (0, 1, 2))))
-    convoluted_reshaped = convoluted.reshape([in_layer.shape[0] - 2, in_layer.shape[1] - 2, 64])
-    convoluted_reshaped += offset
 
-    return convoluted_reshaped
 
+def conv_layer(in_layer, weight, offset):
+    """3x3 valid convolution of a (N, H, W, C) or (H, W, C) array.
 
-def relu(convoluted):
-    convoluted[convoluted < 0] = 0
+    For few input channels, the windows are unrolled (im2col) and multiplied
+    with the kernel in one go. For many input channels, the im2col matrix
+    gets large, so the 9 shifted views of the input are multiplied with the
+    corresponding (C, n_out) slice of the kernel and summed instead.
+    """
+    single = in_layer.ndim == 3
+    if single:
+        in_layer = in_layer[np.newaxis]
+
+    n, h, w, c = in_layer.shape
+    h -= 2
+    w -= 2
+
+    if c * 9 <= 64:
+        cols = _windows(in_layer).reshape(n * h * w, 9 * c)
+        convoluted = np.dot(cols, weight.reshape(9 * c, -1)).reshape(n, h, w, -1)
+    else:
+        convoluted = None
+        for i in range(3):
+            for j in range(3):
+                contrib = np.matmul(in_layer[:, i : i + h, j : j + w, :], weight[i, j])
+                if convoluted is None:
+                    convoluted = contrib
+                else:
+                    convoluted += contrib
+    convoluted += offset
+
+    if single:
+        convoluted = convoluted[0]
     return convoluted
 
 
+def relu(convoluted):
+    return np.maximum(convoluted, 0, out=convoluted)
+
+
 def max_pooling(convoluted):
-    pooled = np.ones((convoluted.shape[0] // 2, convoluted.shape[1] // 2, convoluted.shape[2]))
-    for n in range(convoluted.shape[0] // 2):
-        for p in range(convoluted.shape[1] // 2):
-            pooled[n, p] = np.amax(
-                convoluted[n * 2 : n * 2 + 2, p * 2 : p * 2 + 2], axis=(0, 1)
-            )
-    return pooled
+    """2x2 max pooling of a (N, H, W, C) or (H, W, C) array (odd edges are
+    dropped)."""
+    *lead, h, w, c = convoluted.shape
+    h2, w2 = h // 2, w // 2
+    cropped = convoluted[..., : h2 * 2, : w2 * 2, :]
+    return cropped.reshape(*lead, h2, 2, w2, 2, c).max(axis=(-4, -2))
 
 
 def logistic(x):
-    return 1 / (1 + np.exp(-x))
-
-
-def predict(image, weights=weights):
-    convoluted1 = relu(conv_layer(image, weights[0], weights[1]))
-    pooled1 = max_pooling(convoluted1)
-    convoluted2 = relu(conv_layer(pooled1, weights[2], weights[3]))
-    pooled2 = max_pooling(convoluted2)
-    convoluted3 = relu(conv_layer(pooled2, weights[4], weights[5]))
-    pooled3 = max_pooling(convoluted3)
-    convoluted4 = relu(conv_layer(pooled3, weights[6], weights[7]))
-    pooled4 = max_pooling(convoluted4)
-    convoluted5 = relu(conv_layer(pooled4, weights[8], weights[9]))
-    flattened = convoluted5.reshape((1, 1600))
-    dense1 = relu(np.tensordot(flattened, weights[10], axes=(1, 0)) + weights[11])
-    dense2 = relu(np.tensordot(dense1, weights[12], axes=(1, 0)) + weights[13])
-    dense3 = np.tensordot(dense2, weights[14], axes=(1, 0)) + weights[15]
-    return logistic(dense3)[0][0]
+    with np.errstate(over='ignore'):
+        return 1 / (1 + np.exp(-x))
+
+
+def _forward(images, weights):
+    """Evaluate the network for a batch of (N, 150, 150, 1) images."""
+    x = images
+    for i in range(0, 8, 2):
+        x = max_pooling(relu(conv_layer(x, weights[i], weights[i + 1])))
+    x = relu(conv_layer(x, weights[8], weights[9]))
+
+    flattened = x.reshape((len(x), 1600))
+    dense1 = relu(np.dot(flattened, weights[10]) + weights[11])
+    dense2 = relu(np.dot(dense1, weights[12]) + weights[13])
+    dense3 = np.dot(dense2, weights[14]) + weights[15]
+    return logistic(dense3.astype(float))[:, 0]
+
+
+def predict(image, weights=None, batch_size: int = BATCH_SIZE):
+    """Predict the quality of a preprocessed diffraction pattern.
+
+    image: np.ndarray,
+        image of shape (150, 150, 1) as returned by `preprocess`, or a stack
+        of images with shape (N, 150, 150, 1)
+    weights: list,
+        network weights, by default the bundled weights are used
+    batch_size: int,
+        number of images that are evaluated together
+
+    Returns:
+        float for a single image, or an array of N predictions for a stack
+    """
+    if weights is None:
+        weights = get_weights()
+
+    images = np.asarray(image, dtype=np.float32)
+    single = images.ndim == 3
+    if single:
+        images = images[np.newaxis]
+
+    predictions = np.concatenate(
+        [
+            _forward(images[i : i + batch_size], weights)
+            for i in range(0, len(images), batch_size)
+        ]
+    )
+
+    if single:
+        return float(predictions[0])
+    return predictions
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import numpy as np
-from skimage.transform import resize
 
 
 def preprocess(image, n_std=4):
+    from skimage.transform import resize
+
     x, y = np.where(image > np.max(image) * 0.99)
     c_x, c_y = int(np.mean(x)), int(np.mean(y))
     size = 200
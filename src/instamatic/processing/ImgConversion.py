@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import collections
+import itertools
 import logging
 import time
 from datetime import datetime
@@ -11,10 +12,10 @@ import numpy as np
 from instamatic import config
 from instamatic.formats import read_tiff, write_adsc, write_mrc, write_tiff
 from instamatic.processing.flatfield import apply_flatfield_correction
-from instamatic.processing.stretch_correction import affine_transform_ellipse_to_circle
+from instamatic.processing.stretch_correction import get_distortion_model
 from instamatic.tools import (
-    find_beam_center,
-    find_beam_center_with_beamstop,
+    find_beam_centers,
+    find_beam_centers_with_beamstop,
     find_subranges,
     to_xds_untrusted_area,
 )
@@ -112,6 +113,102 @@ def get_calibrated_rotation_speed(val):
     return calibrated_value
 
 
+def format_table(fmt: str, *columns) -> str:
+    """Format the rows of `columns` with the %-style format string `fmt` in a
+    single operation, and return the lines as one string (ending with a
+    newline).
+
+    Integer columns are kept as integers, so that `%05d` works as expected.
+    """
+    n = len(columns[0])
+    if n == 0:
+        return ''
+    rows = zip(*(np.asarray(column).tolist() for column in columns))
+    return ((fmt + '\n') * n) % tuple(itertools.chain.from_iterable(rows))
+
+
+class FrameTable:
+    """Per-frame metadata of a rotation data set, stored as numpy columns
+    that are sorted by the frame number.
+
+    index: np.ndarray,
+        (N,) frame numbers of the observed frames
+    timestamp: np.ndarray,
+        (N,) acquisition time of every frame (`ImageGetTime`), nan if unknown
+    exposure: np.ndarray,
+        (N,) exposure time of every frame (`ImageExposureTime`), nan if unknown
+
+    The beam center of every frame (`beam_center`, (N, 2)) is nan until it
+    is determined by `ImgConversion.get_beam_centers`.
+    """
+
+    def __init__(self, index, timestamp=None, exposure=None):
+        index = np.asarray(index, dtype=int)
+        order = np.argsort(index, kind='stable')
+        n = len(index)
+
+        self.index = index[order]
+        nan = np.full(n, np.nan)
+        self.timestamp = nan.copy() if timestamp is None else np.asarray(timestamp)[order]
+        self.exposure = nan.copy() if exposure is None else np.asarray(exposure)[order]
+        self.beam_center = np.full((n, 2), np.nan)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(frames={len(self)}, range={self.first}-{self.last}, '
+            f'missing={len(self.missing)})'
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_headers(cls, headers: dict) -> FrameTable:
+        """Build the table from a dict of headers keyed by frame number."""
+
+        def column(key):
+            values = (h.get(key) for h in headers.values())
+            return np.array([np.nan if val is None else val for val in values], dtype=float)
+
+        return cls(
+            index=np.fromiter(headers.keys(), dtype=int, count=len(headers)),
+            timestamp=column('ImageGetTime'),
+            exposure=column('ImageExposureTime'),
+        )
+
+    @property
+    def first(self) -> int:
+        return int(self.index[0])
+
+    @property
+    def last(self) -> int:
+        return int(self.index[-1])
+
+    @property
+    def complete(self) -> np.ndarray:
+        """All frame numbers from the first to the last frame."""
+        return np.arange(self.first, self.last + 1)
+
+    @property
+    def observed(self) -> np.ndarray:
+        """Boolean mask over `complete`, True for the observed frames."""
+        mask = np.zeros(self.last - self.first + 1, dtype=bool)
+        mask[self.index - self.first] = True
+        return mask
+
+    @property
+    def missing(self) -> np.ndarray:
+        """Frame numbers between the first and last frame that were not
+        observed."""
+        return self.complete[~self.observed]
+
+    def angles(self, start_angle: float, step: float, index: np.ndarray = None) -> np.ndarray:
+        """Rotation angle `start_angle + step * i` of every frame `i`."""
+        if index is None:
+            index = self.index
+        return start_angle + step * index
+
+
 class ImgConversion:
     """This class is for post RED/cRED data collection image conversion. Files
     can be generated for REDp, DIALS, XDS, and PETS.
@@ -136,28 +233,11 @@ class ImgConversion:
             flatfield, h = read_tiff(flatfield)
         self.flatfield = flatfield
 
-        self.headers = {}
-        self.data = {}
-
         self.smv_subdrc = 'data'
 
-        while len(buffer) != 0:
-            i, img, h = buffer.pop(0)
-
-            self.headers[i] = h
-
-            if self.flatfield is not None:
-                self.data[i] = apply_flatfield_correction(img, self.flatfield)
-            else:
-                self.data[i] = img
+        self.load_buffer(buffer)
 
         self.untrusted_areas = []
-
-        self.observed_range = set(self.data.keys())
-        self.complete_range = set(range(min(self.observed_range), max(self.observed_range) + 1))
-        self.missing_range = self.observed_range ^ self.complete_range
-
-        self.data_shape = img.shape
         try:
             self.pixelsize = config.calibration['diff']['pixelsize'][
                 camera_length
@@ -200,6 +280,33 @@ class ImgConversion:
         self.mean_beam_center, self.beam_center_std = self.get_beam_centers()
         logger.debug(f'Primary beam at: {self.mean_beam_center}')
 
+    def load_buffer(self, buffer: list) -> None:
+        """Take the images and headers from `buffer` (which is emptied), apply
+        the flatfield correction, and set up the frame table."""
+        self.headers = {}
+        self.data = {}
+
+        # pop from the end, so that the memory of every image can be released as we go
+        buffer.reverse()
+        while len(buffer) != 0:
+            i, img, h = buffer.pop()
+
+            self.headers[i] = h
+
+            if self.flatfield is not None:
+                self.data[i] = apply_flatfield_correction(img, self.flatfield)
+            else:
+                self.data[i] = img
+
+        self.frames = FrameTable.from_headers(self.headers)
+
+        # kept as sets for backwards compatibility, the writers use `self.frames`
+        self.observed_range = set(self.frames.index.tolist())
+        self.complete_range = set(self.frames.complete.tolist())
+        self.missing_range = set(self.frames.missing.tolist())
+
+        self.data_shape = img.shape
+
     def check_settings(self) -> None:
         """Check for the presence of all required attributes.
 
@@ -235,6 +342,7 @@ class ImgConversion:
             'missing_range',
             'complete_range',
             'observed_range',
+            'frames',
             'headers',
             'data',
             'XDS_template',
@@ -257,26 +365,35 @@ class ImgConversion:
         """Obtain beam centers from the diffraction data Returns a tuple with
         the median beam center and its standard deviation."""
         shape_x, shape_y = self.data_shape
-        centers = []
-        for i, h in self.headers.items():
-            if self.use_beamstop:
-                cx, cy = find_beam_center_with_beamstop(self.data[i], z=99)
-            else:
-                cx, cy = find_beam_center(self.data[i], sigma=10)
+        keys = self.frames.index.tolist()
+        images = [self.data[i] for i in keys]
+
+        if self.use_beamstop:
+            centers = find_beam_centers_with_beamstop(images, z=99)
+            if np.isnan(centers).all():
+                logger.warning('Beam stop method failed, finding the beam from its profile')
+                centers = find_beam_centers(images, sigma=10)
+        else:
+            centers = find_beam_centers(images, sigma=10)
+
+        if invert_x:
+            centers[:, 0] = shape_x - centers[:, 0]
+        if invert_y:
+            centers[:, 1] = shape_y - centers[:, 1]
 
-            if invert_x:
-                cx = shape_x - cx
-            if invert_y:
-                cy = shape_y - cy
+        # avg_center = np.nanmean(centers, axis=0)
+        median_center = np.nanmedian(centers, axis=0)
+        std_center = np.nanstd(centers, axis=0)
 
-            h['beam_center'] = (cx, cy)
-            centers.append((cx, cy))
+        # frames in which the beam was not found get the median center
+        centers = np.where(np.isnan(centers), median_center, centers)
 
-        self._beam_centers = beam_centers = np.array(centers)
+        for i, (cx, cy) in zip(keys, centers.tolist()):
+            self.headers[i]['beam_center'] = (cx, cy)
 
-        # avg_center = np.mean(centers, axis=0)
-        median_center = np.median(beam_centers, axis=0)
-        std_center = np.std(beam_centers, axis=0)
+        self.frames.beam_center = centers
+
+        self._beam_centers = centers
 
         return median_center, std_center
 
@@ -295,22 +412,9 @@ class ImgConversion:
 
         center = np.array(self.mean_beam_center)
 
-        amplitude_pc = self.stretch_amplitude / (2 * 100)
-
         # To create the correct corrections the azimuth is mirrored
-        azimuth_rad = np.radians(180 - self.stretch_azimuth)
-
-        shape = self.data_shape
-
-        xi, yi = np.mgrid[0 : shape[0], 0 : shape[1]]
-        coords = np.stack([xi.flatten(), yi.flatten()], axis=1) - center
-
-        s = affine_transform_ellipse_to_circle(azimuth_rad, amplitude_pc)
-
-        new = np.dot(coords, s)
-
-        xcorr = (new[:, 0].reshape(shape) + center[0]) - xi
-        ycorr = (new[:, 1].reshape(shape) + center[1]) - yi
+        model = get_distortion_model(180 - self.stretch_azimuth, self.stretch_amplitude)
+        xcorr, ycorr = model.correction_tables(self.data_shape, center=center)
 
         # reverse XY coordinates for XDS
         xcorr, ycorr = ycorr, xcorr
@@ -326,7 +430,7 @@ class ImgConversion:
 
         path.mkdir(exist_ok=True)
 
-        for i in self.observed_range:
+        for i in self.frames.index.tolist():
             self.write_tiff(path, i)
 
         logger.debug(f'Tiff files saved in folder: {path}')
@@ -338,7 +442,7 @@ class ImgConversion:
         path = path / self.smv_subdrc
         path.mkdir(exist_ok=True)
 
-        for i in self.observed_range:
+        for i in self.frames.index.tolist():
             self.write_smv(path, i)
 
         logger.debug(f'SMV files saved in folder: {path}')
@@ -349,7 +453,7 @@ class ImgConversion:
 
         path.mkdir(exist_ok=True)
 
-        for i in self.observed_range:
+        for i in self.frames.index.tolist():
             self.write_mrc(path, i)
 
         logger.debug(f'MRC files created in folder: {path}')
@@ -388,7 +492,7 @@ class ImgConversion:
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
             futures = []
-            for i in self.observed_range:
+            for i in self.frames.index.tolist():
                 if write_tiff:
                     futures.append(executor.submit(self.write_tiff, tiff_path, i))
                 if write_mrc:
@@ -404,8 +508,8 @@ class ImgConversion:
 
         Files are written to the path given by `smv_path`.
         """
-        observed_range = self.observed_range
-        self.missing_range = self.missing_range
+        observed_range = self.frames.index.tolist()
+        missing_range = self.frames.missing.tolist()
 
         invert_rotation_axis = self.start_angle > self.end_angle
         rotation_xyz = rotation_axis_to_xyz(
@@ -415,13 +519,13 @@ class ImgConversion:
         export_dials_variables(
             smv_path,
             sequence=observed_range,
-            missing=self.missing_range,
+            missing=missing_range,
             rotation_xyz=rotation_xyz,
         )
 
         path = smv_path / self.smv_subdrc
 
-        i = min(observed_range)
+        i = self.frames.first
         empty = np.zeros_like(self.data[i])
         # copy header from first frame
         h = self.headers[i].copy()
@@ -429,9 +533,9 @@ class ImgConversion:
 
         # add data to self.data/self.headers so that existing functions can be used
         # make sure to remove them afterwards, not to interfere with other data writing
-        logger.debug(f'Writing missing files for DIALS: {self.missing_range}')
+        logger.debug(f'Writing missing files for DIALS: {missing_range}')
 
-        for n in self.missing_range:
+        for n in missing_range:
             self.data[n] = empty
             self.headers[n] = h
 
@@ -566,10 +670,15 @@ class ImgConversion:
             print('', file=f)
             print('FILELIST', file=f)
 
-            for i in self.observed_range:
-                fn = f'{i:05d}.mrc'
-                angle = self.start_angle + sign * self.osc_angle * i
-                print(f'FILE {fn}    {angle: 12.4f}    0    {angle: 12.4f}', file=f)
+            angles = self.frames.angles(self.start_angle, sign * self.osc_angle)
+            f.write(
+                format_table(
+                    'FILE %05d.mrc    % 12.4f    0    % 12.4f',
+                    self.frames.index,
+                    angles,
+                    angles,
+                )
+            )
 
             print('ENDFILELIST', file=f)
 
@@ -580,7 +689,7 @@ class ImgConversion:
 
         path.mkdir(exist_ok=True)
 
-        nframes = max(self.complete_range)
+        nframes = self.frames.last
 
         invert_rotation_axis = self.start_angle > self.end_angle
         rot_x, rot_y, rot_z = rotation_axis_to_xyz(
@@ -595,9 +704,10 @@ class ImgConversion:
         else:
             stretch_correction = ''
 
-        if self.missing_range:
+        missing = self.frames.missing
+        if len(missing):
             exclude = '\n'.join(
-                [f'EXCLUDE_DATA_RANGE={i} {j}' for i, j in find_subranges(self.missing_range)]
+                [f'EXCLUDE_DATA_RANGE={i} {j}' for i, j in find_subranges(missing.tolist())]
             )
         else:
             exclude = '!EXCLUDE_DATA_RANGE='
@@ -639,13 +749,12 @@ class ImgConversion:
 
     def write_beam_centers(self, path: str) -> None:
         """Write list of beam centers to file `beam_centers.txt` in `path`"""
-        centers = np.zeros((max(self.observed_range), 2), dtype=float)
-        for i, h in self.headers.items():
-            centers[i - 1] = h['beam_center']
-        for i in self.missing_range:
-            centers[i - 1] = [np.nan, np.nan]
+        # one row per frame number (starting at 1), nan for missing frames
+        centers = np.full((self.frames.last, 2), np.nan)
+        centers[self.frames.index - 1] = self.frames.beam_center
 
-        np.savetxt(path / 'beam_centers.txt', centers, fmt='%10.4f')
+        with open(path / 'beam_centers.txt', 'w') as f:
+            f.write(format_table('%10.4f %10.4f', centers[:, 0], centers[:, 1]))
 
     def write_pets_inp(self, path: str, tiff_path: str = 'tiff') -> None:
         """Write PETS input file `pets.pts` in directory `path`"""
@@ -687,10 +796,9 @@ class ImgConversion:
             # print("enddistortions", file=f)
             # print("", file=f)
             print('imagelist', file=f)
-            for i in self.observed_range:
-                fn = f'{i:05d}.tiff'
-                angle = self.start_angle + sign * self.osc_angle * i
-                print(f'{tiff_path}/{fn} {angle:10.4f} 0.00', file=f)
+            angles = self.frames.angles(self.start_angle, sign * self.osc_angle)
+            prefix = str(tiff_path).replace('%', '%%')
+            f.write(format_table(f'{prefix}/%05d.tiff %10.4f 0.00', self.frames.index, angles))
             print('endimagelist', file=f)
 
     def write_pets2_inp(self, path: str, tiff_path: str = 'tiff') -> None:
@@ -725,14 +833,12 @@ class ImgConversion:
             print('i/sigma    5.00   10.00', file=f)
             print('', file=f)
             print('imagelist', file=f)
-            tiff_set = {0}
-            last_img = len(self.observed_range)
-            tiff_set.update(self.observed_range)
-            tiff_set.remove(last_img)
-            for i in tiff_set:
-                fn = f'{i:04d}.tiff'
-                angle = self.start_angle + sign * self.osc_angle * i
-                print(f'{tiff_path}/{fn} {angle:10.4f} 0.00', file=f)
+            last_img = len(self.frames)
+            index = np.union1d([0], self.frames.index)
+            index = index[index != last_img]
+            angles = self.frames.angles(self.start_angle, sign * self.osc_angle, index=index)
+            prefix = str(tiff_path).replace('%', '%%')
+            f.write(format_table(f'{prefix}/%04d.tiff %10.4f 0.00', index, angles))
             print('endimagelist', file=f)
 
     def write_REDp_shiftcorrection(self, path: str) -> None:
@@ -742,8 +848,8 @@ class ImgConversion:
         cx, cy = self.mean_beam_center
         with open(path / 'shifts.sc', 'w') as f:
             print(f' {cy:.2f} {cx:.2f}', file=f)  # cx/cy must be switched around, y first
-            for i in self.observed_range:
-                print(f'{i:4d}{0:8.2f}{0:8.2f}', file=f)
+            zeros = np.zeros(len(self.frames))
+            f.write(format_table('%4d%8.2f%8.2f', self.frames.index, zeros, zeros))
 
     def add_beamstop(self, rect):
         """Rect must be a 2x4 coordinate array."""
@@ -2,14 +2,12 @@ from __future__ import annotations
 
 import sys
 from collections import namedtuple
+from functools import lru_cache, partial
 
-import matplotlib.pyplot as plt
 import numpy as np
 from scipy import ndimage
-from scipy._lib._util import _asarray_validated
-from scipy.cluster.vq import kmeans2
-from skimage import filters, measure, morphology, segmentation
 
+from instamatic import config
 from instamatic.config import calibration
 from instamatic.image_utils import autoscale
 
@@ -17,6 +15,24 @@ CrystalPosition = namedtuple(
     'CrystalPosition', ['x', 'y', 'isolated', 'n_clusters', 'area_micrometer', 'area_pixel']
 )
 
+# Segmentation engines, from slow and accurate to fast
+#   quality: random walker with the direct (brute force) solver
+#   balanced: random walker with the conjugate gradient solver (jacobi preconditioner)
+#   fast: watershed on the gradient image, starting from the same markers
+SEGMENTATION_PRESETS = {
+    'quality': {'method': 'random_walker', 'mode': 'bf'},
+    'balanced': {'method': 'random_walker', 'mode': 'cg_j'},
+    'fast': {'method': 'watershed'},
+}
+
+
+@lru_cache(maxsize=None)
+def get_disk(radius: int) -> np.ndarray:
+    """Disk-shaped structuring element, created once per radius."""
+    from skimage import morphology
+
+    return morphology.disk(radius)
+
 
 def isedge(prop):
     """Simple edge detection routine.
@@ -41,7 +57,7 @@ def isedge(prop):
 def whiten(obs, check_finite=False):
     """Adapted from c:/python27/lib/site-
     packages/skimage/filters/thresholding.py to return array and std_dev."""
-    obs = _asarray_validated(obs, check_finite=check_finite)
+    obs = np.asarray_chkfinite(obs) if check_finite else np.asarray(obs)
     std_dev = np.std(obs, axis=0)
     zero_std_mask = std_dev == 0
     if zero_std_mask.any():
@@ -52,7 +68,15 @@ def whiten(obs, check_finite=False):
     return obs / std_dev, std_dev
 
 
-def segment_crystals(img, r=101, offset=5, footprint=5, remove_carbon_lacing=True):
+def segment_crystals(
+    img,
+    r=101,
+    offset=5,
+    footprint=5,
+    remove_carbon_lacing=True,
+    method='random_walker',
+    mode='bf',
+):
     """
     r: `int`
        blocksize to calculate local threshold value
@@ -61,13 +85,22 @@ def segment_crystals(img, r=101, offset=5, footprint=5, remove_carbon_lacing=Tru
     offset: `int`
     Constant subtracted from weighted mean of neighborhood to calculate
         the local threshold value
+    method: `str`
+       how to segment the image starting from the thresholded features,
+       `random_walker`, `watershed`, or `threshold` (use the features as is)
+    mode: `str`
+       solver for the random walker, `bf` (slow, exact), `cg`, `cg_j`, or `cg_mg`
     """
+    from skimage import filters, morphology, segmentation
+
     # workaround, because segmentation.random_walker no longer accepts floats from 0-255.0
     offset = offset / 255.0
 
     # normalize
     img = img * (1.0 / img.max())
 
+    disk = get_disk(footprint)
+
     # adaptive thresholding, because contrast is not equal over image
     arr = img > filters.threshold_local(img, r, method='mean', offset=offset)
     arr = np.invert(arr)
@@ -76,31 +109,39 @@ def segment_crystals(img, r=101, offset=5, footprint=5, remove_carbon_lacing=Tru
     arr = morphology.remove_small_objects(arr, min_size=4 * 4, connectivity=0)  # remove noise
 
     # magic
-    arr = morphology.binary_closing(arr, morphology.disk(footprint))  # dilation + erosion
-    arr = morphology.binary_erosion(arr, morphology.disk(footprint))  # erosion
+    arr = morphology.binary_closing(arr, disk)  # dilation + erosion
+    arr = morphology.binary_erosion(arr, disk)  # erosion
 
     # remove carbon lines
     if remove_carbon_lacing:
         arr = morphology.remove_small_objects(arr, min_size=8 * 8, connectivity=0)
-        arr = morphology.remove_small_holes(arr, min_size=32 * 32, connectivity=0)
-    arr = morphology.binary_dilation(arr, morphology.disk(footprint))  # dilation
+        arr = morphology.remove_small_holes(arr, area_threshold=32 * 32, connectivity=0)
+    arr = morphology.binary_dilation(arr, disk)  # dilation
+
+    if method == 'threshold':
+        return arr, arr.astype(int)
 
     # get background pixels
-    bkg = np.invert(morphology.binary_dilation(arr, morphology.disk(footprint * 2)) | arr)
+    bkg = np.invert(morphology.binary_dilation(arr, get_disk(footprint * 2)) | arr)
 
     # 2: features
     # 1: background
     # 0: unlabeled
     markers = arr * 2 + bkg
 
-    # segment using random_walker
-    segmented = segmentation.random_walker(img, markers, beta=50, spacing=(5, 5), mode='bf')
+    if method == 'random_walker':
+        segmented = segmentation.random_walker(img, markers, beta=50, spacing=(5, 5), mode=mode)
+    elif method == 'watershed':
+        segmented = segmentation.watershed(filters.sobel(img), markers)
+    else:
+        raise ValueError(f'Unknown segmentation method: {method!r}')
+
     segmented = segmented.astype(int) - 1
 
     return arr, segmented
 
 
-def find_crystals_timepix(img, magnification, spread=0.6, plot=False, **kwargs):
+def find_crystals_timepix(img, magnification, spread=0.6, plot=False, preset=None, **kwargs):
     """Specialized function with better defaults for timepix camera."""
     r = kwargs.get('r', 75)
 
@@ -119,10 +160,11 @@ def find_crystals_timepix(img, magnification, spread=0.6, plot=False, **kwargs):
         offset=offset,
         r=r,
         remove_carbon_lacing=False,
+        preset=preset,
     )
 
 
-def find_crystals(img, magnification, spread=2.0, plot=False, **kwargs):
+def find_crystals(img, magnification, spread=2.0, plot=False, preset=None, **kwargs):
     """Function for finding crystals in a low contrast images. Used adaptive
     thresholds to find local features. Edges are detected, and rejected, on the
     basis of a histogram. Kmeans clustering is used to spread points over the
@@ -136,9 +178,19 @@ def find_crystals(img, magnification, spread=2.0, plot=False, **kwargs):
         Value in micrometer to roughly indicate the desired spread of centroids over individual regions
     plot: bool
         Whether to plot the results or not
+    preset: str
+        Segmentation preset, one of `SEGMENTATION_PRESETS` (quality, balanced, fast),
+        the default is taken from `config.settings.crystal_segmentation`
     **kwargs:
     keywords to pass to segment_crystals
     """
+    from scipy.cluster.vq import kmeans2
+    from skimage import measure
+
+    if preset is None:
+        preset = config.settings.crystal_segmentation
+    kwargs = {**SEGMENTATION_PRESETS[preset], **kwargs}
+
     img, scale = autoscale(img, maxdim=256)  # scale down for faster
 
     # segment the image, and find objects
@@ -191,6 +243,8 @@ def find_crystals(img, magnification, spread=2.0, plot=False, **kwargs):
             )
 
     if plot:
+        import matplotlib.pyplot as plt
+
         plt.imshow(img)
         plt.contour(seg, [0.5], linewidths=1.2, colors='yellow')
         if len(crystals) > 0:
@@ -203,6 +257,40 @@ def find_crystals(img, magnification, spread=2.0, plot=False, **kwargs):
     return crystals
 
 
+def find_crystals_batch(images, magnification, timepix=False, processes=None, **kwargs) -> list:
+    """Find crystals in many images in parallel, using a pool of processes.
+
+    images: list of 2d np.ndarray
+        Input images to locate crystals on
+    magnification: float or list
+        Magnification used for all images, or one value per image
+    timepix: bool
+        Use `find_crystals_timepix` instead of `find_crystals`
+    processes: int
+        Number of worker processes, defaults to the number of CPUs. If 1, the
+        images are processed in the current process.
+    **kwargs:
+        keywords to pass to `find_crystals`
+
+    Returns a list with the crystal positions for every image.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if np.ndim(magnification) == 0:
+        magnification = [magnification] * len(images)
+
+    # resolve the preset here, the config may differ in the worker processes
+    kwargs.setdefault('preset', config.settings.crystal_segmentation)
+
+    func = partial(find_crystals_timepix if timepix else find_crystals, **kwargs)
+
+    if processes == 1 or len(images) < 2:
+        return [func(img, mag) for img, mag in zip(images, magnification)]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(func, images, magnification))
+
+
 def main_entry():
     import argparse
 
@@ -9,7 +9,7 @@ from pathlib import Path
 import numpy as np
 from tqdm.auto import tqdm
 
-from instamatic import config, controller
+from instamatic import config
 from instamatic.formats import *
 
 
@@ -118,6 +118,7 @@ def collect_flatfield(
             exposure=exposure,
             binsize=binsize,
             out=outfile,
+            asynchronous=True,
             comment=f'Flat field #{n:04d}',
             header_keys=None,
         )
@@ -145,6 +146,7 @@ def collect_flatfield(
                 exposure=exposure,
                 binsize=binsize,
                 out=outfile,
+                asynchronous=True,
                 comment=f'Dark field #{n:04d}',
                 header_keys=None,
             )
@@ -160,6 +162,9 @@ def collect_flatfield(
 
     ctrl.cam.unblock()
 
+    # wait for the images that are saved in the background
+    ctrl.flush()
+
     print(f'\nFlatfield collection finished ({drc}).')
 
 
@@ -234,6 +239,8 @@ This will apply the flatfield correction (`-f`) and optionally the darkfield cor
     args = options.args
 
     if options.collect:
+        from instamatic import controller
+
         ctrl = controller.initialize()
         collect_flatfield(ctrl=ctrl, save_images=False)
         ctrl.close()
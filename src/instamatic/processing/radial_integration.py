@@ -0,0 +1,210 @@
+"""Azimuthal integration of diffraction patterns.
+
+`RadialIntegrator` turns a 2D diffraction pattern into a radial (powder)
+profile. The assignment of pixels to radial bins only depends on the image
+shape, the beam center and the binning, so it is computed once. Integrating
+an image is then a single `np.bincount` over the precomputed bin indices
+(or a sparse matrix product when pixels are split over several bins).
+Stacks are integrated in chunks of frames that fit in the CPU cache, with
+one `np.bincount` (or matrix product) per chunk.
+
+Usage:
+    integrator = get_radial_integrator(img.shape, center)
+    profile = integrator.integrate(img)
+    profiles = integrator.integrate(stack)  # (N, n_bins)
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+
+# number of pixels binned in one go when integrating a stack, larger chunks do not fit
+# in the CPU cache and are slower than binning the frames one by one
+CHUNK_PIXELS = 2**18
+
+
+class RadialIntegrator:
+    """Precomputed radial binning for images of a given shape and center.
+
+    shape: tuple,
+        shape of the images (H, W)
+    center: tuple,
+        (row, column) pixel coordinates of the beam center
+    bin_width: float,
+        width of the radial bins in pixels
+    oversample: int,
+        split every pixel into `oversample` x `oversample` sub-pixels that
+        are assigned to bins individually, which gives smoother profiles
+        for small bins
+    mask: np.ndarray,
+        boolean array, pixels that are True are excluded (i.e. beam stop,
+        dead pixels)
+    sectors: int,
+        split the azimuthal range into this many sectors, that are
+        integrated separately
+    """
+
+    def __init__(
+        self,
+        shape: tuple,
+        center: tuple,
+        bin_width: float = 1.0,
+        oversample: int = 1,
+        mask: np.ndarray = None,
+        sectors: int = 1,
+    ):
+        self.shape = tuple(shape)
+        self.center = tuple(float(c) for c in center)
+        self.bin_width = bin_width
+        self.oversample = oversample
+        self.sectors = sectors
+
+        n = oversample
+        offsets = (np.arange(n) + 0.5) / n - 0.5 if n > 1 else np.zeros(1)
+        dy, dx = (arr.ravel() for arr in np.meshgrid(offsets, offsets, indexing='ij'))
+
+        rows, cols = np.indices(self.shape)
+        # (n_pixels, n_sub) coordinates relative to the center
+        y = rows.reshape(-1, 1) + dy - self.center[0]
+        x = cols.reshape(-1, 1) + dx - self.center[1]
+
+        rbin = (np.sqrt(x**2 + y**2) / bin_width).astype(int)
+        self.n_bins = int(rbin.max()) + 1
+
+        if sectors > 1:
+            phi = np.arctan2(y, x) % (2 * np.pi)
+            sector = np.minimum((phi / (2 * np.pi) * sectors).astype(int), sectors - 1)
+            index = sector * self.n_bins + rbin
+        else:
+            index = rbin
+
+        n_out = self.n_bins * sectors
+        n_sub = index.shape[1]
+        keep = None if mask is None else ~np.asarray(mask, dtype=bool).ravel()
+
+        if n_sub == 1:
+            # every pixel goes to exactly one bin, masked pixels go to an extra bin
+            self._index = index.ravel()
+            if keep is not None:
+                self._index = np.where(keep, self._index, n_out)
+            self._matrix = None
+            self._chunk_index = None
+            self.norm = np.bincount(self._index, minlength=n_out + 1)[:n_out].astype(float)
+        else:
+            from scipy import sparse
+
+            pixel = np.repeat(np.arange(rows.size), n_sub)
+            weights = np.full(index.size, 1.0 / n_sub)
+            if keep is not None:
+                weights *= np.repeat(keep, n_sub)
+
+            self._index = None
+            self._matrix = sparse.csr_matrix(
+                (weights, (index.ravel(), pixel)), shape=(n_out, rows.size)
+            )
+            self._matrix.eliminate_zeros()
+            self.norm = np.asarray(self._matrix.sum(axis=1)).ravel()
+
+        # bin index of every pixel center, used to map a profile back onto the image
+        rows, cols = rows - self.center[0], cols - self.center[1]
+        self._pixel_bins = (np.sqrt(rows**2 + cols**2) / bin_width).astype(int)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(shape={self.shape}, center={self.center}, '
+            f'bin_width={self.bin_width}, n_bins={self.n_bins})'
+        )
+
+    @property
+    def radii(self) -> np.ndarray:
+        """Radius (in pixels) at the start of every bin."""
+        return np.arange(self.n_bins) * self.bin_width
+
+    def _reshape(self, values: np.ndarray, lead: tuple) -> np.ndarray:
+        if self.sectors > 1:
+            return values.reshape(*lead, self.sectors, self.n_bins)
+        return values.reshape(*lead, self.n_bins)
+
+    def integrate(self, img: np.ndarray, average: bool = True) -> np.ndarray:
+        """Integrate an image (H, W) or a stack of images (N, H, W).
+
+        average: bool,
+            return the mean intensity per bin, otherwise the sum
+
+        Returns:
+            profile of shape (n_bins,) or (N, n_bins); with an extra
+            (sectors,) axis before the bins if `sectors` > 1. Empty bins
+            are NaN when averaging.
+        """
+        img = np.asarray(img)
+        if img.shape[-2:] != self.shape:
+            raise ValueError(f'Image shape {img.shape[-2:]} does not match {self.shape}')
+
+        lead = img.shape[:-2]
+        n_pixels = self.shape[0] * self.shape[1]
+        flat = img.reshape(-1, n_pixels)
+
+        n_out = len(self.norm)
+        step = max(1, CHUNK_PIXELS // n_pixels)
+        summed = [np.empty((0, n_out))]
+
+        for i in range(0, len(flat), step):
+            chunk = flat[i : i + step]
+            n = len(chunk)
+            if self._matrix is None:
+                # the bin indices are offset for every frame, so that a chunk of frames
+                # is binned with a single `np.bincount`
+                counts = np.bincount(
+                    self._get_chunk_index(step)[: n * n_pixels],
+                    chunk.ravel(),
+                    minlength=n * (n_out + 1),
+                )
+                summed.append(counts.reshape(n, n_out + 1)[:, :n_out])
+            else:
+                summed.append((self._matrix @ chunk.T.astype(float)).T)
+
+        summed = np.concatenate(summed)
+
+        if average:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                summed = summed / self.norm
+
+        return self._reshape(summed, lead)
+
+    def _get_chunk_index(self, n: int) -> np.ndarray:
+        """Bin indices of a chunk of `n` frames, offset for every frame."""
+        if self._chunk_index is None or len(self._chunk_index) < n * len(self._index):
+            offsets = np.arange(n) * (len(self.norm) + 1)
+            self._chunk_index = (offsets[:, np.newaxis] + self._index).ravel()
+        return self._chunk_index
+
+    def radial_map(self, profile: np.ndarray) -> np.ndarray:
+        """Map a radial profile (n_bins,) back onto the image, so that every
+        pixel gets the value of the bin it belongs to."""
+        if self.sectors > 1:
+            raise ValueError('Cannot map the profile of multiple sectors')
+        return np.asarray(profile)[..., self._pixel_bins]
+
+
+@lru_cache(maxsize=8)
+def _get_radial_integrator(shape, center, bin_width, oversample, sectors) -> RadialIntegrator:
+    return RadialIntegrator(
+        shape, center, bin_width=bin_width, oversample=oversample, sectors=sectors
+    )
+
+
+def get_radial_integrator(
+    shape: tuple, center: tuple, bin_width: float = 1.0, oversample: int = 1, sectors: int = 1
+) -> RadialIntegrator:
+    """Return a cached `RadialIntegrator` for the given image shape, center,
+    and binning. Integrators with a mask are not cached, create them
+    directly."""
+    return _get_radial_integrator(
+        tuple(int(n) for n in shape),
+        tuple(float(c) for c in center),
+        bin_width,
+        oversample,
+        sectors,
+    )
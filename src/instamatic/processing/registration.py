@@ -0,0 +1,241 @@
+"""Image registration by phase correlation.
+
+`Registration` determines the translation between a fixed reference image
+and one or more moving images. The (real) Fourier transform of the
+reference is computed once and reused, and a stack of images can be
+registered in one go, so that the FFTs are batched and can be spread over
+several threads. The peak of the correlation is refined to subpixel
+precision by evaluating the inverse transform on an upsampled grid around
+it (matrix-multiply DFT, after Guizar-Sicairos et al., 2008).
+
+The shift returned follows the convention of
+`skimage.registration.phase_cross_correlation`: it is the shift to apply
+to the moving image to register it with the reference.
+
+Usage:
+    reg = Registration(img_cent, upsample_factor=10)
+    shift, confidence = reg.register(img)
+    shifts, confidences = reg.register_many(stack)
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+from scipy import fft
+
+# number of images transformed together by `register_many`
+BATCH_SIZE = 16
+
+
+@lru_cache(maxsize=8)
+def get_window(shape: tuple, kind: str = 'hann') -> np.ndarray:
+    """Return a 2D apodization window to suppress edge effects."""
+    if kind != 'hann':
+        raise ValueError(f'Unknown window: {kind!r}')
+    return np.outer(np.hanning(shape[0]), np.hanning(shape[1]))
+
+
+def _cross_power(ref_freq: np.ndarray, mov_freq: np.ndarray, normalize: bool = True):
+    """Cross power spectrum of the reference and moving image(s)."""
+    product = mov_freq.conj()
+    product *= ref_freq
+    if normalize:
+        product /= np.maximum(np.abs(product), 100 * np.finfo(float).eps)
+    return product
+
+
+def _upsampled_correlation(product: np.ndarray, shape: tuple, peaks: np.ndarray, factor: int):
+    """Evaluate the inverse real DFT of `product` (N, H, W//2+1) on a grid
+    with spacing 1/`factor` pixels around `peaks` (N, 2).
+
+    Returns the (N, M, M) correlation and the (M,) grid offsets.
+    """
+    h, w = shape
+    n = int(np.ceil(1.5 * factor))
+    offsets = np.arange(-n, n + 1) / factor
+
+    ky = fft.fftfreq(h)
+    kx = fft.rfftfreq(w)
+
+    # the half spectrum stands in for its complex conjugate, except for the
+    # zero and Nyquist frequencies, which only appear once
+    weights = np.full(len(kx), 2.0)
+    weights[0] = 1
+    if w % 2 == 0:
+        weights[-1] = 1
+
+    ys = peaks[:, 0, np.newaxis] + offsets  # (N, M)
+    xs = peaks[:, 1, np.newaxis] + offsets
+
+    row_kernel = np.exp(2j * np.pi * ys[:, :, np.newaxis] * ky)  # (N, M, H)
+    col_kernel = np.exp(2j * np.pi * kx[:, np.newaxis] * xs[:, np.newaxis, :])  # (N, W', M)
+
+    corr = (row_kernel @ (product * weights) @ col_kernel).real / (h * w)
+    return corr, offsets
+
+
+def _locate_peaks(product: np.ndarray, shape: tuple, upsample_factor: int, workers: int):
+    """Find the shifts and correlation peak heights for a stack of cross
+    power spectra."""
+    corr = fft.irfft2(product, s=shape, workers=workers)
+
+    n = len(corr)
+    flat = corr.reshape(n, -1).argmax(axis=1)
+    peaks = np.stack(np.unravel_index(flat, shape), axis=1).astype(float)
+    heights = corr.reshape(n, -1)[np.arange(n), flat]
+
+    # wrap around, shifts larger than half the image are negative
+    size = np.array(shape)
+    peaks = np.where(peaks > size // 2, peaks - size, peaks)
+
+    if upsample_factor > 1:
+        peaks, heights = refine_peaks(product, shape, peaks, upsample_factor)
+
+    return peaks, heights
+
+
+def refine_peaks(product: np.ndarray, shape: tuple, peaks: np.ndarray, upsample_factor: int):
+    """Refine the integer `peaks` (N, 2) of the correlation of a stack of
+    cross power spectra `product` (N, H, W//2+1) to 1/`upsample_factor` of a
+    pixel.
+
+    Returns the (N, 2) shifts and the (N,) correlation peak heights.
+    """
+    n = len(peaks)
+    up, offsets = _upsampled_correlation(product, shape, peaks, upsample_factor)
+    m = len(offsets)
+    flat = up.reshape(n, -1).argmax(axis=1)
+    i, j = np.unravel_index(flat, (m, m))
+    peaks = peaks + np.stack([offsets[i], offsets[j]], axis=1)
+    heights = up.reshape(n, -1)[np.arange(n), flat]
+    return peaks, heights
+
+
+class Registration:
+    """Register images against a fixed reference by phase correlation.
+
+    reference: np.ndarray,
+        2D reference image
+    upsample_factor: int,
+        images are registered to within 1/`upsample_factor` of a pixel
+    window: str,
+        apodization window applied to all images before the FFT to suppress
+        edge effects (`hann`), None to disable
+    normalize: bool,
+        use the phase correlation (normalized cross power spectrum), otherwise
+        plain cross correlation
+    workers: int,
+        number of threads used for the FFTs (-1 for all cores)
+
+    The confidence returned with every shift is the height of the
+    correlation peak. For phase correlation this is 1.0 for identical
+    images and drops towards 0 for images that do not overlap.
+    """
+
+    def __init__(
+        self,
+        reference: np.ndarray,
+        upsample_factor: int = 10,
+        window: str = None,
+        normalize: bool = True,
+        workers: int = -1,
+    ):
+        self.upsample_factor = upsample_factor
+        self.window = window
+        self.normalize = normalize
+        self.workers = workers
+        self.set_reference(reference)
+
+    def __repr__(self):
+        name = self.__class__.__name__
+        return f'{name}(shape={self.shape}, upsample_factor={self.upsample_factor})'
+
+    def _transform(self, images: np.ndarray) -> np.ndarray:
+        images = np.asarray(images, dtype=float)
+        if self.window:
+            images = images * get_window(images.shape[-2:], self.window)
+        return fft.rfft2(images, workers=self.workers)
+
+    def set_reference(self, reference: np.ndarray):
+        """Replace the reference image."""
+        reference = np.asarray(reference)
+        if reference.ndim != 2:
+            raise ValueError(f'Reference must be a 2D image, got shape {reference.shape}')
+        self.shape = reference.shape
+        self._ref_freq = self._transform(reference)
+
+    def _check_shape(self, images: np.ndarray):
+        if images.shape[-2:] != self.shape:
+            raise ValueError(
+                f'Image shape {images.shape[-2:]} does not match the reference {self.shape}'
+            )
+
+    def cross_power(self, image: np.ndarray) -> np.ndarray:
+        """Return the cross power spectrum (H, W//2+1) of `image` and the
+        reference, its inverse real FFT is the correlation map."""
+        image = np.asarray(image)
+        self._check_shape(image)
+        return _cross_power(self._ref_freq, self._transform(image), self.normalize)
+
+    def register(self, image: np.ndarray) -> (np.ndarray, float):
+        """Return the (subpixel) shift to register `image` with the reference,
+        and the confidence of the match."""
+        shifts, confidences = self.register_many(np.asarray(image)[np.newaxis])
+        return shifts[0], float(confidences[0])
+
+    def register_many(self, images, batch_size: int = BATCH_SIZE) -> (np.ndarray, np.ndarray):
+        """Register a stack of images (N, H, W) with the reference.
+
+        Returns an (N, 2) array with the shifts and an (N,) array with the
+        confidences.
+        """
+        shifts = []
+        confidences = []
+        for i in range(0, len(images), batch_size):
+            batch = np.asarray(images[i : i + batch_size])
+            self._check_shape(batch)
+            product = _cross_power(self._ref_freq, self._transform(batch), self.normalize)
+            peaks, heights = _locate_peaks(
+                product, self.shape, self.upsample_factor, self.workers
+            )
+            shifts.append(peaks)
+            confidences.append(heights)
+
+        if not shifts:
+            return np.empty((0, 2)), np.empty(0)
+        return np.concatenate(shifts), np.concatenate(confidences)
+
+
+def register_translation(
+    reference: np.ndarray, image: np.ndarray, **kwargs
+) -> (np.ndarray, float):
+    """Return the shift to register `image` with `reference`, and the
+    confidence of the match.
+
+    Keyword arguments are passed to `Registration`.
+    """
+    return Registration(reference, **kwargs).register(image)
+
+
+def register_pairs(
+    pairs, upsample_factor: int = 10, window: str = None, workers: int = -1
+) -> (np.ndarray, np.ndarray):
+    """Register a list of (reference, image) pairs. All images must have the
+    same shape, so that the FFTs can be computed in one go.
+
+    Returns an (N, 2) array with the shifts and an (N,) array with the
+    confidences.
+    """
+    if not len(pairs):
+        return np.empty((0, 2)), np.empty(0)
+
+    refs, images = (np.asarray(stack, dtype=float) for stack in zip(*pairs))
+    shape = refs.shape[-2:]
+    if window:
+        refs = refs * get_window(shape, window)
+        images = images * get_window(shape, window)
+
+    product = _cross_power(fft.rfft2(refs, workers=workers), fft.rfft2(images, workers=workers))
+    return _locate_peaks(product, shape, upsample_factor, workers)
@@ -2,13 +2,10 @@ from __future__ import annotations
 
 import math
 import sys
+from functools import lru_cache
 
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.widgets import Slider
 from scipy.ndimage import interpolation, morphology
-from skimage.feature import canny
-from skimage.measure import label, regionprops
 
 from instamatic.formats import read_tiff
 from instamatic.image_utils import autoscale
@@ -85,11 +82,149 @@ def apply_stretch_correction(z, center=None, azimuth: float = 0, amplitude: floa
     returns:
         (N,N) ndarray
     """
-    azimuth_rad = np.radians(azimuth)  # go to radians
-    amplitude_pc = amplitude / (2 * 100)  # as percentage
-    tr_mat = affine_transform_ellipse_to_circle(azimuth_rad, amplitude_pc)
-    z = apply_transform_to_image(z, tr_mat, center=center)
-    return z
+    return get_distortion_model(azimuth, amplitude).apply(z, center=center)
+
+
+def _default_center(shape: tuple) -> tuple:
+    # same as `apply_transform_to_image`
+    return tuple((np.array(shape)[::-1] - 1) / 2.0)
+
+
+@lru_cache(maxsize=4)
+def _coordinate_map(shape: tuple, center: tuple, azimuth: float, amplitude: float):
+    """For every pixel in the corrected image, the (row, column) coordinates
+    in the distorted image, as a (2, H, W) array."""
+    tr_mat = affine_transform_ellipse_to_circle(np.radians(azimuth), amplitude / (2 * 100))
+    center = np.array(center).reshape(2, 1)
+
+    grid = np.indices(shape, dtype=float).reshape(2, -1)
+    coords = np.dot(tr_mat, grid - center) + center
+    return coords.reshape(2, *shape)
+
+
+@lru_cache(maxsize=4)
+def _remap_table(shape: tuple, center: tuple, azimuth: float, amplitude: float):
+    """Precompute the indices and weights for bilinear interpolation of the
+    distorted image at the coordinates given by `_coordinate_map`.
+
+    Returns the flat indices of the top-left neighbours (H*W,) and the
+    weights of the 4 neighbours (4, H*W). Pixels that map outside the image
+    get zero weight.
+    """
+    coords = _coordinate_map(shape, center, azimuth, amplitude).reshape(2, -1)
+    nrows, ncols = shape
+
+    valid = np.all((coords >= 0) & (coords <= np.array([[nrows - 1], [ncols - 1]])), axis=0)
+
+    # clip so that all 4 neighbours are inside the image, the fractional part
+    # becomes 1.0 on the last row/column
+    r0 = np.clip(np.floor(coords[0]), 0, max(nrows - 2, 0)).astype(np.intp)
+    c0 = np.clip(np.floor(coords[1]), 0, max(ncols - 2, 0)).astype(np.intp)
+    fr = coords[0] - r0
+    fc = coords[1] - c0
+
+    index = r0 * ncols + c0
+    index[~valid] = 0
+
+    weights = np.array(
+        [(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc], dtype=np.float32
+    )
+    weights[:, ~valid] = 0
+    return index, weights
+
+
+class DistortionModel:
+    """Elliptical (stretch) distortion of the diffraction patterns, as
+    measured with `instamatic.stretch_correction`.
+
+    The remap tables that are needed to correct an image are computed once
+    for every image shape and beam center, and kept in an LRU cache, so that
+    correcting many images (or a live stream) is cheap.
+
+    azimuth: float
+        Direction of the azimuth in degrees
+    amplitude: float
+        The difference in percent between the long and short axes
+    """
+
+    def __init__(self, azimuth: float = 0, amplitude: float = 0):
+        self.azimuth = float(azimuth)
+        self.amplitude = float(amplitude)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(azimuth={self.azimuth}, amplitude={self.amplitude})'
+
+    @classmethod
+    def from_config(cls):
+        """Create the model from the stretch correction of the current
+        camera config."""
+        from instamatic import config
+
+        return cls(
+            azimuth=config.camera.stretch_azimuth, amplitude=config.camera.stretch_amplitude
+        )
+
+    @property
+    def transform(self) -> np.ndarray:
+        """Affine transformation (2x2) from the distorted to the corrected
+        image."""
+        return affine_transform_ellipse_to_circle(
+            np.radians(self.azimuth), self.amplitude / (2 * 100)
+        )
+
+    def _key(self, shape: tuple, center) -> tuple:
+        shape = tuple(int(n) for n in shape[-2:])
+        center = _default_center(shape) if center is None else center
+        return shape, tuple(float(c) for c in center), self.azimuth, self.amplitude
+
+    def coordinate_map(self, shape: tuple, center=None) -> np.ndarray:
+        """Return the coordinates in the distorted image for every pixel of
+        the corrected image, as a (2, H, W) array."""
+        return _coordinate_map(*self._key(shape, center))
+
+    def apply(self, img: np.ndarray, center=None) -> np.ndarray:
+        """Correct an image (H, W) or a stack of images (N, H, W) using
+        bilinear interpolation. The result has the same dtype as `img`.
+
+        center: list of floats
+            pixel coordinates of the center of the direct beam
+        """
+        img = np.asarray(img)
+        shape = img.shape[-2:]
+        index, weights = _remap_table(*self._key(shape, center))
+
+        flat = img.reshape(-1, shape[0] * shape[1])
+        ncols = shape[1]
+
+        out = flat[:, index] * weights[0]
+        out += flat[:, index + 1] * weights[1]
+        out += flat[:, index + ncols] * weights[2]
+        out += flat[:, index + ncols + 1] * weights[3]
+
+        if np.issubdtype(img.dtype, np.integer):
+            out = np.rint(out)
+        return out.reshape(img.shape).astype(img.dtype, copy=False)
+
+    def correct_peaks(self, peaks: np.ndarray, center) -> np.ndarray:
+        """Map peak positions (N, 2) in the distorted image to their
+        positions in the corrected image."""
+        center = np.asarray(center, dtype=float)
+        inverse = np.linalg.inv(self.transform)
+        return np.dot(np.asarray(peaks, dtype=float) - center, inverse.T) + center
+
+    def correction_tables(self, shape: tuple, center=None) -> (np.ndarray, np.ndarray):
+        """Return the displacement (in pixels) along the rows and columns for
+        every pixel, i.e. for the geometric correction tables of XDS."""
+        coords = self.coordinate_map(shape, center)
+        rows, cols = np.indices(shape[-2:])
+        return coords[0] - rows, coords[1] - cols
+
+
+@lru_cache(maxsize=16)
+def get_distortion_model(azimuth: float = 0, amplitude: float = 0) -> DistortionModel:
+    """Return a (shared) `DistortionModel` for the given azimuth (degrees)
+    and amplitude (percent)."""
+    return DistortionModel(azimuth=azimuth, amplitude=amplitude)
 
 
 def make_title(prop):
@@ -104,6 +239,10 @@ def make_title(prop):
 def get_sigma_interactive(img, sigma=20):
     """Interactive function to get the sigma threshold value for the edge
     detection."""
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Slider
+    from skimage.feature import canny
+
     edges = canny(img, sigma=sigma, low_threshold=None, high_threshold=None)
 
     fig, ax = plt.subplots()
@@ -151,6 +290,8 @@ def get_sigma_interactive(img, sigma=20):
 
 def plot_props(edges, props):
     """Plot the ring structures."""
+    import matplotlib.pyplot as plt
+
     plt.imshow(edges)
     for prop in props:
         print('centroid = ({:.2f}, {:.2f})'.format(*prop.centroid))
@@ -180,6 +321,8 @@ def plot_props(edges, props):
 
 def get_ring_props(edges):
     """Get the rings with low eccentricity from the edge structures."""
+    from skimage.measure import label, regionprops
+
     # label edges
     labeled = label(edges)
 
@@ -204,6 +347,8 @@ def get_ring_props(edges):
 def main_entry(sigma=None):
     import argparse
 
+    from skimage.feature import canny
+
     description = """
 Program to determine the stretch correction from a series of powder diffraction patterns (collected on a gold or aluminium powder). It will open a GUI to interactively identify the powder rings, and calculate the orientation (azimuth) and extent (amplitude) of the long axis compared to the short axis. These can be used in the `config` under `camera.stretch_azimuth` and `camera.stretch_percentage`.
 """
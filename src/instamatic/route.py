@@ -0,0 +1,410 @@
+"""Ordering of stage positions to minimize the stage travel.
+
+The order in which a list of stage positions is visited has a large effect
+on the total acquisition time, because the stage is slow compared to most
+other operations on the microscope. `optimize_route` finds a short path
+through all positions, starting with a nearest-neighbour tour that is then
+improved with 2-opt moves (reversal of a part of the route) until no
+further improvement is found.
+
+For up to `DENSE_LIMIT` positions, the full matrix of travel costs is used
+and all reversals are considered. For larger grids, the matrix would not
+fit in memory (10 000 positions need GBs), so the candidate moves are
+limited to the `NEIGHBOURS` nearest positions of every position, found
+with a KD-tree, and the costs are computed as they are needed.
+
+The cost of a move takes into account how the stage is moved. With
+backlash correction (`Stage.set_xy_with_backlash_correction`), the target
+is always approached from the same direction, by first moving to a point
+`backlash_step` nm below the target in x and y. Moves towards +x/+y are
+therefore cheaper than moves in the opposite direction, and the route is
+optimized accordingly. The z-height (if given) is changed separately from
+x/y, its contribution is weighted by `z_weight`.
+
+Usage:
+    order = optimize_route(coords, start=ctrl.stage.xy)
+    print_route_report(route_report(coords, order, start=ctrl.stage.xy))
+    for i in order:
+        ctrl.stage.xy = coords[i]
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# approximate stage speed (nm/s), used to estimate the time spent moving
+STAGE_SPEED = 10_000
+
+# maximum number of rounds of 2-opt moves
+MAX_ITER = 1000
+
+# routes through more positions than this only consider moves to nearby positions
+DENSE_LIMIT = 500
+
+# number of nearest positions considered for every move in large routes
+NEIGHBOURS = 10
+
+
+def _as_coords(coords) -> np.ndarray:
+    coords = np.asarray(coords, dtype=float)
+    if coords.ndim != 2 or coords.shape[1] not in (2, 3):
+        raise ValueError(f'Coordinates must have shape (N, 2) or (N, 3), got {coords.shape}')
+    return coords
+
+
+def travel_costs(coords, backlash_step: float = 0.0, z_weight: float = 1.0) -> np.ndarray:
+    """Return the (N, N) matrix with the cost (stage travel in nm) of a
+    move from position `i` (row) to position `j` (column).
+
+    coords: np.ndarray,
+        (N, 2) or (N, 3) array of x, y(, z) stage coordinates in nm
+    backlash_step: float,
+        distance in nm from which the target is approached in +x/+y, as in
+        `Stage.set_xy_with_backlash_correction`, use 0 for direct moves
+    z_weight: float,
+        weight of a change in z relative to the same distance in x/y
+    """
+    coords = _as_coords(coords)
+    costs = move_costs(coords[:, np.newaxis], coords[np.newaxis, :], backlash_step, z_weight)
+    np.fill_diagonal(costs, 0.0)
+    return costs
+
+
+def move_costs(origin, target, backlash_step: float = 0.0, z_weight: float = 1.0) -> np.ndarray:
+    """Return the cost (stage travel in nm) of the moves from the `origin`
+    to the `target` coordinates (..., 2) or (..., 3), see `travel_costs`."""
+    s = backlash_step
+    d = np.asarray(target, dtype=float) - np.asarray(origin, dtype=float)
+
+    # move to (x - step, y - step) first, then to the target
+    costs = np.hypot(d[..., 0] - s, d[..., 1] - s) + np.hypot(s, s)
+
+    if d.shape[-1] == 3:
+        # missing z values (nan) are left unchanged
+        costs += z_weight * np.nan_to_num(np.abs(d[..., 2]))
+
+    return costs
+
+
+def _with_start(coords, start) -> np.ndarray:
+    """Return `coords` with the `start` position appended as the last
+    node."""
+    coords = _as_coords(coords)
+    if start is not None:
+        node = np.full((1, coords.shape[1]), np.nan)
+        start = np.asarray(start, dtype=float).ravel()[: coords.shape[1]]
+        node[0, : len(start)] = start
+        coords = np.vstack([coords, node])
+    return coords
+
+
+def route_length(order, costs: np.ndarray) -> float:
+    """Total cost of visiting the nodes in `order`."""
+    order = np.asarray(order)
+    return float(costs[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour_route(costs: np.ndarray, start: int = 0) -> np.ndarray:
+    """Return a route through all nodes, starting at node `start`, that
+    always moves to the cheapest node not yet visited."""
+    n = len(costs)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+
+    current = start
+    for k in range(n):
+        order[k] = current
+        visited[current] = True
+        if k < n - 1:
+            current = int(np.where(visited, np.inf, costs[current]).argmin())
+
+    return order
+
+
+def two_opt(
+    order, costs: np.ndarray, fixed_start: bool = False, max_iter: int = MAX_ITER
+) -> np.ndarray:
+    """Improve an (open) route by reversing parts of it.
+
+    The change in cost is evaluated for all possible reversals at once.
+    Every round, the best reversal for each starting point is applied, as
+    long as it does not interfere with a better one. Works for asymmetric
+    costs, where reversing a segment also changes the cost of the moves
+    inside it.
+
+    order: np.ndarray,
+        initial route (node indices)
+    costs: np.ndarray,
+        (N, N) matrix with the cost of moving from node i to node j
+    fixed_start: bool,
+        keep the first node of the route in place
+    max_iter: int,
+        maximum number of rounds
+
+    Returns:
+        the improved route
+    """
+    order = np.array(order, dtype=int)
+    n = len(order)
+    if n < 3:
+        return order
+
+    i0 = 1 if fixed_start else 0
+    idx = np.arange(n)
+    valid = (idx[np.newaxis, :] > idx[:, np.newaxis]) & (idx[:, np.newaxis] >= i0)
+
+    for _ in range(max_iter):
+        forward = costs[order[:-1], order[1:]]
+        backward = costs[order[1:], order[:-1]]
+        fsum = np.concatenate([[0.0], np.cumsum(forward)])
+        bsum = np.concatenate([[0.0], np.cumsum(backward)])
+
+        # reversing order[i:j+1]: the moves inside the segment change direction
+        delta = (bsum[np.newaxis, :] - bsum[:, np.newaxis]) - (
+            fsum[np.newaxis, :] - fsum[:, np.newaxis]
+        )
+        # ... the segment is entered at order[j] instead of order[i]
+        enter = costs[order[:-1, np.newaxis], order[np.newaxis, :]]
+        delta[1:, :] += enter - forward[:, np.newaxis]
+        # ... and left from order[i] instead of order[j]
+        leave = costs[order[:, np.newaxis], order[np.newaxis, 1:]]
+        delta[:, :-1] += leave - forward
+        delta[~valid] = np.inf
+
+        best = delta.argmin(axis=1)
+        gain = delta[idx, best]
+        candidates = np.flatnonzero(gain < -1e-9)
+        if not len(candidates):
+            break
+
+        # reversals are independent if they do not share any moves
+        used = np.zeros(n + 1, dtype=bool)
+        for i in candidates[np.argsort(gain[candidates])]:
+            j = best[i]
+            if used[i : j + 2].any():
+                continue
+            used[i : j + 2] = True
+            order[i : j + 1] = order[i : j + 1][::-1]
+
+    return order
+
+
+def optimize_route(
+    coords,
+    start: tuple = None,
+    backlash_step: float = 0.0,
+    z_weight: float = 1.0,
+    max_iter: int = MAX_ITER,
+    neighbours: int = NEIGHBOURS,
+) -> np.ndarray:
+    """Find a short route through all stage positions.
+
+    coords: np.ndarray,
+        (N, 2) or (N, 3) array of x, y(, z) stage coordinates in nm
+    start: tuple,
+        current stage position (x, y(, z)), the route starts at the nearest
+        suitable position. If None, the route can start anywhere.
+    backlash_step: float,
+        distance in nm from which every target is approached in +x/+y (see
+        `travel_costs`), use 0 if the stage is moved directly
+    z_weight: float,
+        weight of a change in z relative to the same distance in x/y
+    max_iter: int,
+        maximum number of rounds of 2-opt moves
+    neighbours: int,
+        for more than `DENSE_LIMIT` positions, only moves to this number of
+        nearest positions are considered
+
+    Returns:
+        (N,) array with the indices of `coords` in the order to visit them
+    """
+    coords = _as_coords(coords)
+    n = len(coords)
+    if n < 2:
+        return np.arange(n)
+
+    nodes = _with_start(coords, start)
+
+    if len(nodes) > DENSE_LIMIT:
+        route = _NeighbourRoute(nodes, backlash_step, z_weight, neighbours)
+        if start is not None:
+            order = route.nearest_neighbour(start=n)
+            return route.two_opt(order, fixed_start=True, max_iter=max_iter)[1:]
+        order = route.nearest_neighbour(start=0)
+        return route.two_opt(order, max_iter=max_iter)
+
+    costs = travel_costs(nodes, backlash_step=backlash_step, z_weight=z_weight)
+
+    if start is not None:
+        order = nearest_neighbour_route(costs, start=n)
+        order = two_opt(order, costs, fixed_start=True, max_iter=max_iter)
+        return order[1:]
+
+    # without a start position, the first position in the list is as good as any
+    order = nearest_neighbour_route(costs, start=0)
+    return two_opt(order, costs, max_iter=max_iter)
+
+
+class _NeighbourRoute:
+    """Route optimization for large sets of positions, without a matrix of
+    all travel costs. Only moves to the `neighbours` nearest positions
+    (KD-tree) are considered, and the costs are computed on demand."""
+
+    def __init__(self, nodes, backlash_step: float, z_weight: float, neighbours: int):
+        self.nodes = nodes
+        self.backlash_step = backlash_step
+        self.z_weight = z_weight
+
+        points = nodes[:, :2]
+        if nodes.shape[1] == 3:
+            z = nodes[:, 2]
+            z = np.where(np.isnan(z), np.nanmean(z) if np.isfinite(z).any() else 0.0, z)
+            points = np.column_stack([points, z_weight * z])
+        self.points = points
+        self.tree = cKDTree(points)
+
+        k = min(neighbours + 1, len(nodes))
+        _, nbrs = self.tree.query(points, k=k)
+        self.neighbours = nbrs[:, 1:]
+
+    def cost(self, i, j) -> np.ndarray:
+        """Cost of the moves from nodes `i` to nodes `j`."""
+        return move_costs(self.nodes[i], self.nodes[j], self.backlash_step, self.z_weight)
+
+    def nearest_neighbour(self, start: int) -> np.ndarray:
+        """Nearest-neighbour route, see `nearest_neighbour_route`."""
+        n = len(self.nodes)
+        visited = np.zeros(n, dtype=bool)
+        order = np.empty(n, dtype=int)
+
+        current = start
+        for k in range(n):
+            order[k] = current
+            visited[current] = True
+            if k == n - 1:
+                break
+
+            # look further until an unvisited position is found, or check all of them
+            m = min(2 * self.neighbours.shape[1] + 1, n)
+            while True:
+                _, candidates = self.tree.query(self.points[current], k=m)
+                candidates = candidates[~visited[candidates]]
+                if len(candidates) or m >= min(n, 1024):
+                    break
+                m = min(4 * m, n)
+            if not len(candidates):
+                candidates = np.flatnonzero(~visited)
+
+            current = candidates[self.cost(current, candidates).argmin()]
+
+        return order
+
+    def two_opt(self, order, fixed_start: bool = False, max_iter: int = MAX_ITER):
+        """Like `two_opt`, but a segment `order[i:j+1]` is only reversed if
+        the new move into it or out of it goes to a neighbouring position."""
+        order = np.array(order, dtype=int)
+        n = len(order)
+        if n < 3:
+            return order
+
+        i0 = 1 if fixed_start else 0
+        n_nbrs = self.neighbours.shape[1]
+        pos = np.empty(n, dtype=int)
+
+        for _ in range(max_iter):
+            pos[order] = np.arange(n)
+            forward = self.cost(order[:-1], order[1:])
+            backward = self.cost(order[1:], order[:-1])
+            fsum = np.concatenate([[0.0], np.cumsum(forward)])
+            bsum = np.concatenate([[0.0], np.cumsum(backward)])
+
+            # the segment is entered from order[i-1] into a neighbour order[j], or
+            # left from order[i] into a neighbour order[j+1]
+            i_enter = np.repeat(np.arange(1, n), n_nbrs)
+            j_enter = pos[self.neighbours[order[:-1]]].ravel()
+            i_leave = np.repeat(np.arange(n), n_nbrs)
+            j_leave = pos[self.neighbours[order]].ravel() - 1
+            i = np.concatenate([i_enter, i_leave])
+            j = np.concatenate([j_enter, j_leave])
+            keep = (j > i) & (i >= i0)
+            i, j = i[keep], j[keep]
+
+            # the moves inside the segment change direction
+            delta = (bsum[j] - bsum[i]) - (fsum[j] - fsum[i])
+            enter = i >= 1
+            delta[enter] += (
+                self.cost(order[i[enter] - 1], order[j[enter]]) - forward[i[enter] - 1]
+            )
+            leave = j <= n - 2
+            delta[leave] += self.cost(order[i[leave]], order[j[leave] + 1]) - forward[j[leave]]
+
+            improving = np.flatnonzero(delta < -1e-9)
+            if not len(improving):
+                break
+
+            # reversals are independent if they do not share any moves
+            used = np.zeros(n + 1, dtype=bool)
+            for k in improving[np.argsort(delta[improving])]:
+                a, b = i[k], j[k]
+                if used[a : b + 2].any():
+                    continue
+                used[a : b + 2] = True
+                order[a : b + 1] = order[a : b + 1][::-1]
+
+        return order
+
+
+def route_report(
+    coords,
+    order,
+    start: tuple = None,
+    backlash_step: float = 0.0,
+    z_weight: float = 1.0,
+    speed: float = STAGE_SPEED,
+) -> dict:
+    """Compare the stage travel of the route given by `order` to visiting
+    the positions in the original order.
+
+    speed: float,
+        stage speed in nm/s, used to estimate the time spent moving
+
+    Returns:
+        dict with the travel distance (nm) and estimated time (s) of the
+        original and the new route, and the savings
+    """
+    coords = _as_coords(coords)
+    n = len(coords)
+    nodes = _with_start(coords, start)
+
+    original = np.arange(n)
+    order = np.asarray(order, dtype=int)
+    if start is not None:
+        original = np.concatenate([[n], original])
+        order = np.concatenate([[n], order])
+
+    before, after = (
+        float(move_costs(nodes[o[:-1]], nodes[o[1:]], backlash_step, z_weight).sum())
+        for o in (original, order)
+    )
+
+    return {
+        'positions': n,
+        'distance_before': before,
+        'distance_after': after,
+        'distance_saved': before - after,
+        'fraction_saved': (before - after) / before if before else 0.0,
+        'time_before': before / speed,
+        'time_after': after / speed,
+        'time_saved': (before - after) / speed,
+    }
+
+
+def print_route_report(report: dict) -> None:
+    """Print a summary of the dictionary returned by `route_report`."""
+    print(
+        f'Route through {report["positions"]} positions: '
+        f'{report["distance_before"] / 1000:.1f} -> {report["distance_after"] / 1000:.1f} um '
+        f'({report["fraction_saved"]:.0%} shorter, '
+        f'~{report["time_saved"]:.0f} s saved in stage travel)'
+    )
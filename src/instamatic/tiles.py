@@ -0,0 +1,311 @@
+"""Multi-resolution tile pyramid for browsing large montages.
+
+A montage of hundreds of large images does not fit in memory, and does
+not need to: the screen only shows a small part of it at full resolution,
+or all of it at a low resolution. `TilePyramid` keeps every image of the
+montage as a tile, and stores downsampled copies of the tiles (halving
+the size at every level) as `.npy` files in a cache directory. Rendering
+a region of the montage loads only the tiles that overlap the region, at
+the coarsest level that still has enough pixels for the display, through
+a memory-bounded LRU cache.
+
+The tiles are found with a KD-tree on the tile centers. `CoordinateIndex`
+uses KD-trees in the same way to convert between pixel coordinates in the
+montage and stage coordinates, and to find the navigator items closest to
+a position.
+
+Usage:
+    pyramid = montage.to_pyramid()  # or TilePyramid(images, coords, drc='pyramid')
+    pyramid.build()  # optional, tiles are otherwise downsampled when first needed
+    img, box = pyramid.render((0, 0, 40000, 40000), shape=(1024, 1024))
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from instamatic.formats.collection import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# tiles are downsampled until they are no larger than this (pixels)
+MIN_TILE_SIZE = 64
+
+# memory used for the tiles kept in memory (bytes)
+CACHE_BYTES = 256 * 1024**2
+
+
+def downsample(img: np.ndarray) -> np.ndarray:
+    """Halve the size of `img` by averaging blocks of 2x2 pixels, the last
+    row/column is dropped for odd sizes."""
+    h, w = img.shape[0] // 2, img.shape[1] // 2
+    blocks = img[: 2 * h, : 2 * w].reshape(h, 2, w, 2)
+    binned = blocks.mean(axis=(1, 3))
+    if np.issubdtype(img.dtype, np.integer):
+        binned = np.round(binned)
+    return binned.astype(img.dtype)
+
+
+class TilePyramid:
+    """Tiles of a montage at several resolutions, cached on disk.
+
+    images: list or `ImageCollection`,
+        the images of the montage (level 0), only read when the downsampled
+        levels are made, or when a region is rendered at full resolution
+    coords: np.ndarray,
+        (N, 2) pixel coordinates (row, column) of the top left corner of
+        every image in the montage, as in `Montage.coords`
+    drc: str,
+        directory to store the downsampled tiles in
+    levels: int,
+        number of levels, including the original images; by default until
+        the tiles are smaller than `MIN_TILE_SIZE`
+    tile_shape: tuple,
+        shape of the images, read from the first image if not given
+    cache_bytes: int,
+        maximum memory used by the tiles kept in memory
+    """
+
+    def __init__(
+        self,
+        images,
+        coords,
+        drc: str = 'pyramid',
+        levels: int = None,
+        tile_shape: tuple = None,
+        cache_bytes: int = CACHE_BYTES,
+    ):
+        self.images = images
+        self.coords = np.asarray(coords, dtype=float)
+        self.drc = Path(drc)
+
+        if tile_shape is None:
+            tile_shape = images[0].shape
+        self.tile_shape = np.array(tile_shape[:2])
+        if levels is None:
+            levels = 1 + max(int(np.log2(self.tile_shape.max() / MIN_TILE_SIZE)), 0)
+        self.levels = levels
+
+        self.centers = self.coords + self.tile_shape / 2
+        self.tree = cKDTree(self.centers)
+
+        lower = self.coords.min(axis=0)
+        upper = self.coords.max(axis=0) + self.tile_shape
+        self.box = (*lower, *upper)  # (row0, col0, row1, col1) of the whole montage
+
+        self._cache = LRUCache(maxsize=len(self.coords) * levels, maxbytes=cache_bytes)
+        self._check_cache()
+
+    def __repr__(self):
+        name = self.__class__.__name__
+        return f'{name}(n={len(self)}, levels={self.levels}, drc={str(self.drc)!r})'
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _check_cache(self) -> None:
+        """Remove the cached tiles if they belong to a different montage."""
+        manifest = self.drc / 'pyramid.json'
+        info = {
+            'n_tiles': len(self),
+            'levels': self.levels,
+            'tile_shape': self.tile_shape.tolist(),
+        }
+        if manifest.exists():
+            if json.loads(manifest.read_text()) == info:
+                return
+            logger.info('Tile cache %s does not match the montage, rebuilding', self.drc)
+            for fn in self.drc.glob('level_*/*.npy'):
+                fn.unlink()
+
+        self.drc.mkdir(parents=True, exist_ok=True)
+        manifest.write_text(json.dumps(info))
+
+    def _filename(self, i: int, level: int) -> Path:
+        return self.drc / f'level_{level}' / f'{i:05d}.npy'
+
+    def _make_levels(self, i: int) -> list:
+        """Downsample image `i` to all levels, and store them."""
+        tiles = [np.asarray(self.images[i])]
+        for level in range(1, self.levels):
+            tiles.append(downsample(tiles[-1]))
+            fn = self._filename(i, level)
+            fn.parent.mkdir(exist_ok=True)
+            np.save(fn, tiles[-1])
+        return tiles
+
+    def build(self, overwrite: bool = False) -> None:
+        """Make the downsampled tiles of all images that are not cached
+        yet."""
+        last = self.levels - 1
+        for i in range(len(self)):
+            if overwrite or not self._filename(i, last).exists():
+                self._make_levels(i)
+        logger.info('Built tile pyramid with %d levels for %d images', self.levels, len(self))
+
+    def tile(self, i: int, level: int = 0) -> np.ndarray:
+        """Return tile `i` at `level` (level 0 is the original image)."""
+        key = (i, level)
+        value = self._cache.get(key)
+        if value is not None:
+            return value[0]
+
+        if level == 0:
+            tile = np.asarray(self.images[i])
+        else:
+            fn = self._filename(i, level)
+            if fn.exists():
+                tile = np.load(fn)
+            else:
+                tile = self._make_levels(i)[level]
+
+        self._cache.put(key, (tile, None))
+        return tile
+
+    def level_for(self, box, shape) -> int:
+        """Coarsest level at which `box` (row0, col0, row1, col1) still has at
+        least `shape` (rows, columns) pixels."""
+        r0, c0, r1, c1 = box
+        scale = min((r1 - r0) / shape[0], (c1 - c0) / shape[1])
+        if scale <= 1:
+            return 0
+        return int(min(np.floor(np.log2(scale)), self.levels - 1))
+
+    def visible(self, box) -> np.ndarray:
+        """Indices of the tiles that overlap `box` (row0, col0, row1,
+        col1)."""
+        r0, c0, r1, c1 = box
+        center = ((r0 + r1) / 2, (c0 + c1) / 2)
+        half = np.array(((r1 - r0) / 2, (c1 - c0) / 2)) + self.tile_shape / 2
+
+        # candidates within the largest half size, then the exact overlap per axis
+        candidates = np.array(self.tree.query_ball_point(center, r=half.max(), p=np.inf))
+        if len(candidates) == 0:
+            return candidates.astype(int)
+        inside = np.all(np.abs(self.centers[candidates] - center) < half, axis=1)
+        return np.sort(candidates[inside])
+
+    def render(self, box=None, shape=(1024, 1024), level: int = None) -> (np.ndarray, tuple):
+        """Render the region `box` (row0, col0, row1, col1) of the montage,
+        by default all of it. The region is clipped to the montage.
+
+        shape: tuple,
+            number of pixels (rows, columns) the region is displayed with,
+            determines the level to use
+        level: int,
+            use this level instead
+
+        Returns:
+            the image, and the box it covers, aligned to the pixels of the
+            level
+        """
+        if box is None:
+            box = self.box
+        if level is None:
+            level = self.level_for(box, shape)
+
+        lower, upper = np.array(self.box[:2]), np.array(self.box[2:])
+        start = np.clip(box[:2], lower, upper)
+        box = (*start, *np.clip(box[2:], start, upper))
+
+        factor = 2**level
+        r0, c0 = (int(np.floor(v / factor)) for v in box[:2])
+        r1, c1 = (int(np.ceil(v / factor)) for v in box[2:])
+
+        indices = self.visible(box)
+        dtype = self.tile(indices[0], level).dtype if len(indices) else np.float32
+        canvas = np.zeros((r1 - r0, c1 - c0), dtype=dtype)
+
+        # later tiles overwrite earlier ones, like `Montage.stitch`
+        for i in indices:
+            tile = self.tile(i, level)
+            tr, tc = (int(v) for v in np.floor(self.coords[i] / factor))
+            rows = slice(max(tr, r0), min(tr + tile.shape[0], r1))
+            cols = slice(max(tc, c0), min(tc + tile.shape[1], c1))
+            canvas[rows.start - r0 : rows.stop - r0, cols.start - c0 : cols.stop - c0] = tile[
+                rows.start - tr : rows.stop - tr, cols.start - tc : cols.stop - tc
+            ]
+
+        return canvas, (r0 * factor, c0 * factor, r1 * factor, c1 * factor)
+
+    def nearest_tile(self, pixelcoords) -> np.ndarray:
+        """Index of the tile with the center closest to the pixel coordinates
+        (2,) or (N, 2)."""
+        return self.tree.query(pixelcoords)[1]
+
+
+class CoordinateIndex:
+    """Convert between pixel coordinates in a montage and stage coordinates,
+    using the image that is closest to every point (see
+    `Montage.pixel_to_stagecoord`), with KD-trees for the lookups.
+
+    coords: np.ndarray,
+        (N, 2) pixel coordinates of the top left corners of the images
+    stagecoords: np.ndarray,
+        (N, 2) stage coordinates of the centers of the images
+    stagematrix: np.ndarray,
+        (2, 2) matrix that converts pixel shifts to stage shifts
+    image_shape: tuple,
+        shape of the images
+    binning: int,
+        binning of the montage pixel coordinates
+    centers: np.ndarray,
+        (N, 2) pixel coordinates of the image centers used to find the
+        closest image, by default the centers of `coords`
+    """
+
+    def __init__(
+        self, coords, stagecoords, stagematrix, image_shape, binning: int = 1, centers=None
+    ):
+        self.coords = np.asarray(coords, dtype=float)
+        self.stagecoords = np.asarray(stagecoords, dtype=float)
+        self.stagematrix = np.asarray(stagematrix, dtype=float)
+        self.binning = binning
+
+        self.center_offset = np.array(image_shape[:2]) / 2
+        if centers is None:
+            centers = self.coords + self.center_offset
+        self.pixel_tree = cKDTree(np.asarray(centers, dtype=float))
+        self.stage_tree = cKDTree(self.stagecoords)
+        self._item_tree = None
+
+    def pixel_to_stage(self, pixelcoords) -> np.ndarray:
+        """Convert pixel coordinates (N, 2) in the montage to stage
+        coordinates."""
+        if np.size(pixelcoords) == 0:
+            return np.empty((0, 2), dtype=int)
+        px = np.atleast_2d(pixelcoords) * self.binning
+        _, j = self.pixel_tree.query(px)
+        offset = self.center_offset @ self.stagematrix
+        stage = (px - self.coords[j]) @ self.stagematrix + self.stagecoords[j] - offset
+        return stage.astype(int).reshape(np.shape(pixelcoords))
+
+    def stage_to_pixel(self, stagecoords) -> np.ndarray:
+        """Convert stage coordinates (N, 2) to pixel coordinates in the
+        montage."""
+        if np.size(stagecoords) == 0:
+            return np.empty((0, 2), dtype=int)
+        stage = np.atleast_2d(stagecoords).astype(float)
+        _, j = self.stage_tree.query(stage)
+        offset = self.center_offset @ self.stagematrix
+        shift = (stage - self.stagecoords[j] + offset) @ np.linalg.inv(self.stagematrix)
+        px = (shift + self.coords[j]) / self.binning
+        return px.astype(int).reshape(np.shape(stagecoords))
+
+    def set_items(self, stagecoords) -> None:
+        """Set the stage coordinates (N, 2) of the navigator items for
+        `nearest_item`."""
+        self._item_tree = cKDTree(np.asarray(stagecoords, dtype=float))
+
+    def nearest_item(self, stagecoords, max_distance: float = np.inf):
+        """Index of the navigator item closest to the stage coordinates (2,)
+        or (N, 2), equal to the number of items if none is within
+        `max_distance`."""
+        if self._item_tree is None:
+            raise ValueError('No items set, use `set_items` first.')
+        return self._item_tree.query(stagecoords, distance_upper_bound=max_distance)[1]
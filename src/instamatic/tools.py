@@ -131,6 +131,143 @@ def find_beam_center(
     return center
 
 
+def refine_profile_peaks(
+    profiles: np.ndarray, method: str = 'parabolic', w: int = 3
+) -> np.ndarray:
+    """Find the position of the maximum with subpixel precision for every row
+    in `profiles` (N, L).
+
+    method: str,
+        `parabolic` fits a parabola through the maximum and its two neighbours,
+        `gaussian` does the same on the logarithm of the profile (exact for a
+        gaussian peak), and `com` takes the center of mass in a window of size
+        2*w+1 around the maximum
+    w: int,
+        half-width of the window for `com`
+    """
+    profiles = np.asarray(profiles, dtype=float)
+    n, length = profiles.shape
+    rows = np.arange(n)
+    c = np.argmax(profiles, axis=1)
+
+    if method == 'com':
+        offsets = np.arange(-w, w + 1)
+        idx = np.clip(c[:, np.newaxis] + offsets, 0, length - 1)
+        win = profiles[rows[:, np.newaxis], idx]
+        win = win - win.min(axis=1, keepdims=True)
+        total = win.sum(axis=1)
+        com = (win * idx).sum(axis=1) / np.where(total == 0, 1, total)
+        return np.where(total > 0, com, c).astype(float)
+
+    # keep the 3-point stencil inside the profile, peaks at the edge are not refined
+    c0 = np.clip(c, 1, length - 2)
+    y0, y1, y2 = (profiles[rows, c0 + k] for k in (-1, 0, 1))
+
+    if method == 'gaussian':
+        tiny = np.finfo(float).tiny
+        y0, y1, y2 = (np.log(np.maximum(y, tiny)) for y in (y0, y1, y2))
+    elif method != 'parabolic':
+        raise ValueError(f'Unknown method: {method!r}, choose from parabolic, gaussian, com')
+
+    denom = y0 - 2 * y1 + y2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(denom < 0, 0.5 * (y0 - y2) / denom, 0.0)
+
+    delta = np.clip(delta, -0.5, 0.5)
+    return np.where(c == c0, c + delta, c).astype(float)
+
+
+def _beam_projections(stack) -> (np.ndarray, np.ndarray):
+    """Return the projections of an image stack along Y and X, with shapes
+    (N, H) and (N, W)."""
+    if isinstance(stack, np.ndarray):
+        if stack.ndim == 2:
+            stack = stack[np.newaxis]
+        return stack.sum(axis=2, dtype=float), stack.sum(axis=1, dtype=float)
+
+    xx = np.array([img.sum(axis=1, dtype=float) for img in stack])
+    yy = np.array([img.sum(axis=0, dtype=float) for img in stack])
+    return xx, yy
+
+
+def find_beam_centers(stack, sigma: int = 30, method: str = 'parabolic') -> np.ndarray:
+    """Find the center of the primary beam for every image in `stack`.
+
+    Batched version of `find_beam_center`: the projections along X/Y of all
+    images are computed in one go and smoothed together, and the position of
+    the peak is refined analytically (see `refine_profile_peaks`) instead of
+    through dense interpolation.
+
+    stack: np.ndarray or list,
+        (N, H, W) array, or sequence of 2D images of the same shape
+    sigma: int,
+        standard deviation of the gaussian filter used to smooth the projections
+    method: str,
+        subpixel refinement method, `parabolic`, `gaussian`, or `com`
+
+    Returns:
+        (N, 2) array with the beam centers (row, column)
+    """
+    xx, yy = _beam_projections(stack)
+
+    if sigma:
+        xx = ndimage.gaussian_filter1d(xx, sigma, axis=1)
+        yy = ndimage.gaussian_filter1d(yy, sigma, axis=1)
+
+    cx = refine_profile_peaks(xx, method=method)
+    cy = refine_profile_peaks(yy, method=method)
+
+    return np.stack([cx, cy], axis=1)
+
+
+def find_beam_centers_with_beamstop(stack, z: int = 99, chunksize: int = 64) -> np.ndarray:
+    """Find the beam center for every image in `stack` when a beam stop is
+    present.
+
+    Batched version of the `thresh` method of `find_beam_center_with_beamstop`:
+    every image is segmented at its `z`-th percentile, and the center of the
+    bounding box of the largest blob defines the beam center. The images
+    are labeled together in chunks of `chunksize`, blobs are not connected
+    between images.
+
+    Returns:
+        (N, 2) array with the beam centers (row, column)
+    """
+    # connectivity within the image plane only
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndimage.generate_binary_structure(2, 1)
+
+    if isinstance(stack, np.ndarray) and stack.ndim == 2:
+        stack = stack[np.newaxis]
+
+    centers = []
+    for i in range(0, len(stack), chunksize):
+        chunk = np.asarray(stack[i : i + chunksize])
+        n = len(chunk)
+
+        thresh = np.percentile(chunk.reshape(n, -1), z, axis=1)
+        seg = chunk > thresh[:, np.newaxis, np.newaxis]
+        labeled, n_labels = ndimage.label(seg, structure=structure)
+
+        areas = np.bincount(labeled.ravel(), minlength=n_labels + 1)
+
+        # labels are numbered in raster order, so every frame has a contiguous range
+        last = labeled.reshape(n, -1).max(axis=1)
+        first = np.concatenate([[0], np.maximum.accumulate(last)[:-1]]) + 1
+
+        for frame, lo, hi in zip(labeled, first, last):
+            if hi < lo:
+                centers.append((np.nan, np.nan))
+                continue
+            label = lo + np.argmax(areas[lo : hi + 1])
+            rows, cols = np.nonzero(frame == label)
+            centers.append(
+                ((rows.min() + rows.max() + 1) / 2, (cols.min() + cols.max() + 1) / 2)
+            )
+
+    return np.array(centers, dtype=float).reshape(-1, 2)
+
+
 def find_beam_center_with_beamstop(
     img, z: int = None, method='thresh', plot=False
 ) -> (float, float):
@@ -7,6 +7,7 @@ from skimage import morphology
 from skimage.measure import find_contours
 
 from instamatic.formats import read_tiff
+from instamatic.processing.radial_integration import get_radial_integrator
 from instamatic.tools import find_beam_center_with_beamstop
 
 
@@ -89,16 +90,11 @@ def radial_average(z, center, as_radial_map=False):
     radial_profile : array
         Radial profile of the diffraction pattern.
     """
-    y, x = np.indices(z.shape)
-    r = np.sqrt((x - center[1]) ** 2 + (y - center[0]) ** 2)
-    r = r.astype(int)
-
-    tbin = np.bincount(r.ravel(), z.ravel())
-    nr = np.bincount(r.ravel())
-    averaged = tbin / nr
+    integrator = get_radial_integrator(z.shape, center)
+    averaged = integrator.integrate(z)
 
     if as_radial_map:
-        return averaged[r]
+        return integrator.radial_map(averaged)
     else:
         return averaged
 
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import pickle
+
+import numpy as np
+import pytest
+
+from instamatic.calibrate import (
+    AffineTransform,
+    CalibBeamShift,
+    CalibDirectBeam,
+    CalibStage,
+    compose,
+)
+from instamatic.calibrate.focus import DiffFocusOptimizer, beam_sharpness
+from instamatic.calibrate.incremental import IncrementalFit, fit_affine_linear, grid_positions
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def random_transform(rng):
+    return AffineTransform(rng.normal(size=(2, 2)) + 2 * np.eye(2), rng.normal(size=2) * 100)
+
+
+def test_affine_transform(rng):
+    a = random_transform(rng)
+    b = random_transform(rng)
+    coords = rng.uniform(0, 512, (50, 2))
+
+    np.testing.assert_allclose(a.inverse(a.forward(coords)), coords)
+    np.testing.assert_allclose(a.inverted().forward(coords), a.inverse(coords))
+    np.testing.assert_allclose(a.forward(coords[0]), a.forward(coords)[0])
+
+    ab = compose(a, b)
+    np.testing.assert_allclose(ab.forward(coords), b.forward(a.forward(coords)))
+    np.testing.assert_allclose(ab.matrix, a.matrix @ b.matrix)
+
+    shifted = a.shifted((10, 20))
+    np.testing.assert_allclose(shifted.forward(coords), a.forward(coords) + (10, 20))
+
+
+def test_calib_beamshift(rng):
+    r = rng.normal(size=(2, 2)) * 10
+    ref_shift = np.array([30000, 20000])
+    ref_pixel = np.array([256, 256])
+    c = CalibBeamShift(transform=r, reference_shift=ref_shift, reference_pixel=ref_pixel)
+
+    pixels = rng.uniform(0, 512, (20, 2))
+    expected = (ref_shift - np.dot(pixels - ref_pixel, r)).astype(int)
+    np.testing.assert_array_equal(c.pixelcoord_to_beamshift(pixels), expected)
+
+    shifts = rng.uniform(0, 60000, (20, 2))
+    expected = np.dot(ref_shift - shifts, np.linalg.inv(r)) + ref_pixel
+    np.testing.assert_allclose(c.beamshift_to_pixelcoord(shifts), expected)
+
+    # the cached transformation follows changes of the reference
+    c.reference_shift = ref_shift + 100
+    np.testing.assert_allclose(c.beamshift_to_pixelcoord(shifts + 100), expected)
+
+    assert '_affine_cache' not in pickle.loads(pickle.dumps(c)).__dict__
+
+
+def test_calib_directbeam(rng):
+    dct = {}
+    for key in ('BeamShift', 'DiffShift'):
+        dct[key] = {'r': rng.normal(size=(2, 2)) * 10, 't': rng.normal(size=2)}
+    c = CalibDirectBeam(dct)
+
+    beamshifts = rng.uniform(-1000, 1000, (20, 2))
+    pixelshift = c.beamshift2pixelshift(beamshifts)
+    expected = c.pixelshift2diffshift(pixelshift)
+    conversion = c.conversion('BeamShift', 'DiffShift')
+    np.testing.assert_allclose(conversion.forward(beamshifts), expected)
+
+    r, t = dct['DiffShift']['r'], dct['DiffShift']['t']
+    np.testing.assert_allclose(expected, np.dot(pixelshift, r) + t)
+
+
+def test_calib_stage(rng):
+    r = rng.normal(size=(2, 2)) * 100
+    t = rng.normal(size=2) * 1000
+    c = CalibStage(
+        r, camera_dimensions=(512, 512), translation=t, reference_position=(100, 200)
+    )
+
+    image_pos = (5000, -3000)
+    pixels = rng.uniform(0, 512, (20, 2))
+
+    stagepos = c.pixelcoord_to_stagepos(pixels, image_pos)
+    for px, pos in zip(pixels, stagepos):
+        expected = c._pixelcoord_to_stagepos(px, image_pos, r, t, c.reference_position)
+        np.testing.assert_allclose(pos, expected)
+
+    np.testing.assert_allclose(c.stagepos_to_pixelcoord(stagepos, image_pos), pixels)
+
+
+def test_grid_positions():
+    positions = grid_positions(5, 100)
+    assert positions.shape == (25, 2)
+    np.testing.assert_array_equal(positions[0], (0, 0))
+    assert {tuple(p) for p in positions} == {tuple(p) for p in grid_positions(5, 100, False)}
+
+    # the first points already span the grid
+    assert np.ptp(positions[:5], axis=0).tolist() == [400, 400]
+
+
+def test_fit_affine_linear(rng):
+    a = rng.uniform(-100, 100, (10, 2))
+    transform = random_transform(rng)
+    r, t = fit_affine_linear(a, transform.forward(a))
+    np.testing.assert_allclose(r, transform.r)
+    np.testing.assert_allclose(t, transform.t)
+
+
+def test_incremental_fit(rng):
+    transform = AffineTransform(rng.normal(size=(2, 2)) * 10)
+
+    def register(setting):
+        shift = transform.inverse(setting) + rng.normal(scale=0.05, size=2)
+        return shift, 1.0
+
+    positions = grid_positions(7, 1000)
+    with IncrementalFit(register, tolerance=0.5) as fit:
+        for offset in positions:
+            fit.submit(offset, offset)
+            if fit.converged:
+                break
+
+        shifts, settings = fit.finish()
+
+    assert fit.converged
+    assert len(shifts) < len(positions)
+    np.testing.assert_array_equal(settings, positions[: len(settings)])
+    assert fit.residual < 0.5
+    np.testing.assert_allclose(fit.r, transform.r, rtol=0.01, atol=0.1)
+
+
+class FakeDiffFocus:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value, confirm_mode=True):
+        self.value = value
+
+
+class FakeDiffraction:
+    """Primary beam that widens away from the focus `optimum`."""
+
+    def __init__(self, optimum, start, rng):
+        self.optimum = optimum
+        self.difffocus = FakeDiffFocus(start)
+        self.rng = rng
+        self.n_images = 0
+
+    def get_image(self, exposure=None, binsize=None, header_keys=None):
+        self.n_images += 1
+        sigma = 1.5 + abs(self.difffocus.value - self.optimum) / 20
+        i, j = np.mgrid[:256, :256]
+        beam = np.exp(-((i - 150) ** 2 + (j - 100) ** 2) / (2 * sigma**2)) / sigma**2
+        img = 10 + 5000 * beam + self.rng.normal(scale=1, size=beam.shape)
+        img[20, 30] = 1e5  # hot pixel
+        return img, {}
+
+
+def test_beam_sharpness(rng):
+    ctrl = FakeDiffraction(optimum=1000, start=1000, rng=rng)
+    focused = beam_sharpness(ctrl.get_image()[0])
+    ctrl.difffocus.set(1100)
+    assert beam_sharpness(ctrl.get_image()[0]) < focused
+
+
+def test_diff_focus_optimizer(rng):
+    ctrl = FakeDiffraction(optimum=21340, start=21200, rng=rng)
+    optimizer = DiffFocusOptimizer(ctrl, span=250, tolerance=2)
+
+    best = optimizer.optimize()
+    assert abs(best - 21340) <= 5
+    assert ctrl.difffocus.value == best
+    assert ctrl.n_images < 33
+
+    # the next search starts from the last optimum
+    ctrl.optimum = 21360
+    n_images = ctrl.n_images
+    best = optimizer.optimize()
+    assert abs(best - 21360) <= 5
+    assert ctrl.n_images - n_images < 15
+
+    # optimum outside of the search interval
+    ctrl.optimum = 21500
+    assert abs(optimizer.optimize() - 21500) <= 5
+
+
+def test_optimize_diffraction_focus_session(rng):
+    from instamatic.calibrate.calibrate_directbeam import optimize_diffraction_focus
+
+    ctrl = FakeDiffraction(optimum=21340, start=21200, rng=rng)
+    ctrl.diff_focus_optimizer = DiffFocusOptimizer(ctrl)
+
+    assert abs(optimize_diffraction_focus(ctrl) - 21340) <= 5
+
+    # the optimizer of the session starts from the last optimum
+    n_images = ctrl.n_images
+    assert abs(optimize_diffraction_focus(ctrl) - 21340) <= 5
+    assert ctrl.n_images - n_images < 15
+
+    # the step sizes of the former grid search are still accepted
+    assert abs(optimize_diffraction_focus(ctrl, steps=(50, 15, 5)) - 21340) <= 5
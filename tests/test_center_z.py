@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from instamatic.calibrate.center_z import find_eucentric_height, parallax_root
+
+
+class FakeStage:
+    def __init__(self):
+        self.z = 0.0
+        self.a = 0.0
+
+    def set(self, z=None, a=None):
+        if z is not None:
+            self.z = z
+        if a is not None:
+            self.a = a
+
+
+class FakeCtrl:
+    """Camera looking at a texture that moves with the parallax of the
+    stage height."""
+
+    def __init__(self, z_eucentric, pixelsize=10.0):
+        rng = np.random.default_rng(1)
+        self.texture = ndimage.gaussian_filter(rng.normal(size=(512, 512)), 2)
+        self.z_eucentric = z_eucentric
+        self.pixelsize = pixelsize
+        self.stage = FakeStage()
+        self.n_images = 0
+
+    def get_image(self, exposure=None, comment=None):
+        self.n_images += 1
+        parallax = (self.stage.z - self.z_eucentric) * np.sin(np.radians(self.stage.a))
+        img = ndimage.shift(self.texture, (parallax / self.pixelsize, 0), mode='wrap')
+        return img[128:384, 128:384], {}
+
+
+def test_parallax_root():
+    zs = [0, 1000, 2000]
+    shifts = [(10, -5), (5, -2.5), (0, 0)]
+    root, residual = parallax_root(zs, shifts)
+    assert root == pytest.approx(2000)
+    assert residual == pytest.approx(0, abs=1e-9)
+
+
+@pytest.mark.parametrize('offset', [-2500, 800, 4000])
+def test_find_eucentric_height(offset):
+    ctrl = FakeCtrl(z_eucentric=offset)
+    result = find_eucentric_height(ctrl, precision=100)
+
+    assert result.converged
+    assert result.images == ctrl.n_images <= 6
+    assert result.z == pytest.approx(offset, abs=100)
+    assert ctrl.stage.z == result.z
+    assert ctrl.stage.a == 0
+
+
+def test_find_eucentric_height_out_of_range():
+    ctrl = FakeCtrl(z_eucentric=20000)
+    result = find_eucentric_height(ctrl)
+
+    assert not result.converged
+    assert ctrl.stage.z == 0
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import time
+
 import numpy as np
 import pytest
 
@@ -81,6 +83,156 @@ def test_stage(ctrl):
         stage.set('rawr')
 
 
+def test_stage_adaptive_wait(ctrl):
+    import threading
+
+    stage = ctrl.stage
+    assert stage.adaptive_wait
+
+    d = ctrl.tem._stage_dict['x']
+    instant = d['speed']
+    d['speed'] = 1_000_000.0  # nm / s
+    try:
+        stage.x = 0
+        for x in (100_000, 0, 100_000):
+            stage.x = x
+            assert not stage.is_moving()
+            assert stage.x == x
+
+        stats = stage.timing_stats()['x']
+        assert stats['moves'] >= 3
+        assert stats['max'] >= 0.1
+        assert 0.1 * d['speed'] < stage.speeds['x'] <= d['speed']
+        assert stage.predict_move_time({'x': 100_000}) < 1.0
+
+        # a short move is not over before the status had time to report it
+        status_delay = stage.status_delay
+        stage.status_delay = 0.2
+        try:
+            t0 = time.perf_counter()
+            stage.x = 100_050
+            assert time.perf_counter() - t0 >= 0.2
+        finally:
+            stage.status_delay = status_delay
+
+        # status reports from a background poller replace the readouts, reports that
+        # were read before the move command and delivered after it are ignored
+        stop = threading.Event()
+
+        def poll():
+            while not stop.is_set():
+                t = time.perf_counter()
+                moving = ctrl.tem.isStageMoving()
+                stop.wait(0.01)
+                stage.notify_moving(moving, t=t)
+                stop.wait(0.01)
+
+        poller = threading.Thread(target=poll, daemon=True)
+        poller.start()
+        try:
+            stage.x = 0
+            assert stage.x == 0
+            stage.set(x=100_000, wait=False)
+            stage.wait()
+            assert stage.x == 100_000
+            for x in (0, 20_000, 0, 20_000, 0):
+                stage.x = x
+                assert not ctrl.tem.isStageMoving()
+        finally:
+            stop.set()
+            poller.join()
+    finally:
+        d['speed'] = instant
+
+
+def test_stage_move_time_overhead(ctrl):
+    from instamatic.microscope.components.stage import Stage
+
+    stage = Stage(ctrl.tem)
+    d = ctrl.tem._stage_dict['x']
+    instant = d['speed']
+    d['speed'] = 1_000_000.0  # nm / s
+    d['overhead'] = 0.1
+    try:
+        stage.x = 0
+        for x in (1000, 0, 1000):
+            stage.x = x
+
+        # short moves do not make the stage look slow for a long move
+        t0 = time.perf_counter()
+        stage.x = 301_000
+        assert time.perf_counter() - t0 < 1.0
+        assert stage.x == 301_000
+
+        assert 0.5 * d['speed'] < stage.speeds['x'] < 2 * d['speed']
+        assert 0.05 < stage.overheads['x'] < 0.2
+        assert stage.predict_move_time({'x': 300_000}) == pytest.approx(0.4, abs=0.1)
+    finally:
+        d['speed'] = instant
+        d['overhead'] = 0.0
+
+
+def test_stage_move_path(ctrl):
+    stage = ctrl.stage
+    stage.set(x=0, y=0, z=0)
+
+    log = stage.move_path([{'x': -1000, 'y': -1000, 'z': 500}, {'x': 0, 'y': None}])
+    assert len(log) == 2
+    assert log[1]['target'] == {'x': 0}
+    assert all(entry['settled'] for entry in log)
+    assert stage.get()[:3] == (0, -1000, 500)
+    assert stage.move_stats()['moves'] >= 2
+
+    t0 = time.perf_counter()
+    stage.set_xy_with_backlash_correction(x=2000, y=3000, z=0, settle_delay=0.3)
+    assert stage.get()[:3] == (2000, 3000, 0)
+    assert time.perf_counter() - t0 >= 0.6
+
+    # slow creep of the stage is not taken for a stable position
+    d = ctrl.tem._stage_dict['x']
+    speed = d['speed']
+    d['speed'] = 200.0  # nm / s
+    try:
+        stage.set(x=2100, wait=False)
+        assert not stage.wait_until_settled(axes='x', timeout=0.3)
+    finally:
+        d['speed'] = speed
+    stage.x = 2000
+    assert stage.wait_until_settled(axes='x')
+
+    a = stage.a
+    stage.eliminate_backlash_a(target_angle=a + 10.0, step=1.0, n_steps=2)
+    assert stage.a == a
+
+    future = stage.queue_path([{'x': 0}, {'y': 0}], settle_time=0)
+    assert len(future.result(timeout=10)) == 2
+    assert stage.xy == (0, 0)
+
+    # moves from the main thread wait for the queued move to finish
+    future = stage.queue_path([{'x': 1000}], settle_time=0)
+    stage.set(z=0)
+    assert len(future.result(timeout=10)) == 1
+    assert stage.get()[:3] == (1000, 0, 0)
+
+    pending = [stage.queue_path([{'x': x}], settle_time=0) for x in (0, 500)]
+    stage.close()
+    assert stage._move_queue is None
+    assert all(future.done() for future in pending)
+
+    # the axes of a waypoint are moved at the same time
+    speeds = {axis: ctrl.tem._stage_dict[axis]['speed'] for axis in 'xz'}
+    for axis in 'xz':
+        ctrl.tem._stage_dict[axis]['speed'] = 1_000_000.0  # nm / s
+    try:
+        (entry,) = stage.move_path([{'x': 200_000, 'z': 200_000}], settle_time=0)
+        assert (stage.x, stage.z) == (200_000, 200_000)
+        assert entry['move'] < 0.35
+    finally:
+        for axis in 'xz':
+            ctrl.tem._stage_dict[axis]['speed'] = speeds[axis]
+    stage.set(x=0, z=0)
+
+
 def test_deflectors(ctrl):
     for deflector in (
         ctrl.guntilt,
@@ -230,6 +382,45 @@ def test_align_to(ctrl):
     assert pos != ctrl.stage.xy
 
 
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_get_image_out(ctrl, asynchronous, tmp_path):
+    from instamatic.formats import read_metadata, read_tiff
+
+    out = tmp_path / 'image'
+    img, h = ctrl.get_image(out=out, comment='test', asynchronous=asynchronous)
+    ctrl.flush()
+
+    img2, h2 = read_tiff(out.with_suffix('.tiff'))
+    assert np.array_equal(img, img2)
+    assert h2['ImageComment'] == 'test'
+
+    df = read_metadata(tmp_path)
+    assert df['ImageComment'].tolist() == ['test']
+
+
+def test_get_image_compression(ctrl, tmp_path, monkeypatch):
+    import tifffile
+
+    from instamatic import config
+    from instamatic.formats import read_tiff
+
+    monkeypatch.setattr(config.settings, 'image_compression', 'zlib')
+    monkeypatch.setattr(config.settings, 'compression_level', 6)
+
+    out = tmp_path / 'image.tiff'
+    img, h = ctrl.get_image(out=out, asynchronous=False)
+
+    with tifffile.TiffFile(out) as tiff:
+        assert tiff.pages[0].compression == tifffile.COMPRESSION.ADOBE_DEFLATE
+    assert np.array_equal(read_tiff(out)[0], img)
+
+
+def test_diff_focus_optimizer(ctrl):
+    optimizer = ctrl.diff_focus_optimizer
+    assert optimizer.ctrl is ctrl
+    assert ctrl.diff_focus_optimizer is optimizer
+
+
 if __name__ == '__main__':
     test_ctrl()
 
@@ -4,6 +4,7 @@ import threading
 from pathlib import Path
 from unittest.mock import MagicMock
 
+import numpy as np
 import pytest
 
 from instamatic.experiments import RED, cRED, cRED_tvips
@@ -27,6 +28,35 @@ def test_serialED(ctrl):
     pytest.xfail('TODO')
 
 
+def test_serialED_process_image():
+    from instamatic.experiments.serialed.experiment import init_worker, process_image
+    from instamatic.processing.find_crystals import find_crystals_timepix
+
+    rng = np.random.default_rng(0)
+    img = np.full((256, 256), 200.0) + rng.normal(0, 8, (256, 256))
+    img[50:70, 60:80] = 60
+    img[150:175, 100:120] = 60
+    flatfield = np.ones_like(img)
+
+    h, crystals = process_image(
+        img, 2500, binsize=2, timepix=True, flatfield=flatfield, deadpixels=[]
+    )
+    assert h == {'DeadPixelCorrection': True, 'FlatfieldCorrection': True}
+
+    expected = find_crystals_timepix(img, 2500)
+    assert len(crystals) == len(expected)
+    for crystal, ref in zip(crystals, expected):
+        assert (crystal.x, crystal.y) == (ref.x * 2, ref.y * 2)
+
+    # the flatfield of the worker process is set once
+    init_worker(flatfield, [])
+    try:
+        assert process_image(img, 2500, binsize=2, timepix=True) == (h, crystals)
+    finally:
+        init_worker()
+    assert process_image(img, 2500, timepix=True)[0] == {}
+
+
 @pytest.mark.parametrize(
     ['exp_cls', 'init_kwargs', 'collect_kwargs', 'num_collections'],
     [
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from instamatic.processing.find_crystals import (
+    SEGMENTATION_PRESETS,
+    find_crystals_batch,
+    find_crystals_timepix,
+    segment_crystals,
+)
+
+
+def make_image(seed: int = 0, size: int = 256):
+    """Dark elliptical crystals on a bright, noisy background."""
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size), 200.0)
+    yy, xx = np.mgrid[:size, :size]
+
+    centers = []
+    for cy, cx in ((64, 64), (64, 190), (190, 64), (190, 190)):
+        cy, cx = cy + rng.uniform(-10, 10), cx + rng.uniform(-10, 10)
+        img[((yy - cy) / 10) ** 2 + ((xx - cx) / 12) ** 2 < 1] = 60
+        centers.append((cy, cx))
+
+    img = ndimage.gaussian_filter(img, 1) + rng.normal(0, 8, img.shape)
+    return img, np.array(centers)
+
+
+@pytest.mark.parametrize('preset', list(SEGMENTATION_PRESETS))
+def test_find_crystals(preset):
+    img, centers = make_image()
+
+    crystals = find_crystals_timepix(img, magnification=2500, preset=preset)
+    found = np.array([(crystal.x, crystal.y) for crystal in crystals])
+
+    # every crystal is found
+    dist = np.linalg.norm(found[:, np.newaxis] - centers, axis=2)
+    assert np.all(dist.min(axis=0) < 5)
+
+
+def test_segment_crystals_method():
+    img, _ = make_image()
+
+    with pytest.raises(ValueError):
+        segment_crystals(img, method='magic')
+
+    arr, seg = segment_crystals(img, r=75, offset=15, footprint=3, method='threshold')
+    assert np.array_equal(seg, arr)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_find_crystals_batch(processes):
+    images = [make_image(seed)[0] for seed in range(2)]
+
+    results = find_crystals_batch(
+        images, 2500, timepix=True, processes=processes, preset='fast'
+    )
+    expected = [find_crystals_timepix(img, 2500, preset='fast') for img in images]
+    assert results == expected
@@ -91,3 +91,152 @@ def test_read(format, write_func, with_header, raises, data, header, temp_data_f
         # Check if the header we want is in the header we read
         if not all(str(v) == str(h.get(k)) for k, v in header.items()):
             raise ValueError('Header mismatch')
+
+
+@pytest.mark.parametrize('index', [True, False])
+def test_tiff_stack(index, data, header, tmp_path):
+    out = tmp_path / 'stack.tiff'
+    stack = np.stack([data + i for i in range(5)])
+    headers = [dict(header, frame=i, shape=(64, 64)) for i in range(5)]
+
+    with formats.TiffStackWriter(out, index=index) as writer:
+        for img, h in zip(stack, headers):
+            writer.write(img, header=h)
+
+    assert formats.tiffstack.index_filename(out).exists() == index
+
+    with formats.TiffStackReader(out) as reader:
+        assert len(reader) == 5
+        img, h = reader[3]
+        assert np.array_equal(img, stack[3])
+        assert h['frame'] == 3
+        assert h['string'] == header['string']
+
+    imgs, hs = formats.read_tiff_stack(out)
+    assert np.array_equal(imgs, stack)
+    assert [h['frame'] for h in hs] == list(range(5))
+
+    # Individual pages are readable as regular instamatic tiff files
+    img, h = formats.read_tiff(out)
+    assert np.array_equal(img, stack[0])
+    assert h['value'] == header['value']
+
+
+def test_metadata_table(data, header, tmp_path):
+    fns = []
+    for i in range(3):
+        fn = tmp_path / f'image_{i:04d}.tiff'
+        h = dict(
+            header, StagePosition={'x': i * 10.0, 'y': -i * 10.0}, ImageResolution=(64, 64)
+        )
+        formats.write_tiff(fn, data, header=h)
+        if i < 2:
+            formats.append_metadata(fn, h)
+        fns.append(fn)
+
+    df = formats.read_metadata(tmp_path)
+    assert len(df) == 2
+    assert list(df['StagePosition.x']) == [0.0, 10.0]
+
+    # headers missing from the table are read from the images and added
+    df = formats.read_metadata(fns)
+    assert list(df.index) == [str(fn.absolute()) for fn in fns]
+    assert list(df['StagePosition.y']) == [0.0, -10.0, -20.0]
+    assert len(formats.read_metadata(tmp_path)) == 3
+
+
+@pytest.mark.parametrize('kind', ['glob', 'dir', 'list', 'tiffstack', 'h5', 'mrc'])
+def test_image_collection(kind, data, tmp_path):
+    stack = np.stack([data + i for i in range(6)]).astype(np.float32)
+
+    if kind == 'tiffstack':
+        source = tmp_path / 'stack.tiff'
+        formats.write_tiff_stack(source, stack)
+    elif kind == 'h5':
+        source = tmp_path / 'stack.h5'
+        formats.write_hdf5(source, stack)
+    elif kind == 'mrc':
+        import mrcfile
+
+        source = tmp_path / 'stack.mrc'
+        with mrcfile.new(source) as mrc:
+            mrc.set_data(stack)
+    else:
+        fns = [tmp_path / f'image_{i:04d}.tiff' for i in range(6)]
+        for fn, img in zip(fns, stack):
+            formats.write_tiff(fn, img)
+        source = {'glob': str(tmp_path / '*.tiff'), 'dir': tmp_path, 'list': fns}[kind]
+
+    images = formats.ImageCollection(source, cache_size=2, prefetch=2)
+    assert len(images) == 6
+    assert np.array_equal(images[4], stack[4])
+    assert np.array_equal(images[-1], stack[-1])
+    assert len(images._cache) <= 2
+
+    view = images[1::2]
+    assert len(view) == 3
+    assert np.array_equal(view.asarray(), stack[1::2])
+    assert view.shape == (3, 64, 64)
+
+    # views share the threads and cache, and do not close them
+    view.close()
+    assert images._executor is not None
+    assert np.array_equal(images[0], stack[0])
+
+    images.close()
+    assert view._executor is None
+    assert np.array_equal(view[2], stack[5])
+
+
+@pytest.mark.parametrize(
+    ['write_func', 'compression'],
+    [
+        (formats.write_tiff, 'zlib'),
+        (formats.write_tiff, 'lzma'),
+        (formats.write_hdf5, 'gzip'),
+        (formats.write_hdf5, 'lzf'),
+    ],
+)
+def test_write_compressed(write_func, compression, header, tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.poisson(0.1, size=(128, 128)).astype(np.uint16)
+    out = tmp_path / 'out.tiff'
+
+    write_func(out, data, header, compression=compression)
+
+    fn = next(tmp_path.iterdir())
+    img, h = formats.read_image(fn)
+    assert np.array_equal(img, data)
+    assert fn.stat().st_size < data.nbytes
+
+
+def test_tiff_stack_compressed(data, tmp_path):
+    out = tmp_path / 'stack.tiff'
+    stack = np.stack([data + i for i in range(3)])
+
+    formats.write_tiff_stack(out, stack, compression='zlib', level=6)
+
+    imgs, _ = formats.read_tiff_stack(out)
+    assert np.array_equal(imgs, stack)
+
+
+def test_unknown_compression(data, tmp_path):
+    with pytest.raises(ValueError):
+        formats.write_tiff(tmp_path / 'out.tiff', data, compression='invalid')
+
+
+def test_write_queue(data, header, tmp_path):
+    with formats.WriteQueue(maxsize=2, workers=2) as queue:
+        for i in range(5):
+            queue.submit(formats.write_tiff, tmp_path / f'{i}.tiff', data, header=header)
+        queue.flush()
+
+        assert len(list(tmp_path.glob('*.tiff'))) == 5
+        stats = queue.stats()
+        assert stats['written'] == 5
+        assert stats['bytes_written'] == 5 * data.nbytes
+
+        # errors in the workers are raised in the main thread
+        queue.submit(formats.write_tiff, tmp_path / 'missing' / 'x.tiff', data)
+        with pytest.raises(formats.WriteError):
+            queue.flush()
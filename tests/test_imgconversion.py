@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import numpy as np
+
+from instamatic.processing.ImgConversion import FrameTable, format_table
+
+
+def test_format_table():
+    index = np.array([1, 2, 10])
+    angles = np.array([-30.0, -29.7, -27.3])
+
+    s = format_table('FILE %05d.mrc    % 12.4f', index, angles)
+    expected = ''.join(f'FILE {i:05d}.mrc    {a: 12.4f}\n' for i, a in zip(index, angles))
+    assert s == expected
+
+    assert format_table('%d', np.array([], dtype=int)) == ''
+
+
+def test_frame_table():
+    headers = {
+        3: {'ImageGetTime': 3.0, 'ImageExposureTime': 0.1},
+        1: {'ImageGetTime': 1.0, 'ImageExposureTime': 0.1},
+        6: {'ImageExposureTime': 0.2},
+        2: {'ImageGetTime': 2.0, 'ImageExposureTime': 0.1},
+    }
+    frames = FrameTable.from_headers(headers)
+
+    assert len(frames) == 4
+    np.testing.assert_array_equal(frames.index, [1, 2, 3, 6])
+    np.testing.assert_array_equal(frames.timestamp, [1.0, 2.0, 3.0, np.nan])
+    np.testing.assert_array_equal(frames.exposure, [0.1, 0.1, 0.1, 0.2])
+    assert frames.beam_center.shape == (4, 2)
+
+    assert (frames.first, frames.last) == (1, 6)
+    np.testing.assert_array_equal(frames.complete, [1, 2, 3, 4, 5, 6])
+    np.testing.assert_array_equal(frames.observed, [1, 1, 1, 0, 0, 1])
+    np.testing.assert_array_equal(frames.missing, [4, 5])
+
+    np.testing.assert_allclose(frames.angles(10.0, -0.5), [9.5, 9.0, 8.5, 7.0])
+
+
+def test_get_beam_centers(monkeypatch):
+    from instamatic.processing import ImgConversion as module
+
+    conv = object.__new__(module.ImgConversion)
+    conv.data_shape = (64, 64)
+    conv.data = {i: np.zeros((64, 64)) for i in (1, 2, 3)}
+    conv.headers = {i: {} for i in conv.data}
+    conv.frames = module.FrameTable(list(conv.data))
+    conv.use_beamstop = True
+
+    found = np.array([[30.0, 31.0], [np.nan, np.nan], [32.0, 33.0]])
+    monkeypatch.setattr(module, 'find_beam_centers_with_beamstop', lambda *args, **kw: found)
+    median, std = conv.get_beam_centers()
+    np.testing.assert_allclose(median, [31.0, 32.0])
+    np.testing.assert_allclose(std, [1.0, 1.0])
+    assert conv.headers[2]['beam_center'] == (31.0, 32.0)
+
+    # without any beam found, the beam profile is used instead
+    nan = np.full((3, 2), np.nan)
+    monkeypatch.setattr(module, 'find_beam_centers_with_beamstop', lambda *args, **kw: nan)
+    monkeypatch.setattr(module, 'find_beam_centers', lambda *args, **kw: found[[0, 0, 2]])
+    median, std = conv.get_beam_centers()
+    np.testing.assert_allclose(median, [30.0, 31.0])
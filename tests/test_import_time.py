@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+import pytest
+
+# Modules that take a long time to import, and should only be loaded when needed
+HEAVY_MODULES = ('h5py', 'tifffile', 'pandas', 'matplotlib', 'skimage', 'lmfit')
+
+
+def get_imported_modules(module: str) -> set:
+    """Import `module` in a clean interpreter, and return the names of all
+    modules that were loaded."""
+    p = subprocess.run(
+        [sys.executable, '-c', f'import sys, {module}; print("\\n".join(sys.modules))'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(p.stdout.split())
+
+
+@pytest.mark.parametrize(
+    'module',
+    [
+        'instamatic.formats',
+        'instamatic.neural_network',
+        'instamatic.processing.flatfield',
+        'instamatic.processing.find_crystals',
+    ],
+)
+def test_lazy_imports(module):
+    modules = get_imported_modules(module)
+    assert module in modules
+
+    heavy = {name.split('.')[0] for name in modules} & set(HEAVY_MODULES)
+    assert not heavy, f'{module} imports {sorted(heavy)}'
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import numpy as np
+
+from instamatic import neural_network
+from instamatic.neural_network import neural_network as nn
+
+
+def test_conv_layer():
+    rng = np.random.default_rng(0)
+    weight = rng.random((3, 3, 4, 8))
+    offset = rng.random(8)
+
+    for in_layer in (rng.random((10, 12, 4)), rng.random((10, 12, 1)).repeat(4, axis=2)):
+        expected = np.zeros((8, 10, 8))
+        for n in range(8):
+            for p in range(10):
+                window = in_layer[n : n + 3, p : p + 3]
+                expected[n, p] = np.tensordot(window, weight, axes=3) + offset
+
+        assert np.allclose(nn.conv_layer(in_layer, weight, offset), expected)
+
+    small = rng.random((2, 10, 12, 1))
+    expected = [nn.conv_layer(im, weight[:, :, :1], offset) for im in small]
+    assert np.allclose(nn.conv_layer(small, weight[:, :, :1], offset), expected)
+
+
+def test_max_pooling():
+    arr = np.arange(5 * 6 * 2).reshape(5, 6, 2)
+    pooled = nn.max_pooling(arr)
+    assert pooled.shape == (2, 3, 2)
+    assert np.array_equal(pooled[1, 2], arr[3, 5])
+
+
+def test_predict_batch():
+    rng = np.random.default_rng(1)
+    images = rng.random((3, 150, 150, 1))
+
+    predictions = neural_network.predict(images, batch_size=2)
+    assert predictions.shape == (3,)
+
+    single = neural_network.predict(images[1])
+    assert isinstance(single, float)
+    assert np.isclose(single, predictions[1])
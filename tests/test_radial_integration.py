@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from instamatic.processing import radial_integration
+from instamatic.processing.radial_integration import RadialIntegrator, get_radial_integrator
+from instamatic.utils.beamstop import radial_average
+
+
+@pytest.fixture(scope='module')
+def image():
+    rng = np.random.default_rng(0)
+    return rng.random((64, 80))
+
+
+def test_radial_average(image):
+    center = (30.3, 41.7)
+
+    # reference implementation
+    y, x = np.indices(image.shape)
+    r = np.sqrt((x - center[1]) ** 2 + (y - center[0]) ** 2).astype(int)
+    expected = np.bincount(r.ravel(), image.ravel()) / np.bincount(r.ravel())
+
+    assert np.allclose(radial_average(image, center), expected)
+    assert np.allclose(radial_average(image, center, as_radial_map=True), expected[r])
+
+
+def test_integrate_stack(image, monkeypatch):
+    integrator = get_radial_integrator(image.shape, (32, 40))
+    assert get_radial_integrator(image.shape, (32.0, 40.0)) is integrator
+
+    stack = np.stack([image, image * 2, image * 3])
+    profiles = integrator.integrate(stack)
+    assert profiles.shape == (3, integrator.n_bins)
+    assert np.allclose(profiles, integrator.integrate(image) * np.array([[1], [2], [3]]))
+
+    # the stack is binned in chunks of frames
+    monkeypatch.setattr(radial_integration, 'CHUNK_PIXELS', 2 * image.size)
+    assert np.allclose(integrator.integrate(stack), profiles)
+
+    oversampled = RadialIntegrator(image.shape, (32, 40), oversample=2)
+    expected = [oversampled.integrate(frame) for frame in stack]
+    assert np.allclose(oversampled.integrate(stack), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('oversample', [1, 3])
+def test_mask_sectors(image, oversample):
+    ones = np.ones(image.shape)
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[:, :40] = True
+
+    integrator = RadialIntegrator(
+        image.shape, (32, 40), oversample=oversample, mask=mask, sectors=4
+    )
+    profile = integrator.integrate(ones)
+    assert profile.shape == (4, integrator.n_bins)
+
+    # the masked half of the image does not contribute to the sums
+    summed = integrator.integrate(ones, average=False)
+    assert summed.sum() == pytest.approx((~mask).sum())
+
+    valid = ~np.isnan(profile)
+    assert np.allclose(profile[valid], 1.0)
+
+    with pytest.raises(ValueError):
+        integrator.radial_map(profile)
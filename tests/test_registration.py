@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from instamatic.imreg import translation
+from instamatic.processing.registration import Registration, register_pairs
+
+
+@pytest.fixture(scope='module')
+def images():
+    rng = np.random.default_rng(0)
+    reference = ndimage.gaussian_filter(rng.random((128, 150)), 2)
+    shifts = rng.uniform(-10, 10, size=(5, 2))
+    spectrum = np.fft.fft2(reference)
+    moving = np.stack(
+        [np.fft.ifft2(ndimage.fourier_shift(spectrum, shift)).real for shift in shifts]
+    )
+    return reference, moving, shifts
+
+
+# the test images are shifted circularly, which the window does not handle as well
+@pytest.mark.parametrize(['window', 'atol'], [(None, 0.1), ('hann', 0.5)])
+def test_registration(images, window, atol):
+    reference, moving, shifts = images
+
+    reg = Registration(reference, upsample_factor=20, window=window)
+    found, confidence = reg.register_many(moving, batch_size=2)
+
+    # the shift registers the moving image with the reference
+    assert np.allclose(found, -shifts, atol=atol)
+    assert np.all(confidence > 0.1)
+
+    shift, confidence = reg.register(reference)
+    assert np.allclose(shift, 0)
+    assert confidence > 0.8
+
+    with pytest.raises(ValueError):
+        reg.register(reference[:100])
+
+
+def test_register_pairs(images):
+    reference, moving, shifts = images
+
+    found, _ = register_pairs(list(zip(moving, moving[::-1])))
+    expected = shifts - shifts[::-1]
+    assert np.allclose(found, expected, atol=0.15)
+
+
+def test_translation(images):
+    reference, moving, shifts = images
+    expected = np.round(-shifts).astype(int)
+
+    for img, shift in zip(moving, expected):
+        assert translation(reference, img) == shift.tolist()
+        assert translation(reference, img, limit_shift=True) == shift.tolist()
+
+    reg = Registration(reference, upsample_factor=20)
+    assert np.allclose(translation(reg, moving[0]), -shifts[0], atol=0.1)
+
+    shift, ir = translation(reg, moving[0], limit_shift=True, return_fft=True)
+    assert np.allclose(shift, -shifts[0], atol=0.1)
+    assert ir.shape == reference.shape
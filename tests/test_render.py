@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from instamatic.gui.render import FrameRenderer, histogram_percentile
+
+
+class FakeStream:
+    def __init__(self, dynamic_range=11800):
+        self.cam = SimpleNamespace(dynamic_range=dynamic_range)
+        self.lock = threading.Lock()
+        self.frame = None
+        self.frame_count = 0
+
+    def send_frame(self, frame):
+        with self.lock:
+            self.frame = frame
+            self.frame_count += 1
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 10000, size=(512, 512)).astype(np.uint16)
+
+
+def test_histogram_percentile(frame):
+    expected = np.percentile(frame, 99.5)
+    assert histogram_percentile(frame, 99.5, 11800) == pytest.approx(expected, abs=1)
+
+
+def test_render(frame):
+    renderer = FrameRenderer(FakeStream())
+
+    image = renderer.render(frame)
+    assert image.mode == 'L'
+    assert image.size == (512, 512)
+    assert np.asarray(image).max() == 255
+
+    # the lookup table is reused for a similar frame
+    lut = renderer._lut
+    renderer.render(frame + 1)
+    assert renderer._lut is lut
+
+    renderer.auto_contrast = False
+    renderer.display_range = 20000
+    assert np.asarray(renderer.render(frame)).max() < 255
+
+    renderer.display_size = (200, 200)
+    assert renderer.render(frame).size == (200, 200)
+
+    # floating point frames are scaled without a lookup table
+    image = renderer.render(frame.astype(float))
+    assert image.size == (200, 200)
+
+
+def test_render_worker(frame):
+    stream = FakeStream()
+    renderer = FrameRenderer(stream, interval=0.001)
+    renderer.start()
+    try:
+        for i in range(5):
+            stream.send_frame(frame + i)
+            time.sleep(0.02)
+
+        rendered = renderer.get()
+        assert rendered.number == 5
+        assert rendered.image.size == (512, 512)
+        assert renderer.get() is None
+
+        # frames that are not collected are skipped
+        assert renderer.skipped >= 3
+    finally:
+        renderer.stop()
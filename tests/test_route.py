@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+import pytest
+
+from instamatic import route
+from instamatic.route import (
+    move_costs,
+    nearest_neighbour_route,
+    optimize_route,
+    route_length,
+    route_report,
+    travel_costs,
+    two_opt,
+)
+
+
+def test_travel_costs_backlash():
+    coords = np.array([[0, 0], [1000, 0]])
+
+    costs = travel_costs(coords)
+    np.testing.assert_allclose(costs, [[0, 1000], [1000, 0]])
+
+    # moving towards -x needs an extra approach from below
+    costs = travel_costs(coords, backlash_step=100)
+    assert costs[0, 1] == pytest.approx(np.hypot(900, 100) + np.hypot(100, 100))
+    assert costs[1, 0] == pytest.approx(np.hypot(1100, 100) + np.hypot(100, 100))
+    assert costs[1, 0] > costs[0, 1]
+
+
+def test_travel_costs_z():
+    coords = np.array([[0, 0, 0], [0, 0, 500]])
+    costs = travel_costs(coords, z_weight=2.0)
+    np.testing.assert_allclose(costs, [[0, 1000], [1000, 0]])
+
+
+@pytest.mark.parametrize('backlash_step', (0, 20))
+def test_optimize_route_small(backlash_step):
+    """Compare to the optimal route found by brute force, 2-opt is a
+    heuristic, so allow a small margin."""
+    rng = np.random.default_rng(1)
+    coords = rng.uniform(0, 100, (7, 2))
+    costs = travel_costs(coords, backlash_step=backlash_step)
+
+    best = min(route_length(p, costs) for p in itertools.permutations(range(7)))
+
+    order = optimize_route(coords, backlash_step=backlash_step)
+    assert sorted(order) == list(range(7))
+    assert route_length(order, costs) <= 1.05 * best
+
+
+def test_two_opt_fixed_start():
+    rng = np.random.default_rng(2)
+    costs = travel_costs(rng.uniform(0, 100, (30, 2)))
+
+    initial = np.arange(30)
+    order = two_opt(initial, costs, fixed_start=True)
+
+    assert order[0] == 0
+    assert sorted(order) == list(range(30))
+    assert route_length(order, costs) < route_length(initial, costs)
+
+
+def test_optimize_route_line():
+    """Points on a line are visited in sequence from the start position."""
+    x = np.array([3, 0, 4, 1, 2]) * 1000.0
+    coords = np.stack([x, np.zeros_like(x)], axis=1)
+
+    order = optimize_route(coords, start=(-1000, 0))
+    np.testing.assert_array_equal(x[order], np.sort(x))
+
+    costs = travel_costs(coords)
+    assert list(nearest_neighbour_route(costs, start=1)) == [1, 3, 4, 0, 2]
+
+
+def test_route_report():
+    rng = np.random.default_rng(3)
+    coords = rng.uniform(0, 100_000, (100, 2))
+
+    order = optimize_route(coords, start=(0, 0))
+    report = route_report(coords, order, start=(0, 0), speed=1000)
+
+    assert report['positions'] == 100
+    assert report['distance_after'] < report['distance_before']
+    assert report['distance_saved'] == pytest.approx(
+        report['distance_before'] - report['distance_after']
+    )
+    assert report['time_saved'] == pytest.approx(report['distance_saved'] / 1000)
+
+
+@pytest.mark.parametrize('start', [None, (0, 0, 0)])
+def test_optimize_route_neighbours(start, monkeypatch):
+    """Large routes only consider nearby moves, and should be about as good
+    as the routes found with the full cost matrix."""
+    rng = np.random.default_rng(4)
+    coords = rng.uniform(0, 100_000, (300, 3))
+    coords[::7, 2] = np.nan
+
+    kwargs = {'start': start, 'backlash_step': 500, 'z_weight': 0.5}
+    dense = optimize_route(coords, **kwargs)
+
+    monkeypatch.setattr(route, 'DENSE_LIMIT', 100)
+    order = optimize_route(coords, **kwargs)
+    assert sorted(order) == list(range(300))
+
+    after = route_report(coords, order, **kwargs)['distance_after']
+    assert after <= 1.05 * route_report(coords, dense, **kwargs)['distance_after']
+
+    costs = travel_costs(coords, backlash_step=500, z_weight=0.5)
+    expected = costs[:-1, 1:].diagonal()
+    np.testing.assert_allclose(move_costs(coords[:-1], coords[1:], 500, 0.5), expected)
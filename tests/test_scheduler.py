@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from instamatic.gui.scheduler import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    JobScheduler,
+    is_cancelled,
+    report_progress,
+    requires,
+)
+
+
+@pytest.fixture
+def scheduler():
+    events = {name: threading.Event() for name in ('save', 'index', 'release')}
+    order = []
+
+    @requires('disk')
+    def save(controller, **kwargs):
+        events['save'].set()
+        # only finishes if the indexing job runs at the same time
+        assert events['index'].wait(2.0)
+        order.append('save')
+
+    @requires('indexing')
+    def index(controller, **kwargs):
+        events['index'].set()
+        assert events['save'].wait(2.0)
+        order.append('index')
+
+    @requires('microscope')
+    def move(controller, n, **kwargs):
+        order.append(('move', n))
+
+    @requires('microscope')
+    def long_job(controller, **kwargs):
+        for i in range(100):
+            if is_cancelled():
+                return
+            report_progress(i / 100, f'step {i}')
+            events['release'].wait(0.01)
+        order.append('long_job')
+
+    def experiment(controller, **kwargs):
+        order.append('experiment')
+
+    def broken(controller, **kwargs):
+        raise RuntimeError('broken')
+
+    jobs = {
+        'save': save,
+        'index': index,
+        'move': move,
+        'long_job': long_job,
+        'experiment': experiment,
+        'broken': broken,
+    }
+    scheduler = JobScheduler(controller=None, jobs=jobs)
+    scheduler.order = order
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_scheduler_concurrent(scheduler):
+    save = scheduler.submit('save')
+    index = scheduler.submit('index')
+    assert scheduler.wait(timeout=5.0)
+
+    assert save.status == index.status == DONE
+    assert sorted(scheduler.order) == ['index', 'save']
+    assert save.run_time > 0
+    assert len(scheduler.history) == 2
+
+
+def test_scheduler_order(scheduler):
+    records = [scheduler.submit('move', {'n': n}) for n in range(5)]
+    scheduler.submit('experiment')
+    scheduler.submit('move', {'n': 5})
+    assert scheduler.wait(timeout=5.0)
+
+    # jobs on the same resource run in the order they were submitted
+    expected = [('move', n) for n in range(5)] + ['experiment', ('move', 5)]
+    assert scheduler.order == expected
+    assert all(record.status == DONE for record in records)
+
+
+def test_scheduler_cancel(scheduler):
+    events = []
+    scheduler.subscribe(lambda record, event: events.append((record.name, event)))
+
+    long_job = scheduler.submit('long_job')
+    pending = scheduler.submit('move', {'n': 0})
+
+    while long_job.progress < 0.05:
+        time.sleep(0.01)
+
+    scheduler.cancel(pending)
+    assert pending.status == CANCELLED
+    scheduler.cancel(long_job)
+    assert long_job.wait(timeout=5.0)
+
+    assert long_job.status == CANCELLED
+    assert 0 < long_job.progress < 1
+    assert ('long_job', 'progress') in events
+    assert scheduler.order == []
+
+
+def test_scheduler_error(scheduler):
+    record = scheduler.submit('broken')
+    assert record.wait(timeout=5.0)
+    assert record.status == FAILED
+    assert isinstance(record.error, RuntimeError)
+
+    assert scheduler.submit('unknown') is None
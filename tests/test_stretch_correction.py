@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from instamatic.processing.stretch_correction import (
+    DistortionModel,
+    affine_transform_ellipse_to_circle,
+    apply_transform_to_image,
+    get_distortion_model,
+)
+
+
+@pytest.fixture
+def model():
+    return DistortionModel(azimuth=83.37, amplitude=2.43)
+
+
+@pytest.mark.parametrize('center', [None, (70.3, 60.7)])
+def test_apply(model, center):
+    rng = np.random.default_rng(0)
+    img = rng.random((150, 128))
+
+    tr_mat = affine_transform_ellipse_to_circle(np.radians(83.37), 2.43 / 200)
+    expected = apply_transform_to_image(img, tr_mat, center=center and np.array(center))
+
+    corrected = model.apply(img, center=center)
+    assert corrected.shape == img.shape
+    assert np.allclose(corrected, expected, atol=1e-4)
+
+    stack = np.stack([img, img * 2])
+    assert np.allclose(model.apply(stack, center=center), [corrected, corrected * 2])
+
+
+def test_correct_peaks(model):
+    img = np.zeros((128, 128))
+    img[20, 100] = 1
+    center = (64, 64)
+
+    corrected = model.apply(img, center=center)
+    peak = np.array(np.unravel_index(corrected.argmax(), corrected.shape))
+
+    assert np.allclose(model.correct_peaks([(20, 100)], center=center), peak, atol=1)
+
+
+def test_correction_tables(model):
+    shape = (64, 80)
+    center = np.array((30.5, 41.2))
+
+    # reference implementation
+    xi, yi = np.mgrid[0 : shape[0], 0 : shape[1]]
+    coords = np.stack([xi.flatten(), yi.flatten()], axis=1) - center
+    new = np.dot(coords, model.transform)
+    xcorr = (new[:, 0].reshape(shape) + center[0]) - xi
+    ycorr = (new[:, 1].reshape(shape) + center[1]) - yi
+
+    tables = model.correction_tables(shape, center=center)
+    assert np.allclose(tables, (xcorr, ycorr))
+
+
+def test_get_distortion_model():
+    assert get_distortion_model(10, 1) is get_distortion_model(10, 1)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+import pytest
+
+from instamatic.microscope.telemetry import RingBuffer, Telemetry
+
+
+def test_ring_buffer():
+    buf = RingBuffer(size=4, width=2)
+    assert len(buf) == 0
+    assert buf.latest() == (pytest.approx(np.nan, nan_ok=True), None)
+
+    for i in range(6):
+        buf.append(float(i), (i, -i))
+
+    assert len(buf) == 4
+    t, value = buf.latest()
+    assert t == 5.0
+    np.testing.assert_array_equal(value, [5, -5])
+
+    times, values = buf.get()
+    np.testing.assert_array_equal(times, [2, 3, 4, 5])
+    np.testing.assert_array_equal(values[:, 1], [-2, -3, -4, -5])
+
+    times, values = buf.get(since=3.0)
+    np.testing.assert_array_equal(times, [4, 5])
+
+
+def test_telemetry_sample():
+    counter = itertools.count()
+    channels = {
+        'counter': (lambda: next(counter), ('n',)),
+        'mode': (lambda: 'diff', None),
+        'broken': (lambda: 1 / 0, ('value',)),
+    }
+    telemetry = Telemetry(channels=channels, size=3)
+
+    received = []
+    telemetry.subscribe(lambda name, t, value: received.append((name, value)), ['mode'])
+
+    for _ in range(5):
+        telemetry.sample()
+
+    assert telemetry.n_samples == 5
+    assert telemetry.latest('counter')[1] == 4
+    assert telemetry.latest('mode')[1] == 'diff'
+    assert telemetry.latest('broken')[1] is None
+    assert received == [('mode', 'diff')] * 5
+
+    data = telemetry.to_numpy()
+    times, values = data['counter']
+    assert values.shape == (3, 1)
+    np.testing.assert_array_equal(values[:, 0], [2, 3, 4])
+    assert np.all(np.diff(times) >= 0)
+
+
+def test_telemetry_dataframe():
+    pytest.importorskip('pandas')
+
+    telemetry = Telemetry(channels={'beamshift': (lambda: (1, 2), ('x', 'y'))})
+    telemetry.sample()
+    telemetry.sample()
+
+    df = telemetry.to_dataframe('beamshift')
+    assert list(df.columns) == ['x', 'y']
+    assert len(df) == 2
+
+
+def test_telemetry_ctrl(ctrl):
+    telemetry = ctrl.start_telemetry(channels=['stage', 'stage_moving', 'mode'], interval=0.01)
+    try:
+        assert telemetry.is_running
+        assert telemetry.wait_for_sample(timeout=5.0)
+        assert telemetry.wait_for_sample(timeout=5.0)
+
+        t, pos = telemetry.latest('stage')
+        assert len(pos) == 5
+        assert telemetry.latest('stage_moving')[1] in (0, 1)
+        assert telemetry.latest('mode')[1] == ctrl.mode.get()
+    finally:
+        ctrl.stop_telemetry()
+
+    assert ctrl.telemetry is None
+    assert not telemetry.is_running
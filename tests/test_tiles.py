@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from pyserialem import Montage
+
+from instamatic.montage import InstamaticMontage
+from instamatic.tiles import TilePyramid, downsample
+
+
+@pytest.fixture
+def montage():
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 1000, (128, 128)).astype(np.uint16) for _ in range(12)]
+    m = InstamaticMontage(images=images, gridspec={'gridshape': (3, 4)}, overlap=0.1)
+    m.calculate_montage_coords()
+    m.stagecoords = m.coords[:, ::-1] * 50 + rng.normal(scale=20, size=m.coords.shape)
+    m.stagematrix = np.array([[0, 50], [50, 0]])
+    return m
+
+
+def test_downsample():
+    img = np.arange(30).reshape(5, 6)
+    binned = downsample(img)
+    assert binned.shape == (2, 3)
+    assert binned[0, 0] == round(np.mean([0, 1, 6, 7]))
+
+
+def test_tile_pyramid(montage, tmp_path):
+    pyramid = montage.to_pyramid(drc=tmp_path / 'pyramid')
+    assert pyramid.levels == 2
+    stitched = montage.stitch()
+
+    img, box = pyramid.render(level=0)
+    assert box == pyramid.box
+    np.testing.assert_array_equal(img, stitched)
+
+    # only the tiles in view are used
+    region = (100, 150, 200, 260)
+    img, box = pyramid.render(region, level=0)
+    np.testing.assert_array_equal(img, stitched[100:200, 150:260])
+
+    r0, c0, r1, c1 = region
+    expected = [
+        i
+        for i, (r, c) in enumerate(pyramid.coords)
+        if r < r1 and r + 128 > r0 and c < c1 and c + 128 > c0
+    ]
+    assert pyramid.visible(region).tolist() == expected
+
+    # the coarse level is made on demand, and stored on disk
+    img, box = pyramid.render(shape=(64, 64))
+    assert img.shape == tuple(np.ceil(np.array(stitched.shape) / 2).astype(int))
+    assert len(list((tmp_path / 'pyramid' / 'level_1').glob('*.npy'))) == len(montage.images)
+
+    # a new pyramid reads the stored tiles
+    drc = tmp_path / 'pyramid'
+    pyramid = TilePyramid([None] * 12, pyramid.coords, drc=drc, tile_shape=(128, 128))
+    assert pyramid.tile(3, level=1).shape == (64, 64)
+
+
+def test_coordinate_index(montage):
+    montage.stitch()
+
+    pixels = np.random.default_rng(1).uniform(0, 400, (20, 2))
+    stage = montage.pixel_to_stagecoords(pixels)
+    expected = [Montage.pixel_to_stagecoord(montage, px) for px in pixels]
+    np.testing.assert_array_equal(stage, expected)
+
+    expected = [Montage.stage_to_pixelcoord(montage, s) for s in stage]
+    np.testing.assert_array_equal(montage.stage_to_pixelcoords(stage), expected)
+
+    assert montage.pixel_to_stagecoords([]).shape == (0, 2)
+    assert montage.stage_to_pixelcoords(np.empty((0, 2))).shape == (0, 2)
+
+    index = montage.coordinate_index()
+    index.set_items(montage.stagecoords)
+    assert index.nearest_item(montage.stagecoords[5] + 10) == 5
+    assert index.nearest_item((1e6, 1e6), max_distance=100) == len(montage.stagecoords)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from instamatic import tools
+
+
+@pytest.fixture(scope='module')
+def beam_stack():
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[:128, :128]
+    centers = rng.uniform(40, 88, size=(8, 2))
+    stack = np.stack(
+        [1000 * np.exp(-((yy - cx) ** 2 + (xx - cy) ** 2) / (2 * 5**2)) for cx, cy in centers]
+    )
+    stack += rng.poisson(2, size=stack.shape)
+    return stack, centers
+
+
+@pytest.mark.parametrize('method', ['parabolic', 'gaussian', 'com'])
+def test_find_beam_centers(beam_stack, method):
+    stack, centers = beam_stack
+
+    found = tools.find_beam_centers(stack, sigma=5, method=method)
+    assert found.shape == centers.shape
+    assert np.allclose(found, centers, atol=0.2)
+
+    # list input and single image give the same result
+    assert np.allclose(tools.find_beam_centers(list(stack), sigma=5, method=method), found)
+    assert np.allclose(tools.find_beam_centers(stack[0], sigma=5, method=method), found[:1])
+
+
+def test_find_beam_centers_with_beamstop(beam_stack):
+    stack, _ = beam_stack
+
+    expected = [tools.find_beam_center_with_beamstop(img, z=99) for img in stack]
+    found = tools.find_beam_centers_with_beamstop(stack, z=99, chunksize=3)
+    assert np.allclose(found, expected)
+
+
+def test_refine_profile_peaks():
+    x = np.arange(50)
+    profiles = np.exp(-((x - np.array([[10.3], [24.75], [0.0]])) ** 2) / 8)
+
+    assert np.allclose(
+        tools.refine_profile_peaks(profiles, method='gaussian'), [10.3, 24.75, 0.0]
+    )
+    parabolic = tools.refine_profile_peaks(profiles, method='parabolic')
+    assert np.allclose(parabolic, [10.3, 24.75, 0.0], atol=0.05)
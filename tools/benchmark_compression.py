@@ -0,0 +1,95 @@
+"""Benchmark write throughput versus compression ratio for the TIFF and HDF5
+writers on synthetic diffraction frames.
+
+Usage:
+    python tools/benchmark_compression.py [--frames 50] [--size 512] [--counts 0.05]
+
+Codecs that are not available (missing `imagecodecs` or `hdf5plugin`)
+are skipped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from instamatic.formats import write_hdf5, write_tiff
+
+CASES = (
+    (write_tiff, '.tiff', None),
+    (write_tiff, '.tiff', 'zlib'),
+    (write_tiff, '.tiff', 'zstd'),
+    (write_tiff, '.tiff', 'lz4'),
+    (write_hdf5, '.h5', None),
+    (write_hdf5, '.h5', 'gzip'),
+    (write_hdf5, '.h5', 'lzf'),
+    (write_hdf5, '.h5', 'zstd'),
+    (write_hdf5, '.h5', 'bitshuffle'),
+)
+
+
+def make_frames(n: int, size: int, counts: float, seed: int = 0) -> np.ndarray:
+    """Generate sparse diffraction-like frames: a weak Poisson background
+    with a direct beam and a few hundred Bragg peaks."""
+    rng = np.random.default_rng(seed)
+    frames = rng.poisson(counts, size=(n, size, size)).astype(np.uint16)
+
+    c = size // 2
+    frames[:, c - 2 : c + 3, c - 2 : c + 3] += 5000
+    for frame in frames:
+        peaks = rng.integers(0, size, size=(300, 2))
+        frame[peaks[:, 0], peaks[:, 1]] += rng.integers(10, 1000, size=300).astype(np.uint16)
+
+    return frames
+
+
+def benchmark(frames: np.ndarray, drc: Path) -> list:
+    results = []
+    for write_func, ext, compression in CASES:
+        out = drc / (compression or 'raw')
+        out.mkdir(exist_ok=True)
+
+        try:
+            t0 = time.perf_counter()
+            for i, frame in enumerate(frames):
+                write_func(out / f'{i:05d}{ext}', frame, compression=compression)
+            dt = time.perf_counter() - t0
+        except ImportError as e:
+            print(f'Skipping {ext} {compression}: {e}')
+            continue
+
+        size = sum(fn.stat().st_size for fn in out.iterdir())
+        ratio = frames.nbytes / size
+        results.append((ext, compression or '-', ratio, frames.nbytes / dt / 1e6))
+
+        for fn in out.iterdir():
+            fn.unlink()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=50, help='Number of frames to write')
+    parser.add_argument('--size', type=int, default=512, help='Frame dimensions (pixels)')
+    parser.add_argument(
+        '--counts', type=float, default=0.05, help='Mean background counts per pixel'
+    )
+    options = parser.parse_args()
+
+    frames = make_frames(options.frames, options.size, options.counts)
+
+    with tempfile.TemporaryDirectory() as drc:
+        results = benchmark(frames, Path(drc))
+
+    print(f'\n{"format":8s} {"codec":12s} {"ratio":>8s} {"MB/s":>10s}')
+    for ext, compression, ratio, throughput in results:
+        print(f'{ext:8s} {compression:12s} {ratio:8.1f} {throughput:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark the eucentric height search on a simulated microscope.
+
+The simulated camera images a random texture, shifted by the parallax of
+the sample at the current stage height and tilt. For a range of offsets
+from the eucentric height, the number of acquired images and the error
+of `find_eucentric_height` are reported.
+
+Usage:
+    python tools/benchmark_eucentric.py [--offsets 500 2000 5000 -8000] [--noise 0.1]
+"""
+
+from __future__ import annotations
+
+import argparse
+
+import numpy as np
+from scipy import ndimage
+
+from instamatic.calibrate.center_z import find_eucentric_height
+
+# number of images taken by the previous routine (10 heights, 2 tilts each)
+BRUTE_FORCE_IMAGES = 20
+
+
+class SimulatedStage:
+    def __init__(self, z: float = 0.0, a: float = 0.0):
+        self.z = z
+        self.a = a
+
+    def set(self, z: float = None, a: float = None, **kwargs):
+        if z is not None:
+            self.z = z
+        if a is not None:
+            self.a = a
+
+
+class SimulatedParallax:
+    """Stand-in for the `TEMController` with a stage and a camera.
+
+    The tilt axis is along the image columns, a sample at height `h` above
+    the eucentric height moves by `h * sin(a)` (nm) along the rows when
+    tilted to angle `a`.
+    """
+
+    def __init__(
+        self,
+        z_eucentric: float,
+        pixelsize: float = 10.0,
+        shape: tuple = (256, 256),
+        noise: float = 0.0,
+        seed: int = 0,
+    ):
+        self.rng = np.random.default_rng(seed)
+        # the camera sees the center of a larger sample
+        self.shape = shape
+        size = [2 * n for n in shape]
+        self.texture = ndimage.gaussian_filter(self.rng.normal(size=size), 3)
+        self.z_eucentric = z_eucentric
+        self.pixelsize = pixelsize
+        self.noise = noise
+        self.stage = SimulatedStage()
+        self.n_images = 0
+
+    def get_image(self, exposure: float = None, **kwargs):
+        self.n_images += 1
+        a = np.radians(self.stage.a)
+        parallax = (self.stage.z - self.z_eucentric) * np.sin(a) / self.pixelsize
+        img = ndimage.shift(self.texture, (parallax, 0), mode='constant')
+        (h, w), (dh, dw) = self.texture.shape, self.shape
+        img = img[(h - dh) // 2 : (h + dh) // 2, (w - dw) // 2 : (w + dw) // 2]
+        if self.noise:
+            img = img + self.rng.normal(scale=self.noise * img.std(), size=img.shape)
+        return img, {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--offsets',
+        type=float,
+        nargs='+',
+        default=(500, 2000, -3000, 5000, -8000),
+        help='Distance (nm) of the starting height from the eucentric height',
+    )
+    parser.add_argument('--noise', type=float, default=0.1, help='Relative noise level')
+    parser.add_argument('--precision', type=float, default=250, help='Target precision (nm)')
+    options = parser.parse_args()
+
+    print(f'Previous routine: {BRUTE_FORCE_IMAGES} images per search')
+    print(f'{"offset (nm)":>12} {"images":>7} {"error (nm)":>11} {"converged":>10}')
+
+    for offset in options.offsets:
+        sim = SimulatedParallax(z_eucentric=offset, noise=options.noise)
+        result = find_eucentric_height(sim, precision=options.precision)
+        error = result.z - offset
+        print(f'{offset:12.0f} {sim.n_images:7d} {error:11.1f} {str(result.converged):>10}')
+
+
+if __name__ == '__main__':
+    main()